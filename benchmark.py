@@ -0,0 +1,251 @@
+"""
+Benchmark dos simuladores do laboratório, sem passar pelas páginas do Streamlit.
+
+Para cada tamanho de fila, gera uma demanda sintética com semente fixa via
+``gerar_demanda_simulada`` e mede, separadamente, a parametrização, o despacho
+e o pós-processamento de ``param_capacidade.calcular_parametros_completos`` e
+de ``param_prazos.simular_prazos_propostas``, além do pico de memória. Cada
+caso roda em um processo novo, para que o pico de memória de um caso não
+contamine o seguinte.
+
+Uso:
+    python benchmark.py                                  # 500, 5.000 e 50.000 ensaios
+    python benchmark.py --tamanhos 500 5000 --saida base.json
+    python benchmark.py --comparar base.json             # acusa regressões em relação à base
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+TAMANHOS_PADRAO = [500, 5000, 50000]
+SEMENTE_PADRAO = 42
+# Ensaios liberados por dia na demanda sintética; com a capacidade atual do
+# laboratório a fila fica estável, então o prazo cresce com o tamanho da fila.
+ENSAIOS_POR_DIA = 20
+# Propostas do benchmark de prazos: (dias até a chegada, [(ensaio, tipo de amostra, quantidade)]).
+PROPOSTAS_BENCHMARK = [
+    (0, [("CIUsat", "Indeformada", 6), ("CIDsat", "Deformada", 4)]),
+    (7, [("CIUsat", "Deformada", 5), ("BE", "Indeformada", 3)]),
+]
+ETAPAS = ['parametrizacao', 'despacho', 'pos_processamento', 'total']
+# Uma etapa regride se ficar mais lenta que a base além da tolerância
+# relativa e de uma folga absoluta (s), que absorve o ruído de tempos curtos.
+TOLERANCIA_REGRESSAO = 0.20
+FOLGA_REGRESSAO_S = 0.05
+
+
+# =========================================================================
+#                   CASOS DO BENCHMARK
+# =========================================================================
+def _pico_memoria_mb():
+    """Pico de memória residente do processo (MB), ou None fora de sistemas POSIX."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em bytes no macOS e em kilobytes no Linux.
+    return pico / 2**20 if sys.platform == 'darwin' else pico / 2**10
+
+
+def _demanda(num_ensaios, semente):
+    from param_capacidade import gerar_demanda_simulada
+    prazo_dias = max(1, num_ensaios // ENSAIOS_POR_DIA)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return gerar_demanda_simulada(num_ensaios, prazo_dias, semente), prazo_dias
+
+
+def _caso_capacidade(num_ensaios, semente, repeticoes):
+    """Uma iteração de dimensionamento: uma simulação da configuração atual e a análise de gargalo."""
+    from param_capacidade import calcular_parametros_completos
+    df, prazo_dias = _demanda(num_ensaios, semente)
+    melhores = None
+    for _ in range(repeticoes):
+        tempos = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            resultado = calcular_parametros_completos(df.copy(), prazo_dias, 0.05, 1, [], estrategia='incremental', tempos=tempos)
+        melhores = tempos if melhores is None else {etapa: min(melhores[etapa], tempos[etapa]) for etapa in ETAPAS}
+    # O makespan permite conferir que a base e a execução simularam a mesma coisa.
+    return melhores, {'makespan_horas': float(resultado[3])}
+
+
+def _caso_prazos(num_ensaios, semente, repeticoes):
+    """Fila real sintética com todas as combinações das propostas de ``PROPOSTAS_BENCHMARK``."""
+    # Cache de parâmetros só em memória: um arquivo deixado por outra execução
+    # tornaria a parametrização incomparável com a da base.
+    os.environ['PRAZOS_CACHE_PARAMETROS'] = ''
+    from param_prazos import simular_prazos_propostas
+    df_real, _ = _demanda(num_ensaios, semente)
+    df_real['Origem'] = 'Planejamento (Drive)'
+    propostas, linhas = [], []
+    for k, (dias_ate_chegada, ensaios) in enumerate(PROPOSTAS_BENCHMARK):
+        nome = f"Proposta_{k + 1}"
+        propostas.append({
+            'nome_proposta': nome,
+            'data_chegada': date.today() + timedelta(days=dias_ate_chegada),
+            'ensaios': [{'ensaio': e, 'tipo_amostra': t, 'quantidade': q} for e, t, q in ensaios],
+        })
+        for ensaio, tipo_amostra, quantidade in ensaios:
+            linhas.extend([{
+                'Campanha': nome, 'Ensaio': ensaio, 'Tipo Amostra': tipo_amostra,
+                'ID Ensaio/CP': f"Manual_{nome}", 'Origem': 'Manual',
+            }] * quantidade)
+    df_combinado = pd.concat([df_real, pd.DataFrame(linhas)], ignore_index=True)
+    melhores = None
+    for _ in range(repeticoes):
+        tempos = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            prazos_gerais, _, _ = simular_prazos_propostas(df_combinado, propostas, modo='exaustivo', tempos=tempos)
+        melhores = tempos if melhores is None else {etapa: min(melhores[etapa], tempos[etapa]) for etapa in ETAPAS}
+    return melhores, {'prazos_dias_uteis': {nome: float(prazo) for nome, prazo in prazos_gerais.items()}}
+
+
+CASOS = {
+    'capacidade': _caso_capacidade,
+    'prazos': _caso_prazos,
+}
+
+
+def _executar_caso(simulador, num_ensaios, semente, repeticoes):
+    tempos, verificacao = CASOS[simulador](num_ensaios, semente, repeticoes)
+    return {
+        'simulador': simulador,
+        'num_ensaios': num_ensaios,
+        'tempos_s': tempos,
+        'pico_memoria_mb': _pico_memoria_mb(),
+        'verificacao': verificacao,
+    }
+
+
+def executar_benchmark(tamanhos=TAMANHOS_PADRAO, simuladores=tuple(CASOS), semente=SEMENTE_PADRAO, repeticoes=1,
+                       ao_concluir=None):
+    """
+    Executa cada (simulador, tamanho) em um processo próprio.
+
+    Com ``repeticoes`` > 1, cada etapa fica com o menor tempo entre as
+    repetições. ``ao_concluir(resultado)`` é chamada a cada caso terminado.
+
+    Returns:
+        dict: {'metadados': ..., 'resultados': [um dicionário por caso]}.
+    """
+    resultados = []
+    contexto = multiprocessing.get_context('spawn')
+    for num_ensaios in tamanhos:
+        for simulador in simuladores:
+            with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+                resultado = pool.submit(_executar_caso, simulador, num_ensaios, semente, repeticoes).result()
+            resultados.append(resultado)
+            if ao_concluir:
+                ao_concluir(resultado)
+    return {'metadados': _metadados(semente, repeticoes), 'resultados': resultados}
+
+
+def _metadados(semente, repeticoes):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'plataforma': platform.platform(),
+        'semente': semente,
+        'repeticoes': repeticoes,
+        'ensaios_por_dia': ENSAIOS_POR_DIA,
+    }
+
+
+# =========================================================================
+#                   RELATÓRIO E COMPARAÇÃO COM A BASE
+# =========================================================================
+def formatar_resultado(resultado):
+    tempos = resultado['tempos_s']
+    memoria = resultado['pico_memoria_mb']
+    return (f"{resultado['simulador']:<11} {resultado['num_ensaios']:>7} ensaios | "
+            + " | ".join(f"{etapa} {tempos[etapa]:8.3f}s" for etapa in ETAPAS)
+            + (f" | memória {memoria:8.1f} MB" if memoria is not None else ""))
+
+
+def comparar_com_base(atual, base, tolerancia=TOLERANCIA_REGRESSAO):
+    """
+    Compara dois resultados de ``executar_benchmark`` caso a caso.
+
+    Returns:
+        tuple: (linhas do relatório, lista de regressões encontradas).
+    """
+    por_caso = {(r['simulador'], r['num_ensaios']): r for r in base['resultados']}
+    linhas, regressoes = [], []
+    for resultado in atual['resultados']:
+        caso = (resultado['simulador'], resultado['num_ensaios'])
+        referencia = por_caso.get(caso)
+        if referencia is None:
+            linhas.append(f"{caso[0]:<11} {caso[1]:>7} ensaios | sem base para comparar")
+            continue
+        partes = []
+        for etapa in ETAPAS:
+            novo, antigo = resultado['tempos_s'][etapa], referencia['tempos_s'][etapa]
+            razao = novo / antigo if antigo > 0 else float('inf')
+            partes.append(f"{etapa} {razao:5.2f}x")
+            if novo > antigo * (1 + tolerancia) and novo - antigo > FOLGA_REGRESSAO_S:
+                regressoes.append(f"{caso[0]} {caso[1]}: {etapa} {antigo:.3f}s -> {novo:.3f}s")
+        memoria, memoria_base = resultado['pico_memoria_mb'], referencia['pico_memoria_mb']
+        if memoria is not None and memoria_base:
+            partes.append(f"memória {memoria / memoria_base:5.2f}x")
+            if memoria > memoria_base * (1 + tolerancia):
+                regressoes.append(f"{caso[0]} {caso[1]}: memória {memoria_base:.1f} MB -> {memoria:.1f} MB")
+        if resultado['verificacao'] != referencia['verificacao']:
+            partes.append("RESULTADO DIFERENTE DA BASE")
+            regressoes.append(f"{caso[0]} {caso[1]}: resultado diferente da base ({referencia['verificacao']} -> {resultado['verificacao']})")
+        linhas.append(f"{caso[0]:<11} {caso[1]:>7} ensaios | " + " | ".join(partes))
+    return linhas, regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dos simuladores de capacidade e de prazos do laboratório.")
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=TAMANHOS_PADRAO, help="Números de ensaios das filas sintéticas.")
+    parser.add_argument('--simuladores', nargs='+', choices=sorted(CASOS), default=list(CASOS))
+    parser.add_argument('--semente', type=int, default=SEMENTE_PADRAO)
+    parser.add_argument('--repeticoes', type=int, default=1, help="Repetições por caso; vale o menor tempo de cada etapa.")
+    parser.add_argument('--saida', help="Arquivo JSON onde gravar os resultados (a base para comparações futuras).")
+    parser.add_argument('--comparar', help="Arquivo JSON de uma execução anterior, usado como base.")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_REGRESSAO, help="Aumento relativo tolerado antes de acusar regressão.")
+    args = parser.parse_args(argv)
+
+    resultado = executar_benchmark(args.tamanhos, args.simuladores, args.semente, args.repeticoes,
+                                   ao_concluir=lambda r: print(formatar_resultado(r), flush=True))
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+        print(f"Resultados gravados em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            base = json.load(arquivo)
+        linhas, regressoes = comparar_com_base(resultado, base, args.tolerancia)
+        print(f"\nComparação com {args.comparar} (razão atual / base):")
+        print("\n".join(linhas))
+        if regressoes:
+            print("\nRegressões:")
+            print("\n".join(regressoes))
+            return 1
+        print("\nNenhuma regressão acima da tolerância.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Clientes autenticados do Google compartilhados por todo o processo.
+
+As credenciais da conta de serviço são criadas uma vez por (conta, escopos) e
+o token é renovado antes de expirar, em vez de uma troca de token a cada
+chamada. Cada conta tem uma ``AuthorizedSession`` com um pool de conexões
+HTTPS reaproveitado por todas as chamadas ao Google (Drive e Sheets),
+inclusive de threads diferentes.
+
+Dentro do Streamlit, o registro fica no ``st.cache_resource``; fora dele
+(scripts, testes), é um objeto único do módulo.
+"""
+
+import threading
+from datetime import datetime, timedelta, timezone
+
+import requests
+import streamlit as st
+from streamlit import runtime
+from google.auth.transport.requests import AuthorizedSession, Request
+from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
+
+# O token é renovado quando faltar menos que isto para ele expirar.
+MARGEM_RENOVACAO = timedelta(minutes=5)
+# Conexões guardadas por host no pool de cada sessão (uma por download paralelo).
+CONEXOES_POR_HOST = 8
+
+
+def _com_pool(sessao):
+    sessao.mount("https://", HTTPAdapter(pool_connections=CONEXOES_POR_HOST, pool_maxsize=CONEXOES_POR_HOST))
+    return sessao
+
+
+class RegistroClientes:
+    """Sessões autenticadas por (conta de serviço, escopos), criadas sob demanda."""
+
+    def __init__(self):
+        # Protege só o dicionário de sessões; cada sessão tem a sua trava para
+        # a renovação do token.
+        self._trava = threading.Lock()
+        self._sessoes = {}
+        # Sessão das requisições de token, também com conexões reaproveitadas.
+        self._requisicao_token = Request(_com_pool(requests.Session()))
+
+    def sessao(self, info, scopes):
+        """``AuthorizedSession`` da conta de serviço ``info`` com os ``scopes``, com token válido."""
+        chave = (info.get("client_email"), info.get("private_key_id"), tuple(sorted(scopes)))
+        with self._trava:
+            registro = self._sessoes.get(chave)
+            if registro is None:
+                credenciais = Credentials.from_service_account_info(dict(info), scopes=list(scopes))
+                sessao = _com_pool(AuthorizedSession(credenciais, auth_request=self._requisicao_token))
+                registro = self._sessoes[chave] = (sessao, threading.Lock())
+        sessao, trava_sessao = registro
+        # A renovação é uma chamada de rede: só espera por ela quem usa a mesma
+        # sessão, e uma única thread renova o token.
+        with trava_sessao:
+            self._renovar_se_preciso(sessao.credentials)
+        return sessao
+
+    def _renovar_se_preciso(self, credenciais):
+        # ``expiry`` é um datetime UTC sem fuso, como no google-auth.
+        agora = datetime.now(timezone.utc).replace(tzinfo=None)
+        if credenciais.token is None or credenciais.expiry is None or credenciais.expiry - agora < MARGEM_RENOVACAO:
+            credenciais.refresh(self._requisicao_token)
+
+    def limpar(self):
+        """Fecha as sessões; as próximas chamadas criam credenciais e conexões novas."""
+        with self._trava:
+            for sessao, _ in self._sessoes.values():
+                sessao.close()
+            self._sessoes.clear()
+
+
+_REGISTRO_PROCESSO = RegistroClientes()
+
+
+@st.cache_resource(show_spinner=False)
+def _registro_streamlit():
+    return RegistroClientes()
+
+
+def registro_clientes():
+    """Registro de clientes do processo: o do ``st.cache_resource`` no Streamlit, o do módulo fora dele."""
+    return _registro_streamlit() if runtime.exists() else _REGISTRO_PROCESSO
+
+
+def sessao_google(info, scopes):
+    """Atalho para ``registro_clientes().sessao(info, scopes)``."""
+    return registro_clientes().sessao(info, scopes)
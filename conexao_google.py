@@ -1,7 +1,7 @@
 """Conexao do Streamlit Cloud com as planilhas do Google.
 
-As tres planilhas de entrada sao exportadas temporariamente como XLSX no
-servidor do Streamlit. Isso permite reaproveitar toda a validacao existente em
+As tres planilhas de entrada sao exportadas como XLSX para uma pasta no
+servidor do Streamlit, mantida como copia local (ver ``snapshots_drive``). Isso permite reaproveitar toda a validacao existente em
 ``dados_ferias_cto.py`` sem depender de arquivos presentes no computador do usuario.
 
 Os resultados sao gravados diretamente nas abas da planilha Google configurada
@@ -12,7 +12,10 @@ from __future__ import annotations
 
 import json
 import math
-import tempfile
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime
 from pathlib import Path
 from urllib.parse import quote
@@ -20,8 +23,9 @@ from zoneinfo import ZoneInfo
 
 import pandas as pd
 import streamlit as st
-from google.auth.transport.requests import AuthorizedSession
-from google.oauth2.service_account import Credentials
+
+from clientes_google import sessao_google
+from snapshots_drive import concluir_pasta, criar_pasta, ler_pasta, revisao_arquivo
 
 
 SCOPES = [
@@ -36,6 +40,21 @@ NOME_ALOCACAO = "Alocação Atualizada.xlsx"
 NOME_FERIAS = "Controle de Férias LAB_CTO.xlsx"
 NOME_FLEXIBILIDADE = "Flexibilidade Operacional CTO.xlsx"
 
+# Chave no bloco [planilhas] dos Secrets e nome do arquivo de cada entrada.
+ARQUIVOS_ENTRADA = {
+    "alocacao": NOME_ALOCACAO,
+    "controle_ferias": NOME_FERIAS,
+    "flexibilidade_operacional": NOME_FLEXIBILIDADE,
+}
+# Nome da copia local das entradas (ver snapshots_drive).
+SNAPSHOT_PLANILHAS = "planilhas_cto"
+# Depois deste intervalo (s), as revisoes das entradas no Drive sao conferidas
+# de novo, em segundo plano.
+INTERVALO_REVALIDACAO = 600
+# Downloads simultaneos das entradas e tamanho (bytes) de cada bloco gravado em disco.
+MAX_DOWNLOADS_SIMULTANEOS = 3
+TAMANHO_BLOCO_DOWNLOAD = 1024 * 1024
+
 
 def _informacoes_service_account():
     """Le as credenciais, aceitando o formato novo e o modelo antigo."""
@@ -61,14 +80,9 @@ def _informacoes_service_account():
     return info
 
 
-def _credenciais():
-    return Credentials.from_service_account_info(
-        _informacoes_service_account(), scopes=SCOPES
-    )
-
-
 def _sessao():
-    return AuthorizedSession(_credenciais())
+    """Sessao autenticada compartilhada pelo processo (ver clientes_google)."""
+    return sessao_google(_informacoes_service_account(), SCOPES)
 
 
 def _id_planilha(nome):
@@ -116,51 +130,195 @@ def _verificar_resposta(resp, planilha_id, operacao):
     return resp
 
 
-def _baixar_arquivo_xlsx(session, file_id, destino):
-    """Baixa tanto uma planilha Google quanto um arquivo Excel do Drive."""
-    url_arquivo = f"https://www.googleapis.com/drive/v3/files/{file_id}"
-
+def _metadados_arquivo(session, file_id):
+    """Tipo e revisao (data de modificacao e md5) de um arquivo do Drive."""
     resposta_metadados = session.get(
-        url_arquivo,
-        params={"fields": "mimeType", "supportsAllDrives": "true"},
+        f"https://www.googleapis.com/drive/v3/files/{file_id}",
+        params={
+            "fields": "id,mimeType,modifiedTime,md5Checksum",
+            "supportsAllDrives": "true",
+        },
     )
     _verificar_resposta(
         resposta_metadados,
         file_id,
         "identificar o tipo do arquivo de entrada",
     )
-    mime_type = resposta_metadados.json().get("mimeType")
+    return resposta_metadados.json()
+
+
+def _baixar_arquivo_xlsx(session, file_id, destino, mime_type):
+    """Baixa tanto uma planilha Google quanto um arquivo Excel do Drive, gravando aos blocos em disco."""
+    url_arquivo = f"https://www.googleapis.com/drive/v3/files/{file_id}"
 
     if mime_type == MIME_GOOGLE_SHEETS:
         resposta_arquivo = session.get(
             f"{url_arquivo}/export",
             params={"mimeType": MIME_XLSX},
+            stream=True,
         )
         operacao = "exportar planilha Google como XLSX"
     else:
         resposta_arquivo = session.get(
             url_arquivo,
             params={"alt": "media", "supportsAllDrives": "true"},
+            stream=True,
         )
         operacao = "baixar arquivo XLSX"
 
-    _verificar_resposta(resposta_arquivo, file_id, operacao)
-    Path(destino).write_bytes(resposta_arquivo.content)
+    with resposta_arquivo:
+        _verificar_resposta(resposta_arquivo, file_id, operacao)
+        with open(destino, "wb") as arquivo:
+            for bloco in resposta_arquivo.iter_content(TAMANHO_BLOCO_DOWNLOAD):
+                arquivo.write(bloco)
+
+
+class _PlanilhasEmCache:
+    """Pasta com as entradas mais recentes, as revisoes delas e quando foram conferidas."""
+
+    def __init__(self):
+        self.pasta = None
+        self.revisoes = None
+        self.verificado_em = None
+        # Ha uma conferencia em andamento (em segundo plano ou de uma sessao);
+        # so uma roda por vez, e quem precisa do resultado espera por ela.
+        self.atualizando = False
+        self.conferir_agora = False
+        self.trava = threading.Lock()
+        self.conferida = threading.Condition(self.trava)
+
+
+_CACHE_PLANILHAS = _PlanilhasEmCache()
+
+
+def _consultar_planilhas(session, ids, pasta_atual, revisoes_atuais):
+    """
+    Confere as revisoes das entradas no Drive e baixa so as que mudaram para
+    uma pasta nova; as demais sao copiadas de ``pasta_atual``. As tres
+    entradas sao conferidas e baixadas ao mesmo tempo, com a mesma sessao.
+    Nao mexe no cache; quem chama troca a pasta e as revisoes sob
+    ``_CACHE_PLANILHAS.trava``.
+
+    Returns:
+        tuple: (pasta com as entradas, revisoes delas); a pasta e
+        ``pasta_atual`` se nenhuma entrada mudou.
+    """
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=MAX_DOWNLOADS_SIMULTANEOS) as pool:
+        metadados = dict(zip(ids, pool.map(lambda file_id: _metadados_arquivo(session, file_id), ids.values())))
+        revisoes = {nome: revisao_arquivo(dados) for nome, dados in metadados.items()}
+        if pasta_atual is not None and revisoes == revisoes_atuais:
+            return pasta_atual, revisoes
+
+        pasta = criar_pasta(SNAPSHOT_PLANILHAS)
+
+        def obter(nome):
+            """Baixa (ou copia, se nao mudou) uma entrada; devolve a origem e os segundos gastos."""
+            inicio_arquivo = time.perf_counter()
+            destino = pasta / ARQUIVOS_ENTRADA[nome]
+            if pasta_atual is not None and revisoes_atuais.get(nome) == revisoes[nome]:
+                shutil.copyfile(Path(pasta_atual) / ARQUIVOS_ENTRADA[nome], destino)
+                origem = "copia local"
+            else:
+                _baixar_arquivo_xlsx(session, ids[nome], destino, metadados[nome].get("mimeType"))
+                origem = "Google"
+            return origem, time.perf_counter() - inicio_arquivo
+
+        tempos = dict(zip(ids, pool.map(obter, ids)))
+    for nome, (origem, segundos) in tempos.items():
+        tamanho = (pasta / ARQUIVOS_ENTRADA[nome]).stat().st_size
+        print(f"{ARQUIVOS_ENTRADA[nome]}: {tamanho / 1e6:.1f} MB ({origem}) em {segundos:.2f} s")
+    print(f"Entradas do Google atualizadas em {time.perf_counter() - inicio:.2f} s")
+
+    concluir_pasta(SNAPSHOT_PLANILHAS, pasta, revisoes)
+    return str(pasta), revisoes
+
+
+def _concluir_atualizacao(pasta=None, revisoes=None):
+    """Troca a pasta e as revisoes (se houver pasta nova) e encerra a conferencia em andamento."""
+    cache = _CACHE_PLANILHAS
+    with cache.trava:
+        if pasta is not None:
+            cache.pasta, cache.revisoes = pasta, revisoes
+        cache.verificado_em = time.monotonic()
+        cache.atualizando = False
+        cache.conferida.notify_all()
+
+
+def _atualizar_planilhas(session, ids):
+    """
+    Executa a conferencia marcada em ``_CACHE_PLANILHAS.atualizando``: a
+    consulta e os downloads ficam fora da trava, e a pasta, as revisoes e a
+    hora da conferencia sao trocadas juntas no fim. Devolve a pasta atual.
+    """
+    cache = _CACHE_PLANILHAS
+    with cache.trava:
+        pasta_atual, revisoes_atuais = cache.pasta, cache.revisoes
+    pasta = revisoes = None
+    try:
+        pasta, revisoes = _consultar_planilhas(session, ids, pasta_atual, revisoes_atuais)
+    finally:
+        _concluir_atualizacao(pasta, revisoes)
+    return pasta
+
+
+def _revalidar_em_segundo_plano(session, ids):
+    try:
+        _atualizar_planilhas(session, ids)
+    except Exception as exc:
+        # A pasta atual continua valendo ate a proxima conferencia.
+        print(f"AVISO: nao foi possivel conferir as planilhas do Google: {exc}")
 
 
-@st.cache_data(show_spinner="Carregando planilhas do Google...")
 def baixar_planilhas():
-    """Baixa as tres entradas para uma pasta temporaria do servidor."""
-    pasta = Path(tempfile.mkdtemp(prefix="ferias_cto_"))
-    session = _sessao()
-    arquivos = {
-        "alocacao": pasta / NOME_ALOCACAO,
-        "controle_ferias": pasta / NOME_FERIAS,
-        "flexibilidade_operacional": pasta / NOME_FLEXIBILIDADE,
-    }
-    for nome, destino in arquivos.items():
-        _baixar_arquivo_xlsx(session, _id_planilha(nome), destino)
-    return str(pasta)
+    """Baixa as tres entradas para uma pasta do servidor e devolve o caminho dela.
+
+    A pasta e reaproveitada enquanto os arquivos nao mudarem no Drive. Passado
+    INTERVALO_REVALIDACAO, a proxima chamada devolve a pasta atual na hora e
+    confere as revisoes em segundo plano. Depois de um reinicio, a pasta vem
+    da copia local (snapshots_drive) e e conferida da mesma forma. Os
+    downloads nunca seguram a trava do cache: as outras sessoes continuam
+    recebendo a pasta atual durante uma recarga.
+    """
+    cache = _CACHE_PLANILHAS
+    ids = {nome: _id_planilha(nome) for nome in ARQUIVOS_ENTRADA}
+    with cache.trava:
+        if cache.pasta is None and not cache.conferir_agora:
+            revisoes, pasta = ler_pasta(SNAPSHOT_PLANILHAS)
+            # A copia so vale se for dos mesmos arquivos configurados nos Secrets.
+            if pasta is not None and all(
+                str(revisoes.get(nome, "")).startswith(f"{file_id}:") for nome, file_id in ids.items()
+            ):
+                cache.pasta, cache.revisoes = str(pasta), revisoes
+        if (cache.pasta is None or cache.conferir_agora) and cache.atualizando:
+            # Ja ha uma conferencia em andamento: espera por ela antes de
+            # conferir, para nunca haver duas gravando pastas ao mesmo tempo.
+            # Uma recarga pedida confere de novo depois, pois a conferencia em
+            # andamento pode ter consultado o Drive antes do pedido.
+            with st.spinner("Carregando planilhas do Google..."):
+                while cache.atualizando:
+                    cache.conferida.wait()
+        if cache.pasta is None or cache.conferir_agora:
+            em_segundo_plano = False
+        elif (cache.verificado_em is None or time.monotonic() - cache.verificado_em >= INTERVALO_REVALIDACAO) \
+                and not cache.atualizando:
+            em_segundo_plano = True
+        else:
+            return cache.pasta
+        cache.conferir_agora = False
+        cache.atualizando = True
+        pasta_atual = cache.pasta
+
+    try:
+        session = _sessao()
+    except Exception:
+        _concluir_atualizacao()
+        raise
+    if em_segundo_plano:
+        threading.Thread(target=_revalidar_em_segundo_plano, args=(session, ids), daemon=True).start()
+        return pasta_atual
+    with st.spinner("Carregando planilhas do Google..."):
+        return _atualizar_planilhas(session, ids)
 
 
 def _valor_google(valor):
@@ -486,5 +644,5 @@ def ler_aba_resultados(nome_aba):
 
 
 def limpar_cache():
-    """Forca novo download das entradas na proxima chamada."""
-    baixar_planilhas.clear()
+    """Faz a proxima chamada conferir as entradas no Drive antes de devolver a pasta."""
+    _CACHE_PLANILHAS.conferir_agora = True
@@ -0,0 +1,274 @@
+"""
+Execução das simulações em segundo plano, com avisos de progresso e cancelamento.
+
+As simulações de ``param_capacidade`` e ``param_prazos`` aceitam um callback
+``ao_progredir(fracao, texto, **detalhes)``. ``ExecucaoEmSegundoPlano`` roda
+uma delas em uma thread e guarda os avisos para quem acompanha; a página do
+Streamlit os consulta periodicamente em ``acompanhar_execucao`` em vez de
+ficar bloqueada até o fim. Um pedido de cancelamento faz o próximo aviso
+levantar ``SimulacaoCancelada``, que encerra a simulação (e os processos de
+replicação, quando houver) sem resultado parcial.
+
+``executar_em_processos`` (e ``PoolDeProcessos``, para reaproveitar os
+processos em várias rodadas) leva os mesmos avisos e o mesmo cancelamento às
+tarefas de um pool de processos, como as replicações dos simuladores.
+
+Este módulo não importa o Streamlit; só ``acompanhar_execucao`` o usa.
+"""
+
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from motor_heuristica import SimulacaoCancelada
+
+# Avisos recentes guardados por execução; os mais antigos são descartados.
+MAX_AVISOS_GUARDADOS = 200
+# Intervalo (s) entre as atualizações do painel de progresso nas páginas.
+INTERVALO_ATUALIZACAO_PAINEL = 0.5
+# Intervalo (s) entre as leituras dos avisos enquanto as tarefas do pool rodam.
+INTERVALO_LEITURA_AVISOS = 0.2
+
+
+class ExecucaoEmSegundoPlano:
+    """
+    Executa ``funcao(*args, ao_progredir=..., **kwargs)`` em uma thread.
+
+    ``estado`` é 'executando', 'concluida', 'cancelada' ou 'erro'; ao final,
+    ``resultado`` recebe o retorno da função ou ``erro`` a exceção levantada.
+    ``ultimo_aviso`` é o aviso mais recente: um dicionário com 'fracao',
+    'texto', 'instante' (segundos desde o início) e os detalhes enviados pela
+    simulação, como 'iteracao', 'melhor_makespan' e 'operacoes'.
+    """
+
+    def __init__(self, funcao, *args, **kwargs):
+        self.estado = 'executando'
+        self.resultado = None
+        self.erro = None
+        self.inicio = time.monotonic()
+        self.fim = None
+        self.ultimo_aviso = {'fracao': 0.0, 'texto': "Iniciando...", 'instante': 0.0}
+        self.avisos = deque([self.ultimo_aviso], maxlen=MAX_AVISOS_GUARDADOS)
+        self._cancelamento = threading.Event()
+        self._thread = threading.Thread(target=self._executar, args=(funcao, args, kwargs), daemon=True)
+        self._thread.start()
+
+    def _avisar(self, fracao, texto, **detalhes):
+        if self._cancelamento.is_set():
+            raise SimulacaoCancelada()
+        aviso = dict(detalhes, fracao=min(max(float(fracao), 0.0), 1.0), texto=texto,
+                     instante=time.monotonic() - self.inicio)
+        self.avisos.append(aviso)
+        self.ultimo_aviso = aviso
+
+    def _executar(self, funcao, args, kwargs):
+        try:
+            self.resultado = funcao(*args, ao_progredir=self._avisar, **kwargs)
+            self.estado = 'concluida'
+        except SimulacaoCancelada:
+            self.estado = 'cancelada'
+        except Exception as erro:
+            self.erro = erro
+            self.estado = 'erro'
+        finally:
+            self.fim = time.monotonic()
+
+    def cancelar(self):
+        """Pede o cancelamento; a simulação para no próximo aviso de progresso."""
+        self._cancelamento.set()
+
+    @property
+    def cancelamento_pedido(self):
+        return self._cancelamento.is_set()
+
+    def em_andamento(self):
+        return self._thread.is_alive()
+
+    def aguardar(self, timeout=None):
+        """Espera a execução terminar; retorna False se o ``timeout`` (s) acabar antes."""
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def duracao(self):
+        return (self.fim or time.monotonic()) - self.inicio
+
+
+def acompanhar_execucao(execucao, chave):
+    """
+    Painel do Streamlit com o progresso de ``execucao`` e o botão de cancelar.
+
+    O painel é um fragmento que se atualiza a cada ``INTERVALO_ATUALIZACAO_PAINEL``
+    segundos sem re-executar a página; quando a execução termina, a página
+    inteira é re-executada para exibir o resultado. ``chave`` distingue os
+    widgets do painel de cada página.
+    """
+    import streamlit as st
+
+    @st.fragment(run_every=INTERVALO_ATUALIZACAO_PAINEL)
+    def painel():
+        if not execucao.em_andamento():
+            st.rerun()
+        aviso = execucao.ultimo_aviso
+        st.progress(aviso['fracao'], text=aviso['texto'])
+        col_tempo, col_iteracao, col_makespan, col_operacoes = st.columns(4)
+        col_tempo.metric("Tempo decorrido", f"{execucao.duracao():.0f} s")
+        if aviso.get('iteracao') is not None:
+            col_iteracao.metric("Iteração", aviso['iteracao'])
+        if aviso.get('melhor_makespan') is not None:
+            col_makespan.metric("Melhor makespan", f"{aviso['melhor_makespan'] / 24:.1f} dias")
+        if aviso.get('operacoes') is not None:
+            col_operacoes.metric("Operações despachadas", f"{aviso['operacoes']}/{aviso['total_operacoes']}")
+
+        if not execucao.cancelamento_pedido and st.button("Cancelar simulação", key=f"cancelar_{chave}"):
+            execucao.cancelar()
+        if execucao.cancelamento_pedido:
+            st.info("Cancelando... a simulação para no próximo aviso de progresso.")
+
+    painel()
+
+
+# =========================================================================
+#                   TAREFAS EM UM POOL DE PROCESSOS
+# =========================================================================
+# Fila de avisos de progresso e evento de cancelamento compartilhados com os
+# processos do pool; None fora deles.
+_AVISOS_PROCESSO = None
+
+
+def _iniciar_processo(fila_avisos, cancelamento, inicializar, dados):
+    global _AVISOS_PROCESSO
+    _AVISOS_PROCESSO = (fila_avisos, cancelamento)
+    if inicializar is not None:
+        inicializar(*dados)
+
+
+def _executar_tarefa(funcao, lote, indice, args):
+    ao_progredir = None
+    if _AVISOS_PROCESSO is not None and _AVISOS_PROCESSO[0] is not None:
+        fila_avisos, cancelamento = _AVISOS_PROCESSO
+
+        def ao_progredir(fracao, texto, **detalhes):
+            # O processo principal pede o cancelamento pelo evento compartilhado.
+            if cancelamento.is_set():
+                raise SimulacaoCancelada()
+            fila_avisos.put((lote, indice, fracao, texto, detalhes))
+    return funcao(*args, ao_progredir=ao_progredir)
+
+
+class PoolDeProcessos:
+    """
+    Pool de processos reaproveitado por várias chamadas de ``executar``.
+
+    Os processos são criados na primeira chamada e ficam até ``fechar`` (ou o
+    fim do bloco ``with``). ``inicializar(*dados)`` roda uma vez em cada
+    processo, para os dados usados por todas as tarefas (ex.: os parâmetros
+    da demanda) não serem enviados a cada uma. Com ``com_avisos``, as tarefas
+    recebem um ``ao_progredir`` que leva os avisos ao processo principal e
+    atende ao cancelamento; sem ele, recebem ``ao_progredir=None``.
+
+    Depois de uma exceção em ``executar`` (``SimulacaoCancelada``), o pool é
+    fechado e não deve mais ser usado.
+    """
+
+    def __init__(self, max_workers=None, com_avisos=False, inicializar=None, dados=()):
+        self.max_workers = max_workers
+        self._fila_avisos = self._cancelamento = None
+        # 'spawn': o servidor do Streamlit tem várias threads, e um fork copiaria
+        # travas que outras threads seguram no momento.
+        contexto = multiprocessing.get_context('spawn')
+        self._opcoes_pool = {'mp_context': contexto}
+        if com_avisos:
+            self._fila_avisos, self._cancelamento = contexto.Queue(), contexto.Event()
+        if com_avisos or inicializar is not None:
+            self._opcoes_pool.update(initializer=_iniciar_processo,
+                                     initargs=(self._fila_avisos, self._cancelamento, inicializar, tuple(dados)))
+        self._pool = None
+        # Cada chamada de ``executar`` é um lote; avisos atrasados de lotes
+        # anteriores são descartados.
+        self._lote = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.fechar()
+
+    def fechar(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _ler_avisos(self, ao_progredir):
+        while self._fila_avisos is not None:
+            try:
+                lote, indice, fracao, texto, detalhes = self._fila_avisos.get_nowait()
+            except queue.Empty:
+                return
+            if ao_progredir and lote == self._lote:
+                ao_progredir(indice, fracao, texto, **detalhes)
+
+    def executar(self, funcao, tarefas, ao_progredir=None, ao_concluir=None):
+        """
+        Executa ``funcao(*args, ao_progredir=...)`` para cada ``args`` de ``tarefas``.
+
+        Mesmo contrato de ``executar_em_processos``; os avisos só chegam a
+        ``ao_progredir`` se o pool foi criado ``com_avisos``.
+
+        Returns:
+            list: os resultados, na ordem de ``tarefas``.
+        """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, **self._opcoes_pool)
+        self._lote += 1
+        tarefas = list(tarefas)
+        resultados = [None] * len(tarefas)
+        futuros = {self._pool.submit(_executar_tarefa, funcao, self._lote, i, args): i for i, args in enumerate(tarefas)}
+        pendentes = set(futuros)
+        try:
+            while pendentes:
+                prontos, pendentes = wait(pendentes, timeout=INTERVALO_LEITURA_AVISOS, return_when=FIRST_COMPLETED)
+                self._ler_avisos(ao_progredir)
+                for futuro in prontos:
+                    indice = futuros[futuro]
+                    resultados[indice] = futuro.result()
+                    if ao_concluir:
+                        ao_concluir(indice, resultados[indice])
+        except BaseException:
+            if self._cancelamento is not None:
+                self._cancelamento.set()
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            # Os avisos continuam sendo lidos até as tarefas em andamento
+            # pararem, para nenhum processo ficar preso na fila ao terminar.
+            # (``wait`` não dá por concluídas as tarefas canceladas no shutdown.)
+            while any(not futuro.done() for futuro in pendentes):
+                wait(pendentes, timeout=INTERVALO_LEITURA_AVISOS)
+                self._ler_avisos(None)
+            self._pool.shutdown()
+            self._pool = None
+            raise
+        return resultados
+
+
+def executar_em_processos(funcao, tarefas, max_workers=None, ao_progredir=None, ao_concluir=None):
+    """
+    Executa ``funcao(*args, ao_progredir=...)`` para cada ``args`` de ``tarefas`` em um pool de processos.
+
+    ``funcao`` precisa ser de nível de módulo, para chegar aos processos. Com
+    ``ao_progredir``, os avisos de cada tarefa chegam ao processo principal
+    como ``ao_progredir(indice, fracao, texto, **detalhes)``; sem ela, as
+    tarefas recebem ``ao_progredir=None``. ``ao_concluir(indice, resultado)``
+    é chamada a cada tarefa terminada, na ordem em que terminam. Se uma
+    delas levantar uma exceção (``SimulacaoCancelada``), as tarefas pendentes
+    são descartadas, as em andamento param no próximo aviso e a exceção é
+    repassada.
+
+    Para várias chamadas seguidas com os mesmos processos, ver ``PoolDeProcessos``.
+
+    Returns:
+        list: os resultados, na ordem de ``tarefas``.
+    """
+    with PoolDeProcessos(max_workers, com_avisos=ao_progredir is not None) as pool:
+        return pool.executar(funcao, tarefas, ao_progredir, ao_concluir)
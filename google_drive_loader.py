@@ -1,18 +1,204 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import io
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+import openpyxl
+from openpyxl.cell.cell import ERROR_CODES
 import os
+import threading
+import time
+from clientes_google import sessao_google
+from snapshots_drive import gravar_tabela, ler_tabela, revisao_arquivo
+
+# Depois deste intervalo (s), a revisão do arquivo no Drive é conferida de novo
+# (em segundo plano) na próxima leitura.
+INTERVALO_REVALIDACAO = 600
+# Nome da cópia local da fila (ver snapshots_drive), lida depois de um reinício.
+SNAPSHOT_FILA = "fila_laboratorio"
+URL_ARQUIVOS_DRIVE = "https://www.googleapis.com/drive/v3/files"
+SCOPES_DRIVE = ['https://www.googleapis.com/auth/drive.readonly']
+# Tamanho (bytes) de cada bloco lido do download.
+TAMANHO_BLOCO_DOWNLOAD = 1024 * 1024
+
+ENSAIOS_DESEJADOS = [
+    "BE", "BEP", "RC", "CID", "CIDsat", "CIUsat", "CIU", "UU", "UUsat",
+    "CADsat", "CAU", "CAUsat", "CCIDsat", "CCIUsat", "EIUsat", "QCSD",
+    "CIDsat/GD", "CIUsat/GD", "PN", "CD", "CS", "CK0", "CCADsat", "CCAUsat"
+]
+STATUS_DESEJADOS = ["1) Não iniciado", "2) Iniciado"]
+COLUNAS_DESEJADAS = [
+    "ID Ensaio/CP", "Campanha", "Amostra", "Nome Amostra",
+    "Tipo Amostra", "Ensaio", "Início Plan Atual",
+    "Especificação Técnica Ensaio"
+]
+# Células tratadas como vazias (NaN) nas colunas guardadas: texto vazio e erros do Excel.
+VALORES_AUSENTES = ["", *ERROR_CODES]
+
+
+class _FilaEmCache:
+    """Última fila lida do Drive, a revisão do arquivo de origem e quando ela foi conferida."""
+
+    def __init__(self):
+        self.dados = None
+        self.revisao = None
+        self.verificado_em = None
+        self.revalidando = False
+        self.trava = threading.Lock()
+
+
+_CACHE_FILA = _FilaEmCache()
+
+
+def _localizar_arquivo(session, config):
+    """Metadados (id, nome, modifiedTime, md5Checksum) do arquivo da fila na pasta, ou None se ele não estiver lá."""
+    query = f"name = '{config['nome_arquivo_xlsx']}' and '{config['id_pasta_drive']}' in parents and trashed = false"
+    resposta = session.get(URL_ARQUIVOS_DRIVE, params={
+        'q': query,
+        'spaces': 'drive',
+        'fields': 'files(id, name, modifiedTime, md5Checksum)',
+        'supportsAllDrives': 'true',
+        'includeItemsFromAllDrives': 'true',
+    })
+    resposta.raise_for_status()
+    items = resposta.json().get('files', [])
+    return items[0] if items else None
+
+
+def _baixar_arquivo(session, file_id):
+    file_buffer = io.BytesIO()
+    with session.get(f"{URL_ARQUIVOS_DRIVE}/{file_id}", params={'alt': 'media', 'supportsAllDrives': 'true'}, stream=True) as resposta:
+        resposta.raise_for_status()
+        for bloco in resposta.iter_content(TAMANHO_BLOCO_DOWNLOAD):
+            file_buffer.write(bloco)
+    print(f"   Download de {file_buffer.tell() / 1e6:.1f} MB.")
+
+    file_buffer.seek(0)
+    return file_buffer
+
+
+def _tipar_coluna(coluna):
+    """
+    Tipo de uma coluna guardada a partir dos valores das células: vazias e
+    erros do Excel viram NaN; colunas só de números, datas ou textos ganham o
+    tipo correspondente, e números todos inteiros ficam int64, como no
+    ``pd.read_excel``.
+    """
+    coluna = coluna.where(coluna.notna() & ~coluna.isin(VALORES_AUSENTES), np.nan).infer_objects()
+    if coluna.dtype.kind == 'f' and coluna.notna().all() and (coluna % 1 == 0).all():
+        coluna = coluna.astype('int64')
+    return coluna
+
+
+def _ler_e_filtrar(file_buffer, config):
+    """
+    Lê a aba da fila linha a linha (openpyxl em modo read_only), guardando só
+    as linhas dos ensaios e status de interesse e as colunas usadas pelos
+    simuladores. As demais células nem chegam a ser convertidas; os tipos das
+    colunas guardadas são inferidos só das linhas que passaram no filtro
+    (ver ``_tipar_coluna``).
+    """
+    print(f"\n4. Lendo a aba '{config['nome_aba_xlsx']}' do arquivo Excel e filtrando os dados...")
+    workbook = openpyxl.load_workbook(file_buffer, read_only=True, data_only=True, keep_links=False)
+    try:
+        planilha = workbook[config['nome_aba_xlsx']]
+        # As dimensões gravadas no arquivo podem estar erradas (como no pd.read_excel).
+        planilha.reset_dimensions()
+        linhas = planilha.iter_rows()
+
+        # Posição de cada coluna pelo cabeçalho (a primeira, se o nome se repetir).
+        posicao = {}
+        for k, celula in enumerate(next(linhas, ())):
+            posicao.setdefault(celula.value, k)
+        for coluna in ("Ensaio", "Status Ensaio/CP"):
+            if coluna not in posicao:
+                raise KeyError(coluna)
+        colunas_existentes = [col for col in COLUNAS_DESEJADAS if col in posicao]
+        indices = [posicao[col] for col in colunas_existentes]
+        k_ensaio, k_status = posicao["Ensaio"], posicao["Status Ensaio/CP"]
+        k_ultima = max(k_ensaio, k_status)
+        ensaios_desejados, status_desejados = set(ENSAIOS_DESEJADOS), set(STATUS_DESEJADOS)
+
+        total_linhas = 0
+        selecionadas = []
+        for linha in linhas:
+            total_linhas += 1
+            if (len(linha) > k_ultima and linha[k_ensaio].value in ensaios_desejados
+                    and linha[k_status].value in status_desejados):
+                selecionadas.append([linha[k].value if k < len(linha) else None for k in indices])
+    finally:
+        workbook.close()
+    print(f"   => Leitura concluída. {len(selecionadas)} de {total_linhas} linhas da planilha restantes após o filtro.")
+
+    df_final = pd.DataFrame(selecionadas, columns=colunas_existentes, dtype=object)
+    for coluna in colunas_existentes:
+        df_final[coluna] = _tipar_coluna(df_final[coluna])
+    print(f"   => DataFrame final criado com {len(df_final.columns)} colunas.")
+    return df_final
+
+
+def _consultar_fila(creds_dict, config, revisao_atual):
+    """
+    Confere a revisão do arquivo no Drive com uma consulta de metadados e só
+    baixa e processa a planilha de novo se ela é diferente de ``revisao_atual``.
+    Não mexe no cache; quem chama troca os dados, a revisão e a hora da
+    verificação juntos, sob ``_CACHE_FILA.trava``.
+
+    Returns:
+        tuple: (revisão do arquivo, fila nova ou None se ela não mudou).
+        Levanta FileNotFoundError se o arquivo não estiver na pasta.
+    """
+    # Sessão autenticada e conexões compartilhadas pelo processo (ver clientes_google).
+    session = sessao_google(creds_dict, SCOPES_DRIVE)
+    print("   => Autenticação com Google API concluída.")
+
+    print(f"\n2. Buscando pelo arquivo '{config['nome_arquivo_xlsx']}'...")
+    arquivo = _localizar_arquivo(session, config)
+    if arquivo is None:
+        raise FileNotFoundError(f"O arquivo '{config['nome_arquivo_xlsx']}' não foi encontrado na pasta do Drive.")
+    print(f"   => Arquivo encontrado com ID: {arquivo['id']} (modificado em {arquivo.get('modifiedTime')})")
+
+    revisao = revisao_arquivo(arquivo)
+    if revisao == revisao_atual:
+        print("   => Arquivo sem alterações desde a última leitura; mantendo os dados em cache.")
+        return revisao, None
+    print("\n3. Baixando o conteúdo do arquivo...")
+    file_buffer = _baixar_arquivo(session, arquivo['id'])
+    print("   => Download concluído.")
+    df_final = _ler_e_filtrar(file_buffer, config)
+    gravar_tabela(SNAPSHOT_FILA, revisao, df_final)
+    return revisao, df_final
+
+
+def _revalidar_em_segundo_plano(creds_dict, config):
+    cache = _CACHE_FILA
+    with cache.trava:
+        revisao_atual = cache.revisao
+    revisao = dados = None
+    try:
+        # A consulta e o download ficam fora da trava: as leituras seguem
+        # recebendo a fila em cache enquanto isso.
+        revisao, dados = _consultar_fila(creds_dict, config, revisao_atual)
+    except Exception as e:
+        # Os dados em cache continuam valendo até a próxima verificação.
+        print(f"\n !!! ERRO AO REVALIDAR OS DADOS DO GOOGLE DRIVE: {e} !!!")
+    finally:
+        with cache.trava:
+            if dados is not None:
+                cache.dados, cache.revisao = dados, revisao
+            cache.verificado_em = time.monotonic()
+            cache.revalidando = False
+
 
-# O decorator @st.cache_data é usado pelo Streamlit, mas não atrapalha a execução normal.
-# Para testar, ele simplesmente será ignorado.
-@st.cache_data(ttl=600)
 def carregar_e_filtrar_dados():
     """
     Conecta ao Google Drive usando st.secrets, baixa, filtra e processa os dados.
     Retorna um DataFrame do Pandas. Em caso de erro, retorna um DataFrame vazio.
+
+    A fila fica em cache no processo junto com a revisão do arquivo de origem.
+    Passado INTERVALO_REVALIDACAO, a próxima chamada ainda devolve a fila em
+    cache na hora e confere em segundo plano se o arquivo mudou; ele só é
+    baixado e processado de novo quando mudou. Depois de um reinício, a fila
+    vem da cópia local gravada na última leitura e é conferida da mesma forma.
     """
     print("--- Iniciando processo de carregamento de dados do Google Drive ---")
     try:
@@ -30,77 +216,31 @@ def carregar_e_filtrar_dados():
         config = st.secrets["app_config"]
 
         print("   => Credenciais lidas com sucesso.")
-        
-        scopes = ['https://www.googleapis.com/auth/drive.readonly']
-        creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-        drive_service = build('drive', 'v3', credentials=creds)
-        print("   => Autenticação com Google API concluída.")
-
-        # 2. BUSCANDO O ARQUIVO DENTRO DA PASTA
-        print(f"\n2. Buscando pelo arquivo '{config['nome_arquivo_xlsx']}'...")
-        query = f"name = '{config['nome_arquivo_xlsx']}' and '{config['id_pasta_drive']}' in parents and trashed = false"
-        results = drive_service.files().list(
-            q=query,
-            spaces='drive',
-            fields='files(id, name)',
-            supportsAllDrives=True,
-            includeItemsFromAllDrives=True
-        ).execute()
-        items = results.get('files', [])
-
-        if not items:
-            print(f"   => ERRO: O arquivo '{config['nome_arquivo_xlsx']}' não foi encontrado na pasta do Drive.")
-            st.error(f"ERRO: O arquivo '{config['nome_arquivo_xlsx']}' não foi encontrado na pasta do Drive. Verifique as configurações e o compartilhamento.")
-            return pd.DataFrame()
 
-        file_id = items[0]['id']
-        print(f"   => Arquivo encontrado com ID: {file_id}")
-        
-        # 3. BAIXANDO O CONTEÚDO DO ARQUIVO
-        print("\n3. Baixando o conteúdo do arquivo...")
-        request = drive_service.files().get_media(fileId=file_id)
-        file_buffer = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_buffer, request)
-        
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-            if status:
-                print(f"   Download {int(status.progress() * 100)}%.")
-        
-        file_buffer.seek(0)
-        print("   => Download concluído.")
-        
-        # 4. LENDO E PROCESSANDO COM PANDAS
-        print(f"\n4. Lendo a aba '{config['nome_aba_xlsx']}' do arquivo Excel...")
-        df = pd.read_excel(file_buffer, sheet_name=config['nome_aba_xlsx'], engine='openpyxl')
-        print(f"   => Leitura concluída. Total de {len(df)} linhas carregadas da planilha.")
-
-        ensaios_desejados = [
-            "BE", "BEP", "RC", "CID", "CIDsat", "CIUsat", "CIU", "UU", "UUsat",
-            "CADsat", "CAU", "CAUsat", "CCIDsat", "CCIUsat", "EIUsat", "QCSD",
-            "CIDsat/GD", "CIUsat/GD", "PN", "CD", "CS", "CK0", "CCADsat", "CCAUsat"
-        ]
-        status_desejados = ["1) Não iniciado", "2) Iniciado"]
-        
-        print("\n5. Filtrando dados...")
-        df_filtrado_linhas = df[
-            df["Ensaio"].isin(ensaios_desejados) &
-            df["Status Ensaio/CP"].isin(status_desejados)
-        ].copy()
-        print(f"   => {len(df_filtrado_linhas)} linhas restantes após o filtro.")
-
-        colunas_desejadas = [
-            "ID Ensaio/CP", "Campanha", "Amostra", "Nome Amostra",
-            "Tipo Amostra", "Ensaio", "Início Plan Atual",
-            "Especificação Técnica Ensaio"
-        ]
-        
-        colunas_existentes = [col for col in colunas_desejadas if col in df_filtrado_linhas.columns]
-        df_final = df_filtrado_linhas[colunas_existentes]
-        print(f"   => DataFrame final criado com {len(df_final.columns)} colunas.")
-        
-        return df_final
+        cache = _CACHE_FILA
+        with cache.trava:
+            if cache.dados is None:
+                cache.revisao, cache.dados = ler_tabela(SNAPSHOT_FILA)
+                if cache.dados is not None:
+                    print(f"   => Fila carregada da cópia local ({len(cache.dados)} linhas).")
+            if cache.dados is None:
+                # Primeira leitura do processo: quem chegar junto espera o mesmo download.
+                cache.revisao, cache.dados = _consultar_fila(creds_dict, config, None)
+                cache.verificado_em = time.monotonic()
+            elif (cache.verificado_em is None or time.monotonic() - cache.verificado_em >= INTERVALO_REVALIDACAO) \
+                    and not cache.revalidando:
+                print("   => Dados em cache vencidos; conferindo a revisão do arquivo em segundo plano.")
+                cache.revalidando = True
+                threading.Thread(target=_revalidar_em_segundo_plano, args=(creds_dict, config), daemon=True).start()
+            else:
+                print("   => Usando os dados em cache.")
+            # Cópia, pois as páginas acrescentam colunas ao DataFrame recebido.
+            return cache.dados.copy()
+
+    except FileNotFoundError as e:
+        print(f"   => ERRO: {e}")
+        st.error(f"ERRO: {e} Verifique as configurações e o compartilhamento.")
+        return pd.DataFrame()
 
     except Exception as e:
         print(f"\n !!! ERRO GERAL NO PROCESSO: {e} !!!")
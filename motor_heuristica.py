@@ -0,0 +1,686 @@
+"""Motor de despacho orientado a eventos da heurística do laboratório.
+
+Reproduz a regra de despacho usada em ``param_capacidade`` e ``param_prazos``:
+a cada passo é escolhida a operação com menor início possível, desempatando
+pela data de liberação do ensaio e pelo seu tempo total de processamento. Em vez
+de reconstruir a lista de candidatas sobre todos os ensaios a cada despacho, as
+candidatas ficam em um heap e só são recalculadas quando um recurso de que
+dependem muda de disponibilidade. Ensaios idênticos (mesmo modelo, mesma etapa,
+prontos no mesmo instante e liberados juntos) formam uma única candidata, que
+é avaliada uma vez para todo o lote e despacha um ensaio por vez, na mesma
+ordem do despacho individual.
+
+O estado do despacho fica em ``MotorDespacho``, que pode ser interrompido em
+um instante, copiado e retomado com mais ensaios ativos. Isso permite simular
+uma base comum (a fila real, por exemplo) uma única vez e reaproveitá-la em
+vários cenários. ``SimuladorIncremental`` usa os mesmos estados, guardados
+em pontos de controle, para retomar uma simulação com mais instâncias de um
+recurso a partir do primeiro despacho em que esse recurso atrasou uma operação.
+"""
+
+import heapq
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+TOLERANCIA = 1e-5
+# A cada quantas operações agendadas o despacho avisa o seu andamento.
+INTERVALO_AVISO_DESPACHO = 1000
+
+
+class SimulacaoCancelada(Exception):
+    """
+    Interrompe uma simulação em andamento. É levantada pelos callbacks de
+    progresso quando quem acompanha a execução pede o cancelamento.
+    """
+
+
+class PoolInstancias:
+    """
+    Instâncias de um recurso organizadas em min-heaps pelo instante em que ficam livres.
+
+    Consultar a instância livre mais cedo é O(1) amortizado e ocupar uma
+    instância é O(log n), em vez de varrer a lista de instâncias a cada
+    candidata e a cada despacho. A escolha da instância é a mesma da lista
+    original: a de menor índice entre as livres até ``inicio + TOLERANCIA``.
+    """
+
+    __slots__ = ('_livre_em', '_geracao', '_por_tempo', '_ocupadas', '_livres')
+
+    def __init__(self, quantidade):
+        self._livre_em = [0] * quantidade
+        self._geracao = [0] * quantidade
+        # Heap (instante, índice, geração) de todas as instâncias; entradas de
+        # gerações antigas são descartadas ao chegar ao topo.
+        self._por_tempo = [(0, k, 0) for k in range(quantidade)]
+        # Instâncias ainda ocupadas, por instante, e já livres, por índice.
+        self._ocupadas = []
+        self._livres = list(range(quantidade))
+
+    def __len__(self):
+        return len(self._livre_em)
+
+    def disponivel_em(self):
+        """Instante em que a próxima instância fica livre."""
+        por_tempo = self._por_tempo
+        while por_tempo and por_tempo[0][2] != self._geracao[por_tempo[0][1]]:
+            heapq.heappop(por_tempo)
+        return por_tempo[0][0] if por_tempo else 0
+
+    def ocupar(self, inicio, fim):
+        """
+        Ocupa uma instância livre em ``inicio`` até ``fim`` e devolve o novo
+        instante de disponibilidade do recurso.
+        """
+        # Os despachos acontecem em ordem não decrescente de início, então uma
+        # instância liberada para um despacho continua livre para os seguintes.
+        while self._ocupadas and self._ocupadas[0][0] <= inicio + TOLERANCIA:
+            heapq.heappush(self._livres, heapq.heappop(self._ocupadas)[1])
+        if self._livres:
+            k = heapq.heappop(self._livres)
+        else:
+            k = heapq.heappop(self._ocupadas)[1]
+        self._livre_em[k] = fim
+        self._geracao[k] += 1
+        heapq.heappush(self._ocupadas, (fim, k))
+        heapq.heappush(self._por_tempo, (fim, k, self._geracao[k]))
+        return self.disponivel_em()
+
+    def ampliar(self, quantidade):
+        """Acrescenta instâncias livres desde o instante 0 até o pool ter ``quantidade``."""
+        for k in range(len(self._livre_em), quantidade):
+            self._livre_em.append(0)
+            self._geracao.append(0)
+            heapq.heappush(self._por_tempo, (0, k, 0))
+            heapq.heappush(self._livres, k)
+
+    def copiar(self):
+        """Cópia independente do estado das instâncias."""
+        copia = PoolInstancias.__new__(PoolInstancias)
+        copia._livre_em = list(self._livre_em)
+        copia._geracao = list(self._geracao)
+        copia._por_tempo = list(self._por_tempo)
+        copia._ocupadas = list(self._ocupadas)
+        copia._livres = list(self._livres)
+        return copia
+
+
+class MotorDespacho:
+    """
+    Estado da simulação de eventos discretos de uma configuração de recursos.
+
+    Os parâmetros (``ensaios``, ``p``, ``r_j``, ``incidencia``) descrevem todos
+    os ensaios que podem participar; só os ensaios ativos (``ativos``, por
+    padrão todos) recebem candidatas. Ensaios podem ser ativados depois, desde
+    que o motor ainda não tenha despachado operações com início igual ou
+    posterior à liberação deles — ver ``despachar(ate=...)``.
+
+    Sem ``contabilizar_esperas``, a agenda é a mesma, mas a espera por
+    recurso não é acumulada (``espera_por_recurso`` fica vazio) e as
+    candidatas são agrupadas pela tupla de recursos que exigem. Todas as de um
+    grupo começam em max(pronto, disponibilidade do grupo): as já prontas
+    ficam em um heap pela ordem de desempate e as demais em outro pelo
+    instante em que ficam prontas, e o heap principal guarda só a melhor de
+    cada grupo. Uma mudança de disponibilidade reavalia os poucos grupos do
+    recurso, e não cada candidata em espera — o que importa quando muitos
+    ensaios distintos (com durações sorteadas, por exemplo) esperam pelos
+    mesmos recursos.
+    """
+
+    def __init__(self, ensaios, p, r_j, incidencia, capacidade_recurso, ativos=None, contabilizar_esperas=True):
+        self.ensaios = ensaios
+        self.contabilizar_esperas = contabilizar_esperas
+        self.p = p
+        self.incidencia = incidencia
+        self.etapas_proc = incidencia.etapas_proc
+        self.recursos_proc = incidencia.recursos_proc
+        n_jobs = len(ensaios)
+        self.liberacao = [r_j.get(job, 0) for job in ensaios]
+        # Ensaios do mesmo modelo compartilham o dicionário de durações, então o
+        # tempo total e a sequência de etapas são calculados uma vez por modelo.
+        por_modelo = {}
+        sem_etapas = {}
+        # Ensaios com o mesmo dicionário de durações e o mesmo tipo de
+        # incidência recebem o mesmo índice de modelo e podem formar lotes.
+        indice_modelo = {}
+        self.p_total = []
+        self.job_stages = []
+        self.modelo_job = []
+        for job, tipo in zip(ensaios, incidencia.tipo_job):
+            p_job = p.get(job, sem_etapas)
+            if id(p_job) not in por_modelo:
+                por_modelo[id(p_job)] = (
+                    sum(p_job.get(stage, 0) for stage in p_job if stage != 'Prep_Espera'),
+                    [k for k, etapa in enumerate(self.etapas_proc) if p_job.get(etapa, 0) > 0],
+                )
+            total, etapas_job = por_modelo[id(p_job)]
+            self.p_total.append(total)
+            self.job_stages.append(etapas_job)
+            self.modelo_job.append(indice_modelo.setdefault((id(p_job), tipo), len(indice_modelo)))
+
+        self.pools = [PoolInstancias(capacidade_recurso.get(res, 1)) for res in self.recursos_proc]
+        self.disponivel_em = [pool.disponivel_em() for pool in self.pools]
+
+        # Próxima etapa ainda não agendada de cada ensaio.
+        self.proxima_etapa = [0] * n_jobs
+        # Estado de cada candidata: um lote de ensaios idênticos com a mesma
+        # próxima etapa. Cada ensaio está em no máximo uma candidata, então
+        # ``n_jobs`` posições bastam; as livres são reaproveitadas.
+        self.membros_candidata = [None] * n_jobs
+        self.chave_candidata = [None] * n_jobs
+        self.pronto_candidata = [0.0] * n_jobs
+        self.recursos_candidata = [()] * n_jobs
+        self.inicio_candidata = [0.0] * n_jobs
+        self.espera_candidata = [0.0] * n_jobs
+        self.gargalo_candidata = [None] * n_jobs
+        self.versao = [0] * n_jobs
+        self.candidata_por_chave = {}
+        self.candidatas_livres = list(range(n_jobs - 1, -1, -1))
+        # Grupos de candidatas pela tupla de recursos de cada (tipo, etapa),
+        # usados sem ``contabilizar_esperas``.
+        indice_grupo = {}
+        self.grupo_tipo_etapa = [
+            [indice_grupo.setdefault(recursos, len(indice_grupo)) for recursos in por_etapa]
+            for por_etapa in incidencia.recursos_tipo_etapa
+        ]
+        self.grupos_recursos = list(indice_grupo)
+        self.grupos_por_recurso = [[g for g, recursos in enumerate(self.grupos_recursos) if r in recursos]
+                                   for r in range(len(self.recursos_proc))]
+        self.grupo_candidata = [None] * n_jobs
+        # Por grupo: candidatas prontas (liberação, tempo total, ensaio,
+        # candidata, versão) e futuras (pronto, liberação, tempo total, ensaio,
+        # candidata, versão).
+        self.prontas_grupo = [[] for _ in self.grupos_recursos]
+        self.futuras_grupo = [[] for _ in self.grupos_recursos]
+        self.versao_grupo = [0] * len(self.grupos_recursos)
+
+        self.candidatas_por_recurso = [set() for _ in self.recursos_proc]
+        self.espera_corrente = [0.0] * len(self.recursos_proc)
+        self.espera_acumulada = [0.0] * len(self.recursos_proc)
+        self.heap = []
+        # Número de operações já agendadas quando cada recurso atrasou uma
+        # candidata pela primeira vez (None enquanto não atrasou nenhuma).
+        self.primeira_espera = [None] * len(self.recursos_proc)
+        # Estados copiados durante ``despachar(intervalo_controle=...)``.
+        self.pontos_controle = []
+        # Operações agendadas, na ordem de despacho, em colunas pré-alocadas:
+        # índice do ensaio, índice da etapa, início e fim.
+        self.n_operacoes = sum(len(etapas_job) for etapas_job in self.job_stages)
+        self.agenda_job = np.empty(self.n_operacoes, dtype=np.int64)
+        self.agenda_etapa = np.empty(self.n_operacoes, dtype=np.int64)
+        self.agenda_inicio = np.empty(self.n_operacoes)
+        self.agenda_fim = np.empty(self.n_operacoes)
+        self.n_agendadas = 0
+        self.ativar(range(n_jobs) if ativos is None else ativos)
+
+    # Atributos na ordem em que ``__init__`` os cria. ``copiar`` monta a cópia
+    # atributo a atributo, sem ler ``__dict__``: no CPython, ler o ``__dict__``
+    # de uma instância desfaz o armazenamento compacto dos atributos e deixa
+    # todos os acessos seguintes do despacho mais lentos.
+    _ATRIBUTOS = (
+        'ensaios', 'contabilizar_esperas', 'p', 'incidencia', 'etapas_proc', 'recursos_proc', 'liberacao', 'p_total', 'job_stages',
+        'modelo_job', 'pools', 'disponivel_em', 'proxima_etapa', 'membros_candidata', 'chave_candidata',
+        'pronto_candidata', 'recursos_candidata', 'inicio_candidata', 'espera_candidata', 'gargalo_candidata',
+        'versao', 'candidata_por_chave', 'candidatas_livres', 'grupo_tipo_etapa', 'grupos_recursos',
+        'grupos_por_recurso', 'grupo_candidata', 'prontas_grupo', 'futuras_grupo', 'versao_grupo', 'candidatas_por_recurso', 'espera_corrente',
+        'espera_acumulada', 'heap', 'primeira_espera', 'pontos_controle', 'n_operacoes', 'agenda_job',
+        'agenda_etapa', 'agenda_inicio', 'agenda_fim', 'n_agendadas',
+    )
+    # Parâmetros dos ensaios e contadores, que a cópia não precisa duplicar.
+    _COMPARTILHADOS = frozenset((
+        'ensaios', 'contabilizar_esperas', 'p', 'incidencia', 'etapas_proc', 'recursos_proc', 'liberacao', 'p_total', 'job_stages',
+        'modelo_job', 'grupo_tipo_etapa', 'grupos_recursos', 'grupos_por_recurso', 'n_operacoes', 'n_agendadas',
+    ))
+
+    def copiar(self, compacta=False):
+        """
+        Cópia independente do estado, compartilhando os parâmetros dos ensaios.
+
+        Com ``compacta``, a agenda copiada guarda só as operações já agendadas;
+        o espaço das demais é realocado quando a cópia voltar a despachar.
+        """
+        copia = MotorDespacho.__new__(MotorDespacho)
+        fim_copia = self.n_agendadas if compacta else None
+        for nome in self._ATRIBUTOS:
+            valor = getattr(self, nome)
+            if nome in self._COMPARTILHADOS:
+                pass
+            elif nome == 'pools':
+                valor = [pool.copiar() for pool in valor]
+            elif nome == 'candidatas_por_recurso':
+                valor = [set(c) for c in valor]
+            elif nome in ('prontas_grupo', 'futuras_grupo'):
+                valor = [list(heap) for heap in valor]
+            elif nome == 'membros_candidata':
+                valor = [None if membros is None else list(membros) for membros in valor]
+            elif nome == 'candidata_por_chave':
+                valor = dict(valor)
+            elif nome == 'pontos_controle':
+                valor = []
+            elif isinstance(valor, np.ndarray):
+                valor = valor[:fim_copia].copy()
+            else:
+                valor = list(valor)
+            setattr(copia, nome, valor)
+        return copia
+
+    def ampliar(self, capacidade_recurso):
+        """
+        Acrescenta instâncias aos recursos cuja capacidade em
+        ``capacidade_recurso`` é maior que a atual.
+
+        As novas instâncias ficam livres desde o instante 0 e as candidatas
+        que dependem desses recursos são reavaliadas. O resultado é o mesmo de
+        simular a nova configuração desde o início enquanto nenhum dos
+        recursos ampliados tiver atrasado uma operação antes deste ponto.
+        """
+        for r, res in enumerate(self.recursos_proc):
+            if capacidade_recurso.get(res, 1) > len(self.pools[r]):
+                self.pools[r].ampliar(capacidade_recurso.get(res, 1))
+                self.disponivel_em[r] = self.pools[r].disponivel_em()
+                if not self.contabilizar_esperas:
+                    # A disponibilidade dos grupos do recurso pode ter diminuído:
+                    # as candidatas prontas voltam a ser conferidas pelo instante
+                    # em que ficam prontas.
+                    for g in self.grupos_por_recurso[r]:
+                        for liberacao, total, i, c, v in self.prontas_grupo[g]:
+                            heapq.heappush(self.futuras_grupo[g], (self.pronto_candidata[c], liberacao, total, i, c, v))
+                        self.prontas_grupo[g] = []
+                        self._atualizar_grupo(g)
+                    continue
+                for c in self.candidatas_por_recurso[r]:
+                    if self._avaliar(c) != (self.inicio_candidata[c], self.espera_candidata[c], self.gargalo_candidata[c]):
+                        self._retirar(c)
+                        self._publicar(c)
+
+    def _avaliar(self, c):
+        """Calcula início, espera e gargalo de cada ensaio da candidata ``c``."""
+        disponivel_em = self.disponivel_em
+        resources_ready_at = 0
+        bottleneck_resource = None
+        for r in self.recursos_candidata[c]:
+            current_res_ready_at = disponivel_em[r]
+            if current_res_ready_at > resources_ready_at:
+                resources_ready_at = current_res_ready_at
+                bottleneck_resource = r
+        earliest_start_time = max(self.pronto_candidata[c], resources_ready_at)
+        wait_time = earliest_start_time - self.pronto_candidata[c]
+        if wait_time > 0 and bottleneck_resource is not None:
+            if self.primeira_espera[bottleneck_resource] is None:
+                self.primeira_espera[bottleneck_resource] = self.n_agendadas
+            if wait_time > TOLERANCIA:
+                return earliest_start_time, wait_time, bottleneck_resource
+        return earliest_start_time, 0.0, None
+
+    def _publicar(self, c):
+        """
+        Registra a candidata ``c`` no heap e na espera corrente (ou no seu grupo).
+
+        A chave no heap é a do ensaio de menor índice do lote, o primeiro que o
+        despacho individual escolheria entre ensaios com a mesma avaliação.
+        """
+        if not self.contabilizar_esperas:
+            i = self.membros_candidata[c][0]
+            self.versao[c] += 1
+            g = self.grupo_candidata[c]
+            heapq.heappush(self.futuras_grupo[g], (self.pronto_candidata[c], self.liberacao[i], self.p_total[i], i, c, self.versao[c]))
+            self._atualizar_grupo(g)
+            return
+        inicio, espera, gargalo = self._avaliar(c)
+        self.inicio_candidata[c], self.espera_candidata[c], self.gargalo_candidata[c] = inicio, espera, gargalo
+        membros = self.membros_candidata[c]
+        if gargalo is not None:
+            self.espera_corrente[gargalo] += espera * len(membros)
+        self.versao[c] += 1
+        i = membros[0]
+        heapq.heappush(self.heap, (inicio, self.liberacao[i], self.p_total[i], i, c, self.versao[c]))
+
+    def _melhor_do_grupo(self, g):
+        """Chave (início, liberação, tempo total, ensaio) da melhor candidata do grupo ``g``, ou None."""
+        disponivel = max((self.disponivel_em[r] for r in self.grupos_recursos[g]), default=0)
+        prontas, futuras, versao = self.prontas_grupo[g], self.futuras_grupo[g], self.versao
+        # A disponibilidade só cresce durante o despacho: uma candidata pronta
+        # continua pronta e começa quando o grupo fica disponível.
+        while futuras and (futuras[0][5] != versao[futuras[0][4]] or futuras[0][0] <= disponivel):
+            pronto, liberacao, total, i, c, v = heapq.heappop(futuras)
+            if v == versao[c]:
+                heapq.heappush(prontas, (liberacao, total, i, c, v))
+        while prontas and prontas[0][4] != versao[prontas[0][3]]:
+            heapq.heappop(prontas)
+        melhor = None
+        if prontas:
+            liberacao, total, i, _, _ = prontas[0]
+            melhor = (disponivel, liberacao, total, i)
+        if futuras and (melhor is None or futuras[0][:4] < melhor):
+            melhor = futuras[0][:4]
+        return melhor
+
+    def _atualizar_grupo(self, g):
+        """Publica no heap principal a melhor candidata do grupo ``g``, invalidando a anterior."""
+        self.versao_grupo[g] += 1
+        melhor = self._melhor_do_grupo(g)
+        if melhor is not None:
+            heapq.heappush(self.heap, melhor + (g, self.versao_grupo[g]))
+
+    def _extrair_do_grupo(self):
+        """Tira do heap principal e do seu grupo a próxima candidata; devolve (início, ensaio, candidata)."""
+        inicio, _, _, i, g, _ = heapq.heappop(self.heap)
+        prontas = self.prontas_grupo[g]
+        if prontas and prontas[0][2] == i:
+            c = heapq.heappop(prontas)[3]
+        else:
+            c = heapq.heappop(self.futuras_grupo[g])[4]
+        return inicio, i, c
+
+    def _retirar(self, c):
+        """Remove a candidata ``c`` da espera corrente; os membros só mudam entre ``_retirar`` e ``_publicar``."""
+        if self.gargalo_candidata[c] is not None:
+            self.espera_corrente[self.gargalo_candidata[c]] -= self.espera_candidata[c] * len(self.membros_candidata[c])
+            self.gargalo_candidata[c] = None
+
+    def _nova_candidata(self, i, pronto):
+        """Coloca a próxima etapa do ensaio ``i``, pronta em ``pronto``, no lote dos ensaios idênticos a ele."""
+        chave = (self.modelo_job[i], self.proxima_etapa[i], pronto, self.liberacao[i])
+        c = self.candidata_por_chave.get(chave)
+        if c is None:
+            c = self.candidatas_livres.pop()
+            self.candidata_por_chave[chave] = c
+            self.chave_candidata[c] = chave
+            self.membros_candidata[c] = [i]
+            self.pronto_candidata[c] = pronto
+            k = self.job_stages[i][self.proxima_etapa[i]]
+            self.recursos_candidata[c] = self.incidencia.recursos(i, k)
+            self.grupo_candidata[c] = self.grupo_tipo_etapa[self.incidencia.tipo_job[i]][k]
+            for r in self.recursos_candidata[c]:
+                self.candidatas_por_recurso[r].add(c)
+        else:
+            self._retirar(c)
+            heapq.heappush(self.membros_candidata[c], i)
+        self._publicar(c)
+
+    def ativar(self, indices):
+        """
+        Passa a considerar os ensaios ``indices`` no despacho.
+
+        A espera que esses ensaios acumulariam antes do ponto atual do
+        despacho não é contabilizada; o agendamento é o mesmo de uma
+        simulação com eles ativos desde o início.
+        """
+        for i in indices:
+            if self.job_stages[i]:
+                self._nova_candidata(i, self.liberacao[i])
+
+    def proximo_inicio(self):
+        """Início da próxima operação a ser despachada, ou None se não houver."""
+        # Sem ``contabilizar_esperas``, as entradas do heap são dos grupos.
+        heap = self.heap
+        versao = self.versao if self.contabilizar_esperas else self.versao_grupo
+        while heap and heap[0][5] != versao[heap[0][4]]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def despachar(self, ate=None, intervalo_controle=None, ao_despachar=None):
+        """
+        Despacha operações até esgotar as candidatas ou, com ``ate``, até a
+        próxima operação começar em ``ate`` ou depois.
+
+        Com ``intervalo_controle``, uma cópia compacta do estado é guardada em
+        ``pontos_controle`` a cada ``intervalo_controle`` operações agendadas
+        e ao final, junto com o número de operações agendadas até ela.
+
+        Com ``ao_despachar``, ``ao_despachar(agendadas, total)`` é chamada a
+        cada ``INTERVALO_AVISO_DESPACHO`` operações; se ela levantar uma
+        exceção (``SimulacaoCancelada``), o despacho para ali.
+        """
+        if len(self.agenda_job) < self.n_operacoes:
+            # Estado restaurado de uma cópia compacta.
+            for nome in ('agenda_job', 'agenda_etapa', 'agenda_inicio', 'agenda_fim'):
+                agenda = getattr(self, nome)
+                ampliada = np.empty(self.n_operacoes, dtype=agenda.dtype)
+                ampliada[:len(agenda)] = agenda
+                setattr(self, nome, ampliada)
+        heap = self.heap
+        espera_corrente, espera_acumulada = self.espera_corrente, self.espera_acumulada
+        disponivel_em, pools = self.disponivel_em, self.pools
+        candidatas_por_recurso, inicio_candidata = self.candidatas_por_recurso, self.inicio_candidata
+        recursos_candidata, proxima_etapa, job_stages = self.recursos_candidata, self.proxima_etapa, self.job_stages
+        membros_candidata = self.membros_candidata
+        ensaios, p, etapas_proc = self.ensaios, self.p, self.etapas_proc
+        agenda_job, agenda_etapa, agenda_inicio, agenda_fim = self.agenda_job, self.agenda_etapa, self.agenda_inicio, self.agenda_fim
+        n_agendadas = self.n_agendadas
+        contabilizar_esperas = self.contabilizar_esperas
+
+        while True:
+            if intervalo_controle and n_agendadas % intervalo_controle == 0:
+                self.pontos_controle.append((n_agendadas, self.copiar(compacta=True)))
+            if ao_despachar and n_agendadas % INTERVALO_AVISO_DESPACHO == 0:
+                ao_despachar(n_agendadas, self.n_operacoes)
+            proximo = self.proximo_inicio()
+            if proximo is None or (ate is not None and proximo >= ate):
+                break
+            # A espera de todas as candidatas pendentes é acumulada a cada despacho.
+            if contabilizar_esperas:
+                for r, espera in enumerate(espera_corrente):
+                    if espera:
+                        espera_acumulada[r] += espera
+
+            if contabilizar_esperas:
+                start_time, _, _, i, c, _ = heapq.heappop(heap)
+            else:
+                start_time, i, c = self._extrair_do_grupo()
+                # A candidata pode ser reaproveitada abaixo para outro grupo.
+                grupos = {self.grupo_candidata[c]}
+            k = job_stages[i][proxima_etapa[i]]
+            end_time = start_time + p.get(ensaios[i], {}).get(etapas_proc[k], 0)
+            agenda_job[n_agendadas] = i
+            agenda_etapa[n_agendadas] = k
+            agenda_inicio[n_agendadas] = start_time
+            agenda_fim[n_agendadas] = end_time
+            n_agendadas += 1
+            self.n_agendadas = n_agendadas
+
+            # O ensaio sai do lote; o restante continua como candidata.
+            self._retirar(c)
+            membros = membros_candidata[c]
+            heapq.heappop(membros)
+            recursos = recursos_candidata[c]
+            if not membros:
+                del self.candidata_por_chave[self.chave_candidata[c]]
+                for r in recursos:
+                    candidatas_por_recurso[r].discard(c)
+                self.candidatas_livres.append(c)
+            recursos_alterados = []
+            for r in recursos:
+                novo_minimo = pools[r].ocupar(start_time, end_time)
+                if novo_minimo != disponivel_em[r]:
+                    disponivel_em[r] = novo_minimo
+                    recursos_alterados.append(r)
+            if membros:
+                self._publicar(c)
+
+            proxima_etapa[i] += 1
+            if proxima_etapa[i] < len(job_stages[i]):
+                self._nova_candidata(i, end_time)
+
+            # Só as candidatas que dependem de um recurso alterado, e cujo início
+            # pode ter sido afetado, são reavaliadas (sem contabilizar as
+            # esperas, só os grupos desses recursos e o da candidata despachada).
+            if not contabilizar_esperas:
+                for r in recursos_alterados:
+                    grupos.update(self.grupos_por_recurso[r])
+                for g in grupos:
+                    self._atualizar_grupo(g)
+                continue
+            afetadas = set()
+            for r in recursos_alterados:
+                novo_minimo = disponivel_em[r]
+                afetadas.update(c for c in candidatas_por_recurso[r] if novo_minimo >= inicio_candidata[c])
+            for c in afetadas:
+                self._retirar(c)
+                self._publicar(c)
+        if intervalo_controle and (not self.pontos_controle or self.pontos_controle[-1][0] != n_agendadas):
+            self.pontos_controle.append((n_agendadas, self.copiar(compacta=True)))
+
+    def agenda_colunar(self):
+        """
+        Operações agendadas até aqui, na ordem de despacho.
+
+        Returns:
+            tuple: arrays (índice do ensaio, índice da etapa, início, fim).
+        """
+        n = self.n_agendadas
+        return self.agenda_job[:n], self.agenda_etapa[:n], self.agenda_inicio[:n], self.agenda_fim[:n]
+
+    def makespan(self):
+        return self.agenda_fim[:self.n_agendadas].max() if self.n_agendadas else 0
+
+    def espera_por_recurso(self):
+        """Tempo de espera acumulado (h) por recurso, só com os recursos que tiveram espera."""
+        total_wait_time_per_resource = defaultdict(float)
+        for r, espera in enumerate(self.espera_acumulada):
+            if espera:
+                total_wait_time_per_resource[self.recursos_proc[r]] = espera
+        return total_wait_time_per_resource
+
+    def tempo_ocupado_por_recurso(self):
+        """
+        Tempo ocupado (h) somado sobre as instâncias de cada recurso.
+
+        As durações são somadas por (tipo de ensaio, etapa) e multiplicadas
+        pela matriz de incidência, sem percorrer as operações uma a uma.
+        """
+        job, etapa, inicio, fim = self.agenda_colunar()
+        incidencia = self.incidencia
+        matriz = incidencia.matriz()
+        n_tipos, n_etapas, n_recursos = matriz.shape
+        tipo = np.asarray(incidencia.tipo_job, dtype=np.int64)[job]
+        por_tipo_etapa = np.bincount(tipo * n_etapas + etapa, weights=fim - inicio, minlength=n_tipos * n_etapas)
+        ocupado = por_tipo_etapa @ matriz.reshape(n_tipos * n_etapas, n_recursos)
+        return dict(zip(self.recursos_proc, ocupado.tolist()))
+
+    def agenda_df(self):
+        """Agenda como DataFrame com as colunas ['Job', 'Etapa', 'Início', 'Fim']."""
+        job, etapa, inicio, fim = self.agenda_colunar()
+        return pd.DataFrame({
+            'Job': np.asarray(self.ensaios, dtype=object)[job],
+            'Etapa': np.asarray(self.etapas_proc, dtype=object)[etapa],
+            'Início': inicio,
+            'Fim': fim,
+        })
+
+    def resultado(self):
+        """
+        Returns:
+            tuple: (makespan, schedule_df, tempo de espera acumulado por recurso).
+        """
+        return self.makespan(), self.agenda_df(), self.espera_por_recurso()
+
+
+class SimuladorIncremental:
+    """
+    Simula várias configurações de recursos dos mesmos ensaios reaproveitando
+    o trecho inicial comum das agendas.
+
+    Mais instâncias de um recurso não mudam nenhum despacho anterior ao
+    primeiro em que esse recurso atrasou uma operação. Cada simulação guarda
+    ``num_pontos`` pontos de controle; uma configuração com capacidades iguais
+    ou maiores que as de uma simulação já feita é retomada do último ponto de
+    controle anterior ao primeiro atraso dos recursos ampliados, em vez de
+    começar do instante 0. As ``max_execucoes`` simulações usadas mais
+    recentemente ficam guardadas.
+
+    ``retomadas`` conta as simulações retomadas de um ponto de controle, e
+    ``operacoes_reaproveitadas`` soma as operações que elas não despacharam
+    de novo.
+    """
+
+    def __init__(self, ensaios, p, r_j, incidencia, num_pontos=16, max_execucoes=4):
+        self.ensaios = ensaios
+        self.p = p
+        self.r_j = r_j
+        self.incidencia = incidencia
+        self.num_pontos = num_pontos
+        self.max_execucoes = max_execucoes
+        self.execucoes = []
+        self.retomadas = 0
+        self.operacoes_reaproveitadas = 0
+
+    def _ponto_de_retomada(self, capacidade_recurso):
+        """Ponto de controle mais adiantado de onde ``capacidade_recurso`` pode ser retomada."""
+        melhor = None
+        for execucao in self.execucoes:
+            capacidades, motor = execucao
+            ampliados = [r for r, res in enumerate(self.incidencia.recursos_proc)
+                         if capacidade_recurso.get(res, 1) != capacidades[r]]
+            if any(capacidade_recurso.get(self.incidencia.recursos_proc[r], 1) < capacidades[r] for r in ampliados):
+                continue
+            limite = min((motor.primeira_espera[r] for r in ampliados if motor.primeira_espera[r] is not None),
+                         default=motor.n_agendadas)
+            for n_agendadas, ponto in reversed(motor.pontos_controle):
+                if n_agendadas <= limite:
+                    if melhor is None or n_agendadas > melhor[0]:
+                        melhor = (n_agendadas, ponto, execucao)
+                    break
+        return melhor
+
+    def simular(self, capacidade_recurso, ao_despachar=None):
+        """
+        ``ao_despachar`` é repassada a ``MotorDespacho.despachar``; uma
+        simulação interrompida por ela não vira ponto de retomada.
+
+        Returns:
+            MotorDespacho: o motor com todas as operações despachadas.
+        """
+        retomada = self._ponto_de_retomada(capacidade_recurso)
+        if retomada is None:
+            motor = MotorDespacho(self.ensaios, self.p, self.r_j, self.incidencia, capacidade_recurso)
+        else:
+            n_agendadas, ponto, execucao = retomada
+            self.retomadas += 1
+            self.operacoes_reaproveitadas += n_agendadas
+            self.execucoes.remove(execucao)
+            self.execucoes.append(execucao)
+            motor = ponto.copiar()
+            motor.ampliar(capacidade_recurso)
+        motor.despachar(intervalo_controle=max(1, -(-motor.n_operacoes // self.num_pontos)), ao_despachar=ao_despachar)
+        capacidades = [len(pool) for pool in motor.pools]
+        self.execucoes.append((capacidades, motor))
+        if len(self.execucoes) > self.max_execucoes:
+            self.execucoes.pop(0)
+        return motor
+
+
+def executar_heuristica(ensaios, p, r_j, incidencia, capacidade_recurso):
+    """
+    Executa a simulação de eventos discretos para uma configuração de recursos.
+
+    O resultado é o mesmo da varredura completa de candidatas: a cada despacho
+    vence a menor chave (início, liberação, tempo total). Empates exatos, que
+    antes dependiam da ordem de iteração de um ``set``, são resolvidos pela
+    ordem do ensaio em ``ensaios``.
+
+    Args:
+        incidencia (IncidenciaRecursos): recursos exigidos por etapa, já
+            compilados em ``parametros_ensaios``.
+
+    Returns:
+        tuple: (makespan, schedule_df, tempo de espera acumulado por recurso).
+    """
+    motor = MotorDespacho(ensaios, p, r_j, incidencia, capacidade_recurso)
+    motor.despachar()
+    return motor.resultado()
+
+
+def executar_analise_gargalo(ensaios, p, r_j, incidencia, capacidade_recurso, ao_despachar=None):
+    """
+    Executa a simulação e devolve só o necessário para a análise de gargalo,
+    sem montar a agenda como DataFrame. ``ao_despachar`` é repassada a
+    ``MotorDespacho.despachar``.
+
+    Returns:
+        tuple: (makespan, tempo ocupado por recurso, tempo de espera acumulado por recurso).
+    """
+    motor = MotorDespacho(ensaios, p, r_j, incidencia, capacidade_recurso)
+    motor.despachar(ao_despachar=ao_despachar)
+    return motor.makespan(), motor.tempo_ocupado_por_recurso(), motor.espera_por_recurso()
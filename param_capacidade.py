@@ -1,10 +1,185 @@
+import time
 import pandas as pd
 import numpy as np
-import re
 from datetime import datetime, timedelta
 from collections import defaultdict
+import math
+from contextlib import nullcontext
 
-def calcular_parametros_completos(df, PRAZO_DIAS, DEVIATION_TOLERANCE, num_simu, recursos_fixos):
+import motor_heuristica
+from execucao_fundo import PoolDeProcessos, executar_em_processos
+from parametros_ensaios import parametrizar_ensaios
+
+# Parâmetros da demanda carregados uma vez em cada processo do pool.
+_PARAMETROS_PROCESSO = None
+
+def _iniciar_processo(ensaios, p, r_j, incidencia):
+    global _PARAMETROS_PROCESSO
+    _PARAMETROS_PROCESSO = (ensaios, p, r_j, incidencia)
+
+def _analisar_configuracao(ensaios, p, r_j, incidencia, capacidade_recurso, ao_progredir=None):
+    ao_despachar = None
+    if ao_progredir:
+        def ao_despachar(agendadas, total):
+            ao_progredir(agendadas / total, f"{agendadas}/{total} operações despachadas", operacoes=agendadas, total_operacoes=total)
+    return motor_heuristica.executar_analise_gargalo(ensaios, p, r_j, incidencia, capacidade_recurso, ao_despachar)
+
+def _simular_configuracao(capacidade_recurso, ao_progredir=None):
+    return _analisar_configuracao(*_PARAMETROS_PROCESSO, capacidade_recurso, ao_progredir)
+
+def pool_de_configuracoes(ensaios, p, r_j, incidencia, max_workers=None, com_avisos=False):
+    """
+    ``execucao_fundo.PoolDeProcessos`` para ``simular_configuracoes_em_paralelo``,
+    com os parâmetros da demanda carregados uma única vez em cada processo.
+    """
+    return PoolDeProcessos(max_workers, com_avisos=com_avisos, inicializar=_iniciar_processo, dados=(ensaios, p, r_j, incidencia))
+
+def simular_configuracoes_em_paralelo(ensaios, p, r_j, incidencia, configuracoes, max_workers=None, pool=None, ao_progredir=None):
+    """
+    Simula várias configurações de recursos ao mesmo tempo em um pool de processos.
+
+    Cada simulação é independente. Com ``pool`` (de ``pool_de_configuracoes``,
+    para os mesmos parâmetros), os processos dele são reaproveitados; sem ele,
+    um pool é criado só para esta chamada, e com um único processo as
+    configurações são simuladas em sequência, sem pool.
+
+    Com ``ao_progredir``, ``ao_progredir(indice, fracao, texto, **detalhes)``
+    recebe o despacho de cada configuração; se ela levantar
+    ``motor_heuristica.SimulacaoCancelada``, as simulações param (ver
+    ``execucao_fundo.PoolDeProcessos``). Retorna os resultados de
+    ``motor_heuristica.executar_analise_gargalo`` na mesma ordem de ``configuracoes``.
+    """
+    tarefas = [(configuracao,) for configuracao in configuracoes]
+    if pool is not None:
+        return pool.executar(_simular_configuracao, tarefas, ao_progredir)
+    workers = min(max_workers or len(configuracoes), len(configuracoes))
+    if workers <= 1:
+        return [
+            _analisar_configuracao(ensaios, p, r_j, incidencia, c,
+                                   (lambda fracao, texto, i=i, **detalhes: ao_progredir(i, fracao, texto, **detalhes)) if ao_progredir else None)
+            for i, c in enumerate(configuracoes)
+        ]
+    with pool_de_configuracoes(ensaios, p, r_j, incidencia, workers, com_avisos=ao_progredir is not None) as pool:
+        return pool.executar(_simular_configuracao, tarefas, ao_progredir)
+
+# =========================================================================
+#         LIMITES INFERIORES ANALÍTICOS DO MAKESPAN
+# =========================================================================
+def calcular_carga_recursos(ensaios, p, r_j, incidencia):
+    """
+    Conteúdo de trabalho de cada recurso, acumulado por data de liberação.
+
+    Os ensaios liberados em ``t`` ou depois precisam de pelo menos
+    ``carga(t) / capacidade`` horas do recurso após ``t``, então
+    ``t + carga(t) / capacidade`` é um limite inferior do makespan para
+    qualquer escala, inclusive a da heurística.
+
+    Returns:
+        tuple: (datas de liberação distintas em ordem decrescente, matriz
+        liberações × recursos com a carga (h) dos ensaios liberados a partir
+        de cada data, maior liberação + duração total de um único ensaio).
+    """
+    etapas_proc = incidencia.etapas_proc
+    matriz = incidencia.matriz()
+    n_recursos = len(incidencia.recursos_proc)
+    # Carga e duração total calculadas uma vez por (modelo de durações, tipo).
+    por_modelo = {}
+    carga_job = np.zeros((len(ensaios), n_recursos))
+    duracao_job = np.zeros(len(ensaios))
+    for i, job in enumerate(ensaios):
+        p_job = p.get(job, {})
+        chave = (id(p_job), incidencia.tipo_job[i])
+        if chave not in por_modelo:
+            duracoes = np.array([p_job.get(etapa, 0) for etapa in etapas_proc], dtype=float)
+            por_modelo[chave] = (duracoes @ matriz[incidencia.tipo_job[i]], duracoes.sum())
+        carga_job[i], duracao_job[i] = por_modelo[chave]
+
+    liberacao = np.array([r_j.get(job, 0) for job in ensaios], dtype=float)
+    ordem = np.argsort(-liberacao, kind='stable')
+    carga_acumulada = np.cumsum(carga_job[ordem], axis=0)
+    liberacao_ordenada = liberacao[ordem]
+    # Para cada data distinta fica a carga de todos os ensaios liberados a partir dela.
+    ultimo_da_data = np.flatnonzero(np.r_[liberacao_ordenada[1:] != liberacao_ordenada[:-1], True])
+    caminho = float((liberacao + duracao_job).max()) if len(ensaios) else 0.0
+    return liberacao_ordenada[ultimo_da_data], carga_acumulada[ultimo_da_data], caminho
+
+def limite_inferior_makespan(carga, capacidades):
+    """
+    Limite inferior do makespan para o vetor de capacidades (na ordem de ``recursos_proc``).
+
+    Returns:
+        tuple: (limite inferior (h), limite de cada recurso (h)).
+    """
+    liberacoes, carga_acumulada, caminho = carga
+    if len(liberacoes) == 0:
+        return 0.0, np.zeros(len(capacidades))
+    capacidades = np.maximum(np.asarray(capacidades, dtype=float), 1e-9)
+    limites = (liberacoes[:, None] + carga_acumulada / capacidades).max(axis=0)
+    # Recursos sem carga não limitam o makespan.
+    limites = np.where(carga_acumulada[-1] > 0, limites, 0.0)
+    return max(float(limites.max()), caminho), limites
+
+def capacidade_minima(carga, prazo_horas):
+    """
+    Menor capacidade de cada recurso para a qual o limite inferior não passa de
+    ``prazo_horas``; ``inf`` quando nenhuma capacidade é suficiente (carga
+    liberada depois do prazo).
+    """
+    liberacoes, carga_acumulada, _ = carga
+    if len(liberacoes) == 0:
+        return np.zeros(carga_acumulada.shape[1])
+    folga = prazo_horas - liberacoes[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        necessaria = np.where(carga_acumulada > 0, np.where(folga > 0, carga_acumulada / folga, np.inf), 0.0)
+    return np.maximum(np.ceil(necessaria.max(axis=0) - 1e-9), 0)
+
+# Estratégias de dimensionamento: 'incremental' (padrão) soma +1 ao gargalo a
+# cada iteração; 'bissecao', opcional, faz busca exponencial e depois binária
+# na quantidade do gargalo até ele deixar de ser o gargalo (ou a meta ser
+# atendida), e pode recomendar configurações diferentes da incremental.
+ESTRATEGIA_PADRAO = 'incremental'
+# Maior passo da fase exponencial (+1, +2, +4, ..., +32).
+MAX_PASSO_BUSCA = 32
+
+def calcular_parametros_completos(df, PRAZO_DIAS, DEVIATION_TOLERANCE, num_simu, recursos_fixos, num_candidatos=1, max_workers=None,
+                                  estrategia=ESTRATEGIA_PADRAO, tempos=None, ao_progredir=None):
+    """
+    Dimensiona os recursos até o makespan atender ao prazo.
+
+    Com ``estrategia='incremental'``, cada iteração soma +1 ao gargalo; com
+    ``num_candidatos`` > 1, os ``num_candidatos`` maiores gargalos recebem +1
+    em configurações separadas, simuladas em paralelo em até ``max_workers``
+    processos, e a que produzir o menor makespan é mantida.
+
+    Com ``estrategia='bissecao'``, cada iteração procura a menor quantidade do
+    gargalo que o tira da posição de gargalo (ou atende à meta): testa +1, +2,
+    +4, ... e depois faz busca binária no último intervalo, em O(log k)
+    simulações em vez de k. Essa estratégia também usa o limite inferior
+    analítico: na primeira iteração, os recursos livres abaixo da capacidade
+    mínima exigida por ele saltam direto para ela (no máximo
+    +MAX_PASSO_BUSCA), e, se nem com os recursos livres ilimitados o limite
+    atende à meta (recursos fixos ou liberações tardias), o dimensionamento
+    para depois da configuração inicial. A estratégia incremental só avisa
+    que a meta é inalcançável e segue reduzindo o makespan.
+
+    Com ``tempos`` (dict), registra nele os segundos gastos em cada etapa:
+    'parametrizacao', 'despacho' (as simulações), 'pos_processamento' (análise
+    de gargalo e agregações) e 'total'.
+
+    Com ``ao_progredir``, ``ao_progredir(fracao, texto, **detalhes)`` é
+    chamada a cada iteração e durante cada simulação, com os detalhes
+    'iteracao', 'melhor_makespan' (o menor simulado até aqui) e, no
+    despacho, 'operacoes' e 'total_operacoes'. Se ela levantar
+    ``motor_heuristica.SimulacaoCancelada``, o dimensionamento para ali.
+
+    Returns:
+        tuple: (melhor configuração, makespan dela, análise de gargalo dela,
+        makespan da configuração inicial, análise de gargalo da inicial,
+        histórico com cada configuração simulada e o seu makespan).
+    """
+    inicio_total = time.perf_counter()
+    tempos = {} if tempos is None else tempos
+    tempos['despacho'] = 0.0
     HORAS_POR_DIA = 24
     PRAZO_EM_HORAS = PRAZO_DIAS * HORAS_POR_DIA
     prazo_aceitavel_em_horas = PRAZO_EM_HORAS * (1 + DEVIATION_TOLERANCE)
@@ -17,210 +192,47 @@ def calcular_parametros_completos(df, PRAZO_DIAS, DEVIATION_TOLERANCE, num_simu,
     df['Job'] = ['J' + str(i) for i in range(len(df))]
     #df['Início Plan Atual'] = pd.to_datetime(df['Início Plan Atual'], dayfirst=True)
     #hoje = df['Início Plan Atual'].min()
-    def calcular_release_date(data_bl):
-        dias_diff = data_bl
-        return dias_diff * 24 + 7
-    df['Release Date'] = df['Início Plan Atual'].apply(calcular_release_date)
-    def prep_ativa_horas(tipo):
-        minutos = 60 if tipo == 'Deformada' else 30
-        return minutos / 60.0
-    df['Prep_Ativa'] = df['Tipo Amostra'].apply(prep_ativa_horas)
-    df['Prep_Espera'] = df['Tipo Amostra'].apply(lambda tipo: 24.0 if tipo == 'Deformada' else 0.0)
-    def tempo_formacao_horas(tipo):
-        minutos = 30 if tipo == 'Deformada' else 10
-        return minutos / 60.0
-    df['Tarugo'] = df['Tipo Amostra'].apply(tempo_formacao_horas)
-    df['Montagem Célula'] = 10 / 60.0
-    ensaios_com_saturacao = ["QCSD", "BE", "BEP"]
-    def tem_saturacao(ensaio):
-        if isinstance(ensaio, str):
-            return 'sat' in ensaio.lower() or ensaio in ensaios_com_saturacao
-        return False
-    def saturacao_agua(ensaio, nome_amostra):
-        if not tem_saturacao(ensaio): return 0.0
-        if 'aren' in str(nome_amostra).lower(): return 12.0
-        else: return 24.0
-    def saturacao_co2(ensaio):
-        return (20/60.0) if tem_saturacao(ensaio) else 0.0
-    def contrapressao(ensaio):
-        return 4.5 if tem_saturacao(ensaio) else 0.0
-    df['Sat H2O'] = df.apply(lambda row: saturacao_agua(row['Ensaio'], row['Nome Amostra']), axis=1)
-    df['Sat CO2'] = df['Ensaio'].apply(saturacao_co2)
-    df['Sat Contrapressao'] = df['Ensaio'].apply(contrapressao)
-    def tempo_adensamento_horas(nome_amostra):
-        nome = str(nome_amostra).lower()
-        return (40 / 60.0) if 'aren' in nome else 2.0
-    ensaios_sem_adensamento = ['UU', 'UUsat']
-    df['Adensamento'] = np.where(df['Ensaio'].isin(ensaios_sem_adensamento), 0.0, df['Nome Amostra'].apply(tempo_adensamento_horas))
-    def extrair_deformacao(texto):
-        if pd.isnull(texto): return 20
-        match = re.search(r'Deformação[:\s]*([0-9]+)%', texto)
-        if match: return int(match.group(1))
-        return 20
-    df['Deformacao (%)'] = df['Especificação Técnica Ensaio'].apply(extrair_deformacao)
-    def altura_tarugo(nome_ensaio):
-        if isinstance(nome_ensaio, str) and 'GD' in nome_ensaio: return 202
-        return 102
-    df['Altura Tarugo'] = df['Ensaio'].apply(altura_tarugo)
-    ensaios_drenados = ["CID", "CIDsat", "CADsat", "CCIDsat", "QCSD", "CIDsat/GD", "CCADsat"]
-    ensaios_nao_drenados = ["CIUsat", "CIU", "UU", "UUsat", "CAU", "CAUsat", "EIUsat", "CIUsat/GD", "PN", "CK0", "CCAUsat"]
-    def velocidade_carregamento(nome_ensaio):
-        if isinstance(nome_ensaio, str):
-            for drenado in ensaios_drenados:
-                if drenado in nome_ensaio: return 0.045
-            for nao_drenado in ensaios_nao_drenados:
-                if nao_drenado in nome_ensaio: return 0.09
-        return 0
-    df['Velocidade'] = df['Ensaio'].apply(velocidade_carregamento)
-    def rompido_na_prensa(nome_ensaio):
-        if any(tag in nome_ensaio for tag in ensaios_drenados + ensaios_nao_drenados): return True
-        return False
-    df['Rompido?'] = df['Ensaio'].apply(rompido_na_prensa)
-    def calcular_rompimento(row):
-        if not row['Rompido?']: return 0
-        deform, altura, vel = row['Deformacao (%)'], row['Altura Tarugo'], row['Velocidade']
-        if deform is None or vel is None or vel == 0: return 0
-        return ((altura * (deform / 100)) / vel) / 60
-    df['Rompimento'] = df.apply(calcular_rompimento, axis=1)
-    df['Desmontagem'] = 20 / 60.0
-    def definir_tipo_ensaio(nome_ensaio):
-        nome_ensaio = str(nome_ensaio)
-        if nome_ensaio.startswith('CC'): return 'Ciclico'
-        elif len(nome_ensaio) > 1 and nome_ensaio[1] == 'I': return 'Iso'
-        elif nome_ensaio.startswith('BE'): return 'Bender'
-        else: return 'Aniso'
-    df['Tipo Ensaio'] = df['Ensaio'].apply(definir_tipo_ensaio)
-    Parametros = df[['Job', 'Tipo Amostra', 'Ensaio', 'Tipo Ensaio', 'Release Date', 'Prep_Ativa', 'Prep_Espera', 'Tarugo', 'Montagem Célula', 'Sat CO2','Sat H2O','Sat Contrapressao', 'Adensamento', 'Rompimento', 'Desmontagem']].copy()
-    ensaios = Parametros['Job'].tolist()
-    tipos_ensaio = Parametros.set_index('Job')['Tipo Ensaio'].to_dict()
-    etapas_proc = ['Prep_Ativa', 'Prep_Espera', 'Tarugo', 'Montagem Célula', 'Sat_CO2', 'Sat_H2O', 'Sat_Contrapressao', 'Adensamento', 'Rompimento', 'Romp&Adensa', 'Desmontagem', 'Liberacao_Celula']
-    r_j = Parametros.set_index('Job')['Release Date'].to_dict()
-    p = {job: {} for job in ensaios}
-    def to_float(val):
-        try: return max(0.0, float(val))
-        except (ValueError, TypeError): return 0.0
-    for job in ensaios:
-        row = Parametros[Parametros['Job'] == job].iloc[0]
-        p[job]['Prep_Ativa'] = to_float(row['Prep_Ativa'])
-        p[job]['Prep_Espera'] = to_float(row['Prep_Espera'])
-        p[job]['Tarugo'] = to_float(row['Tarugo'])
-        p[job]['Montagem Célula'] = to_float(row['Montagem Célula'])
-        p[job]['Sat_CO2'] = to_float(row['Sat CO2'])
-        p[job]['Sat_H2O'] = to_float(row['Sat H2O'])
-        p[job]['Sat_Contrapressao'] = to_float(row['Sat Contrapressao'])
-        p[job]['Desmontagem'] = to_float(row['Desmontagem'])
-        p[job]['Liberacao_Celula'] = 0.0
-        tipo_do_ensaio = tipos_ensaio.get(job)
-        if tipo_do_ensaio in ['Aniso', 'Ciclico']:
-            p[job]['Romp&Adensa'] = to_float(row['Adensamento']) + to_float(row['Rompimento'])
-            p[job]['Adensamento'], p[job]['Rompimento'] = 0.0, 0.0
-        else:
-            p[job]['Romp&Adensa'] = 0.0
-            p[job]['Adensamento'], p[job]['Rompimento'] = to_float(row['Adensamento']), to_float(row['Rompimento'])
+    df['Release Date'] = df['Início Plan Atual'] * 24 + 7
     recursos_proc = ['BANCADA_PREP_ATIVA', 'BANCADA_TARUGO', 'BANCADA_MONTAGEM', 'LINHA_SAT_CO2', 'PAINEL_SAT_H2O', 'PAINEL_SAT_CP', 'BANCADA_ADEN_CONVENCIONAL', 'PRENSA_ROMP_ISO', 'PRENSA_ESPECIAL_ANISO_CICLICO', 'BANCADA_DESM', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER']
-    mapeamento_etapa_recurso = {
-        'Prep_Ativa': ['BANCADA_PREP_ATIVA'], 'Tarugo': ['BANCADA_TARUGO'], 'Montagem Célula': ['BANCADA_MONTAGEM', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'],
-        'Sat_CO2': ['LINHA_SAT_CO2', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'], 'Sat_H2O': ['PAINEL_SAT_H2O', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'],
-        'Sat_Contrapressao': ['PAINEL_SAT_CP', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'], 'Adensamento': ['BANCADA_ADEN_CONVENCIONAL', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'],
-        'Rompimento': ['PRENSA_ROMP_ISO', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'], 'Romp&Adensa': ['PRENSA_ESPECIAL_ANISO_CICLICO', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'],
-        'Desmontagem': ['BANCADA_DESM', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'],
-    }
     recursos_celulas = [recurso for recurso in recursos_proc if 'CELULA' in recurso]
-    Ajc = pd.DataFrame(0, index=ensaios, columns=recursos_celulas)
-    for job in ensaios:
-        tipo = tipos_ensaio.get(job)
-        if tipo == 'Bender':
-            if 'CELULA_BENDER' in Ajc.columns: Ajc.loc[job, 'CELULA_BENDER'] = 1
-        elif tipo == 'Ciclico':
-            if 'CELULA_CICLICO' in Ajc.columns: Ajc.loc[job, 'CELULA_CICLICO'] = 1
-        elif tipo in ['Iso', 'Aniso']:
-            if 'CELULA_CONVENCIONAL' in Ajc.columns: Ajc.loc[job, 'CELULA_CONVENCIONAL'] = 1
-    U = {}
-    for j in ensaios:
-        for m in etapas_proc:
-            if p.get(j, {}).get(m, 0) > 0:
-                recursos_potenciais = mapeamento_etapa_recurso.get(m, [])
-                for r in recursos_potenciais:
-                    if r in recursos_proc:
-                        if r in recursos_celulas:
-                            if Ajc.loc[j, r] == 1: U[j, m, r] = 1
-                        else: U[j, m, r] = 1
+    # Durações, tipos e incidência calculados de uma vez; U é só uma visão da incidência.
+    ensaios, p, r_j, U, incidencia = parametrizar_ensaios(df, df['Job'], df['Release Date'], recursos_proc)
+    # Nenhuma configuração com algum recurso abaixo da capacidade mínima do
+    # limite analítico atende ao prazo, então essas configurações nem são simuladas.
+    carga = calcular_carga_recursos(ensaios, p, r_j, incidencia)
+    capacidades_minimas = capacidade_minima(carga, prazo_aceitavel_em_horas)
     print("--- Parâmetros calculados com sucesso ---\n")
+    tempos['parametrizacao'] = time.perf_counter() - inicio_total
     # (Fim do seu código de parametrização)
 
     # =========================================================================
     #         PARTE 4: HEURÍSTICA DE SIMULAÇÃO (COM CÁLCULO DE ESPERA)
     # =========================================================================
-    def executar_heuristica(capacidade_recurso_cenario):
-        p_total = {job: sum(p.get(job, {}).get(stage, 0) for stage in p[job] if stage != 'Prep_Espera') for job in ensaios}
-        job_stages = {job: [etapa for etapa in etapas_proc if p.get(job, {}).get(etapa, 0) > 0] for job in ensaios}
-        schedule = defaultdict(dict)
-        
-        resource_instance_available_time = {res: [0] * capacidade_recurso_cenario.get(res, 1) for res in recursos_proc}
-        job_cell_assignment = {}
-        
-        job_progress = {job: {'completed_stages': set()} for job in ensaios}
-        uncompleted_jobs = set(ensaios)
-        
-        total_wait_time_per_resource = defaultdict(float)
-
-        while uncompleted_jobs:
-            candidate_operations = []
-            for job in uncompleted_jobs:
-                completed_stages = job_progress[job]['completed_stages']
-                next_stage = next((etapa for etapa in job_stages[job] if etapa not in completed_stages), None)
-                if not next_stage: continue
-                
-                job_ready_at = r_j.get(job, 0) if not completed_stages else schedule[job][job_stages[job][len(completed_stages)-1]]['end']
-                
-                resources_ready_at = 0
-                bottleneck_resource = None
-                can_be_scheduled = True
-                
-                required_resource_types = [res for res in recursos_proc if U.get((job, next_stage, res), 0) == 1]
-                
-                for res_type in required_resource_types:
-                    current_res_ready_at = min(resource_instance_available_time.get(res_type, [0]))
-                    if current_res_ready_at > resources_ready_at:
-                        resources_ready_at = current_res_ready_at
-                        bottleneck_resource = res_type
-
-                earliest_start_time = max(job_ready_at, resources_ready_at)
-                wait_time = earliest_start_time - job_ready_at
-                
-                if wait_time > 1e-5 and bottleneck_resource:
-                    total_wait_time_per_resource[bottleneck_resource] += wait_time
-
-                candidate_operations.append({'job': job, 'etapa': next_stage, 'start_time': earliest_start_time, 'priority': (r_j.get(job, 0), p_total.get(job, 0))})
-
-            if not candidate_operations:
-                next_event_time = min((min(times) for times in resource_instance_available_time.values() if times), default=float('inf'))
-                if next_event_time == float('inf'): break
-                for res in resource_instance_available_time:
-                    resource_instance_available_time[res] = [max(t, next_event_time) for t in resource_instance_available_time[res]]
-                continue
-                
-            best_op = min(candidate_operations, key=lambda op: (op['start_time'], op['priority']))
-            job, etapa, start_time = best_op['job'], best_op['etapa'], best_op['start_time']
-            duration = p.get(job, {}).get(etapa, 0)
-            end_time = start_time + duration
-
-            schedule[job][etapa] = {'start': start_time, 'end': end_time}
-            job_progress[job]['completed_stages'].add(etapa)
-            
-            required_resource_types = [res for res in recursos_proc if U.get((job, etapa, res), 0) == 1]
-            for res_type in required_resource_types:
-                instance_times = resource_instance_available_time[res_type]
-                free_instances = [i for i, t in enumerate(instance_times) if t <= start_time + 1e-5]
-                idx_to_update = free_instances[0] if free_instances else instance_times.index(min(instance_times))
-                resource_instance_available_time[res_type][idx_to_update] = end_time
+    # As configurações testadas só ganham recursos, então cada simulação é
+    # retomada do ponto em que a agenda passa a divergir de uma já feita.
+    simulador = motor_heuristica.SimuladorIncremental(ensaios, p, r_j, incidencia)
 
-            if next((etapa for etapa in job_stages[job] if etapa not in job_progress[job]['completed_stages']), None) is None:
-                uncompleted_jobs.remove(job)
+    # Andamento informado a ``ao_progredir``; a fração nunca volta atrás,
+    # mesmo quando uma iteração simula várias configurações.
+    andamento = {'iteracao': 0, 'melhor_makespan': None, 'fracao': 0.0}
+
+    def avisar(texto, fracao_iteracao=0.0, **detalhes):
+        if ao_progredir is None:
+            return
+        andamento['fracao'] = max(andamento['fracao'], (andamento['iteracao'] - 1 + fracao_iteracao) / num_simu)
+        ao_progredir(andamento['fracao'], texto, iteracao=andamento['iteracao'],
+                     melhor_makespan=andamento['melhor_makespan'], **detalhes)
+
+    def ao_despachar(agendadas, total):
+        avisar(f"Iteração {andamento['iteracao']}/{num_simu}: {agendadas}/{total} operações despachadas",
+               agendadas / total, operacoes=agendadas, total_operacoes=total)
+
+    def executar_heuristica(capacidade_recurso_cenario):
+        inicio = time.perf_counter()
+        motor = simulador.simular(capacidade_recurso_cenario, ao_despachar if ao_progredir else None)
+        tempos['despacho'] += time.perf_counter() - inicio
+        return motor.makespan(), motor.tempo_ocupado_por_recurso(), motor.espera_por_recurso()
 
-        schedule_df = pd.DataFrame([(j, e, s['start'], s['end']) for j, ets in schedule.items() for e, s in ets.items()], columns=['Job', 'Etapa', 'Início', 'Fim'])
-        makespan = schedule_df['Fim'].max() if not schedule_df.empty else 0
-        return makespan, schedule_df, total_wait_time_per_resource
 
     # =========================================================================
     #         PARTE 5: LÓGICA DE DIMENSIONAMENTO ITERATIVO (COM CRITÉRIO DE DESVIO)
@@ -246,33 +258,24 @@ def calcular_parametros_completos(df, PRAZO_DIAS, DEVIATION_TOLERANCE, num_simu,
         return sum(v for k, v in config.items() if 'CELULA' not in k and 'PAINEL' not in k)
 
 
-    for i in range(num_simu):
-        print(f"\n===== Iteração de Dimensionamento {i+1} =====")
-        print("Configuração de Recursos Atual:", {k:v for k,v in capacidade_atual.items() if v < 15})
-        
-        makespan, schedule_df, wait_times = executar_heuristica(capacidade_atual.copy())
-        total_recursos_atual = calcular_total_recursos(capacidade_atual)
-
-        # (Sua lógica de análise de gargalo permanece a mesma)
-        tempo_ocupado_total = defaultdict(float)
-        for _, row in schedule_df.iterrows():
-            resources_used = [res for res in recursos_proc if U.get((row['Job'], row['Etapa'], res), 0) == 1]
-            duration = row['Fim'] - row['Início']
-            for res in resources_used:
-                tempo_ocupado_total[res] += duration
-        analise_gargalo = []
-        for r in capacidade_atual.keys():
-            utilizacao = (tempo_ocupado_total.get(r, 0) / (capacidade_atual[r] * makespan)) * 100 if makespan > 0 else 0
-            tempo_espera = wait_times.get(r, 0)
-            analise_gargalo.append({"Recurso": r, "Utilizacao": utilizacao, "Tempo_Espera": tempo_espera})
-        df_gargalo = pd.DataFrame(analise_gargalo)
+    # (Sua lógica de análise de gargalo permanece a mesma)
+    def analisar_gargalo(capacidade, makespan, tempo_ocupado_total, wait_times):
+        # O tempo ocupado por recurso já vem somado do motor, por tipo de
+        # ensaio e etapa, em vez de percorrer a agenda linha a linha.
+        recursos_analisados = list(capacidade.keys())
+        capacidades = np.array([capacidade[r] for r in recursos_analisados], dtype=float)
+        ocupado = np.array([tempo_ocupado_total.get(r, 0) for r in recursos_analisados], dtype=float)
+        utilizacao = (ocupado / (capacidades * makespan)) * 100 if makespan > 0 else np.zeros(len(recursos_analisados))
+        df_gargalo = pd.DataFrame({
+            "Recurso": recursos_analisados,
+            "Utilizacao": utilizacao,
+            "Tempo_Espera": [wait_times.get(r, 0) for r in recursos_analisados],
+        })
         df_gargalo['Score_Gargalo'] = df_gargalo['Tempo_Espera'] * (df_gargalo['Utilizacao'] /100)
+        return df_gargalo
 
-        if i==0:
-            makespan_real = makespan
-            df_gargalo_real = df_gargalo.copy()
-
-        recurso_gargalo = None
+    def identificar_gargalo(df_gargalo, detalhar=True):
+        """Retorna (recurso gargalo, ranking dos candidatos) ou (None, None)."""
         # Regra 1: Verificar Células com utilização > 80% que NÃO ESTÃO na lista de fixos
         celulas_gargalo = df_gargalo[
             df_gargalo['Recurso'].isin(recursos_celulas) & 
@@ -281,42 +284,398 @@ def calcular_parametros_completos(df, PRAZO_DIAS, DEVIATION_TOLERANCE, num_simu,
         ]
         
         if not celulas_gargalo.empty:
-            gargalo = celulas_gargalo.sort_values(by='Utilizacao', ascending=False).iloc[0]
-            recurso_gargalo = gargalo['Recurso']
-            print(f"  Gargalo de Célula identificado: '{recurso_gargalo}' (Utilização: {gargalo['Utilizacao']:.1f}%).")
-        else:
-            # Regra 2: Encontrar o recurso com maior Score de Gargalo que NÃO ESTÁ na lista de fixos
-            recursos_elegiveis = df_gargalo[
-                ~df_gargalo['Recurso'].isin(recursos_celulas) &
-                ~df_gargalo['Recurso'].isin(recursos_fixos) # <-- Nova condição
-            ]
-            
-            if not recursos_elegiveis.empty and recursos_elegiveis['Score_Gargalo'].max() > 0:
-                # Pega o melhor candidato da lista já filtrada
-                gargalo = recursos_elegiveis.sort_values(by='Score_Gargalo', ascending=False).iloc[0]
-                recurso_gargalo = gargalo['Recurso']
-                print(f"  Gargalo de Processo identificado: '{recurso_gargalo}' (Score: {gargalo['Score_Gargalo']:.2f}, Util: {gargalo['Utilizacao']:.1f}%, Espera: {gargalo['Tempo_Espera']:.1f}h).")
+            ranking_gargalo = celulas_gargalo.sort_values(by='Utilizacao', ascending=False)
+            gargalo = ranking_gargalo.iloc[0]
+            if detalhar:
+                print(f"  Gargalo de Célula identificado: '{gargalo['Recurso']}' (Utilização: {gargalo['Utilizacao']:.1f}%).")
+            return gargalo['Recurso'], ranking_gargalo
+
+        # Regra 2: Encontrar o recurso com maior Score de Gargalo que NÃO ESTÁ na lista de fixos
+        recursos_elegiveis = df_gargalo[
+            ~df_gargalo['Recurso'].isin(recursos_celulas) &
+            ~df_gargalo['Recurso'].isin(recursos_fixos) # <-- Nova condição
+        ]
+        
+        if not recursos_elegiveis.empty and recursos_elegiveis['Score_Gargalo'].max() > 0:
+            # Pega o melhor candidato da lista já filtrada
+            ranking_gargalo = recursos_elegiveis.sort_values(by='Score_Gargalo', ascending=False)
+            gargalo = ranking_gargalo.iloc[0]
+            if detalhar:
+                print(f"  Gargalo de Processo identificado: '{gargalo['Recurso']}' (Score: {gargalo['Score_Gargalo']:.2f}, Util: {gargalo['Utilizacao']:.1f}%, Espera: {gargalo['Tempo_Espera']:.1f}h).")
+            # Recursos sem espera não são candidatos a +1.
+            return gargalo['Recurso'], ranking_gargalo[ranking_gargalo['Score_Gargalo'] > 0]
+        return None, None
+
+    # Cada configuração simulada, para exibição na interface.
+    historico = []
+
+    def registrar(iteracao, capacidade, makespan, recurso_ajustado=None, gargalo=None):
+        if andamento['melhor_makespan'] is None or makespan < andamento['melhor_makespan']:
+            andamento['melhor_makespan'] = float(makespan)
+        historico.append({
+            "Iteração": iteracao,
+            "Recurso Ajustado": recurso_ajustado,
+            "Quantidade": capacidade[recurso_ajustado] if recurso_ajustado else None,
+            "Makespan (h)": makespan,
+            "Gargalo": gargalo,
+            "Configuração": {k: v for k, v in capacidade.items() if v < 15},
+        })
+
+    def buscar_quantidade(iteracao, recurso):
+        """
+        Busca exponencial e depois binária na quantidade de ``recurso``.
+
+        Retorna a menor quantidade testada em que o recurso deixa de ser o
+        gargalo ou a meta é atendida, junto com o resultado da simulação dela.
+        Se nenhuma quantidade até +MAX_PASSO_BUSCA resolve, fica a de menor makespan.
+        """
+        base = capacidade_atual[recurso]
+        avaliadas = {}
+
+        def avaliar(quantidade):
+            if quantidade not in avaliadas:
+                configuracao = capacidade_atual.copy()
+                configuracao[recurso] = quantidade
+                resultado = executar_heuristica(configuracao.copy())
+                gargalo, _ = identificar_gargalo(analisar_gargalo(configuracao, *resultado), detalhar=False)
+                resolvida = resultado[0] <= prazo_aceitavel_em_horas or gargalo != recurso
+                avaliadas[quantidade] = (resultado, resolvida)
+                registrar(iteracao, configuracao, resultado[0], recurso, gargalo)
+                print(f"  Busca '{recurso}' = {quantidade}: Makespan = {resultado[0]:.2f} horas, gargalo: {gargalo}")
+            return avaliadas[quantidade][1]
+
+        # Fase exponencial: +1, +2, +4, ... até resolver.
+        passo, sem_resolver = 1, base
+        while not avaliar(base + passo) and passo < MAX_PASSO_BUSCA:
+            sem_resolver = base + passo
+            passo *= 2
+        resolvida = base + passo
+        if not avaliadas[resolvida][1]:
+            melhor = min(avaliadas, key=lambda q: (avaliadas[q][0][0], q))
+            return melhor, avaliadas[melhor][0]
 
+        # Fase binária entre a última quantidade sem resolver e a primeira resolvida.
+        while resolvida - sem_resolver > 1:
+            meio = (sem_resolver + resolvida) // 2
+            if avaliar(meio):
+                resolvida = meio
             else:
+                sem_resolver = meio
+        return resolvida, avaliadas[resolvida][0]
+
+    # Recursos que o dimensionamento pode ajustar.
+    recursos_livres = [r for r in recursos_proc if r in capacidade_atual and r not in recursos_fixos]
+    # Com os recursos livres ilimitados, o limite inferior só depende dos fixos
+    # e das liberações: acima da meta, nenhuma configuração a atende.
+    limite_ideal, _ = limite_inferior_makespan(carga, [np.inf if r in recursos_livres else capacidade_atual[r] for r in recursos_proc])
+
+    def saltos_limite_inferior():
+        """Capacidades mínimas do limite inferior para os recursos livres abaixo delas, até +MAX_PASSO_BUSCA."""
+        return {
+            r: int(min(minima, capacidade_atual[r] + MAX_PASSO_BUSCA))
+            for r, minima in zip(recursos_proc, capacidades_minimas)
+            if r in recursos_livres and minima > capacidade_atual[r]
+        }
+
+    if limite_ideal > prazo_aceitavel_em_horas:
+        print(f"  Limite inferior analítico ({limite_ideal:.2f} horas) acima da meta: o prazo não é alcançável ajustando os recursos livres.")
+
+    # Resultado da configuração escolhida entre os candidatos paralelos ou
+    # na busca, que não precisa ser simulada de novo na iteração seguinte.
+    resultado_pre_calculado = None
+
+    # Os candidatos paralelos de todas as iterações usam o mesmo pool, com os
+    # parâmetros da demanda enviados uma única vez a cada processo.
+    workers_candidatos = min(max_workers or num_candidatos, num_candidatos)
+    if estrategia != 'bissecao' and workers_candidatos > 1:
+        pool_candidatos = pool_de_configuracoes(ensaios, p, r_j, incidencia, workers_candidatos, com_avisos=ao_progredir is not None)
+    else:
+        pool_candidatos = None
+
+    with pool_candidatos or nullcontext():
+        for i in range(num_simu):
+            print(f"\n===== Iteração de Dimensionamento {i+1} =====")
+            andamento['iteracao'] = i + 1
+            avisar(f"Iteração {i+1}/{num_simu}")
+            print("Configuração de Recursos Atual:", {k:v for k,v in capacidade_atual.items() if v < 15})
+        
+            simulada_agora = resultado_pre_calculado is None
+            if not simulada_agora:
+                makespan, tempo_ocupado_total, wait_times = resultado_pre_calculado
+                resultado_pre_calculado = None
+            else:
+                makespan, tempo_ocupado_total, wait_times = executar_heuristica(capacidade_atual.copy())
+            total_recursos_atual = calcular_total_recursos(capacidade_atual)
+
+            df_gargalo = analisar_gargalo(capacidade_atual, makespan, tempo_ocupado_total, wait_times)
+
+            if i==0:
+                makespan_real = makespan
+                df_gargalo_real = df_gargalo.copy()
+
+            recurso_gargalo, ranking_gargalo = identificar_gargalo(df_gargalo)
+            if simulada_agora:
+                registrar(i + 1, capacidade_atual, makespan, gargalo=recurso_gargalo)
+            if recurso_gargalo is None:
                 print("  Não foi possível identificar um gargalo claro. Parando.")
                 break
 
-        # --- LÓGICA DE DECISÃO CORRIGIDA ---
+            # --- LÓGICA DE DECISÃO CORRIGIDA ---
             
-        # É melhor se o makespan for menor, OU se o makespan for igual com menos recursos
-        if abs(makespan - makespan_da_melhor_config) >= 1.5 or \
-            (abs(makespan - makespan_da_melhor_config) < 1.5 and total_recursos_atual < total_recursos_da_melhor_config):
-            total_recursos_da_melhor_config = calcular_total_recursos(melhor_configuracao_valida) if melhor_configuracao_valida else float('inf')
-            print("  ✅ Nova melhor configuração encontrada que atende à meta!")
-            melhor_configuracao_valida = capacidade_atual.copy()
-            makespan_da_melhor_config = makespan
-            melhor_df_gargalo = df_gargalo.copy()
-            # Verifica se houve melhoria em relação à iteração anterior
-        print(f"  Resultado: Makespan = {makespan:.2f} horas ({makespan/HORAS_POR_DIA:.1f} dias)")
-        print(f"  Meta com Desvio de {DEVIATION_TOLERANCE*100}%: {prazo_aceitavel_em_horas:.2f} horas ({(prazo_aceitavel_em_horas/HORAS_POR_DIA):.1f} dias)")  
-        if makespan <= prazo_aceitavel_em_horas:
-            break
-
-        capacidade_atual[recurso_gargalo] += 1
-        print(f"  Adicionando +1. Nova capacidade para '{recurso_gargalo}': {capacidade_atual[recurso_gargalo]}")
-    return melhor_configuracao_valida, makespan_da_melhor_config, melhor_df_gargalo, makespan_real, df_gargalo_real
+            # É melhor se o makespan for menor, OU se o makespan for igual com menos recursos
+            if abs(makespan - makespan_da_melhor_config) >= 1.5 or \
+                (abs(makespan - makespan_da_melhor_config) < 1.5 and total_recursos_atual < total_recursos_da_melhor_config):
+                total_recursos_da_melhor_config = calcular_total_recursos(melhor_configuracao_valida) if melhor_configuracao_valida else float('inf')
+                print("  ✅ Nova melhor configuração encontrada que atende à meta!")
+                melhor_configuracao_valida = capacidade_atual.copy()
+                makespan_da_melhor_config = makespan
+                melhor_df_gargalo = df_gargalo.copy()
+                # Verifica se houve melhoria em relação à iteração anterior
+            print(f"  Resultado: Makespan = {makespan:.2f} horas ({makespan/HORAS_POR_DIA:.1f} dias)")
+            print(f"  Meta com Desvio de {DEVIATION_TOLERANCE*100}%: {prazo_aceitavel_em_horas:.2f} horas ({(prazo_aceitavel_em_horas/HORAS_POR_DIA):.1f} dias)")  
+            if makespan <= prazo_aceitavel_em_horas:
+                break
+            if estrategia == 'bissecao' and limite_ideal > prazo_aceitavel_em_horas:
+                print("  Parando: nenhuma configuração dos recursos livres atende à meta.")
+                break
+
+            if estrategia == 'bissecao' and i == 0:
+                # Salta direto para as capacidades mínimas que o limite inferior
+                # exige; a configuração resultante é simulada na próxima iteração.
+                saltos = saltos_limite_inferior()
+                if saltos:
+                    capacidade_atual.update(saltos)
+                    print(f"  Limite inferior analítico: saltando para {saltos}")
+                    continue
+
+            if estrategia == 'bissecao':
+                quantidade, resultado_pre_calculado = buscar_quantidade(i + 1, recurso_gargalo)
+                print(f"  Busca concluída. Nova capacidade para '{recurso_gargalo}': {quantidade}")
+                capacidade_atual[recurso_gargalo] = quantidade
+                candidatos = []
+            else:
+                candidatos = ranking_gargalo['Recurso'].head(num_candidatos).tolist()
+            if len(candidatos) > 1:
+                configuracoes = []
+                for recurso in candidatos:
+                    configuracao = capacidade_atual.copy()
+                    configuracao[recurso] += 1
+                    configuracoes.append(configuracao)
+                fracoes_candidatos = [0.0] * len(configuracoes)
+
+                def progresso_candidatos(indice, fracao, texto, operacoes=None, total_operacoes=None):
+                    fracoes_candidatos[indice] = fracao
+                    avisar(f"Iteração {i + 1}/{num_simu}: {len(configuracoes)} candidatos em simulação",
+                           sum(fracoes_candidatos) / len(configuracoes))
+
+                inicio = time.perf_counter()
+                resultados = simular_configuracoes_em_paralelo(
+                    ensaios, p, r_j, incidencia, configuracoes, max_workers,
+                    pool=pool_candidatos,
+                    ao_progredir=progresso_candidatos if ao_progredir else None)
+                tempos['despacho'] += time.perf_counter() - inicio
+                for recurso, configuracao, resultado in zip(candidatos, configuracoes, resultados):
+                    registrar(i + 1, configuracao, resultado[0], recurso)
+                # Empates de makespan ficam com o candidato melhor ranqueado.
+                melhor = min(range(len(candidatos)), key=lambda c: resultados[c][0])
+                for recurso, resultado in zip(candidatos, resultados):
+                    print(f"  Candidato '{recurso}' +1: Makespan = {resultado[0]:.2f} horas")
+                recurso_gargalo = candidatos[melhor]
+                resultado_pre_calculado = resultados[melhor]
+
+            if estrategia != 'bissecao':
+                capacidade_atual[recurso_gargalo] += 1
+                print(f"  Adicionando +1. Nova capacidade para '{recurso_gargalo}': {capacidade_atual[recurso_gargalo]}")
+    if ao_progredir:
+        ao_progredir(1.0, "Dimensionamento concluído", iteracao=andamento['iteracao'], melhor_makespan=andamento['melhor_makespan'])
+    tempos['total'] = time.perf_counter() - inicio_total
+    tempos['pos_processamento'] = tempos['total'] - tempos['parametrizacao'] - tempos['despacho']
+    return melhor_configuracao_valida, makespan_da_melhor_config, melhor_df_gargalo, makespan_real, df_gargalo_real, pd.DataFrame(historico)
+
+# =========================================================================
+#         DEMANDA SIMULADA E REPLICAÇÕES MONTE CARLO
+# =========================================================================
+def gerar_demanda_simulada(num_jobs, prazo_dias, semente=None):
+    """
+    Cria um DataFrame com a demanda de jobs simulada.
+    Com ``semente`` o sorteio é reprodutível e independente do estado global do NumPy.
+    """
+    aleatorio = np.random.RandomState(semente) if semente is not None else np.random
+    print(f"--- Gerando demanda simulada para {num_jobs} jobs ---")
+    distribuicao_historica = [
+        {"Ensaio": "CIUsat", "Tipo Amostra": "Indeformada", "Percentual": 34.8},
+        {"Ensaio": "CIUsat", "Tipo Amostra": "Deformada", "Percentual": 22.7},
+        {"Ensaio": "CIDsat", "Tipo Amostra": "Indeformada", "Percentual": 22.5},
+        {"Ensaio": "CIDsat", "Tipo Amostra": "Deformada", "Percentual": 9.2},
+        {"Ensaio": "CADsat", "Tipo Amostra": "Deformada", "Percentual": 1.5},
+        {"Ensaio": "CAUsat", "Tipo Amostra": "Deformada", "Percentual": 1.4},
+        {"Ensaio": "CAUsat", "Tipo Amostra": "Indeformada", "Percentual": 1.4},
+        {"Ensaio": "CADsat", "Tipo Amostra": "Indeformada", "Percentual": 1.1},
+        {"Ensaio": "CIU", "Tipo Amostra": "Indeformada", "Percentual": 1.0},
+        {"Ensaio": "BE", "Tipo Amostra": "Indeformada", "Percentual": 0.8},
+        {"Ensaio": "CID", "Tipo Amostra": "Indeformada", "Percentual": 0.6},
+        {"Ensaio": "CIDsat/GD", "Tipo Amostra": "Deformada", "Percentual": 0.4},
+        {"Ensaio": "CIUsat/GD", "Tipo Amostra": "Deformada", "Percentual": 0.4},
+        {"Ensaio": "BEP", "Tipo Amostra": "Deformada", "Percentual": 0.3},
+        {"Ensaio": "UUsat", "Tipo Amostra": "Deformada", "Percentual": 0.3},
+        {"Ensaio": "BE", "Tipo Amostra": "Deformada", "Percentual": 0.2},
+        {"Ensaio": "PN", "Tipo Amostra": "Indeformada", "Percentual": 0.2},
+        {"Ensaio": "UUsat", "Tipo Amostra": "Indeformada", "Percentual": 0.2},
+    ]
+    df_dist = pd.DataFrame(distribuicao_historica)
+    df_dist['Probabilidade'] = df_dist['Percentual'] / df_dist['Percentual'].sum()
+
+    indices_sorteados = aleatorio.choice(df_dist.index, size=num_jobs, p=df_dist['Probabilidade'])
+    df_sorteado = df_dist.loc[indices_sorteados].reset_index(drop=True)
+
+    random_days = aleatorio.randint(0, prazo_dias, size=num_jobs)
+    datas_inicio = random_days
+
+    df_simulado = pd.DataFrame({
+        "ID Ensaio/CP": range(num_jobs),
+        "Campanha": "Simulada",
+        "Amostra": [f"Amostra_Sim_{i}" for i in range(num_jobs)],
+        "Nome Amostra": aleatorio.choice(['Argila arenosa', 'Silte argiloso', 'Areia siltosa'], size=num_jobs),
+        "Tipo Amostra": df_sorteado["Tipo Amostra"],
+        "Ensaio": df_sorteado["Ensaio"],
+        "Início Plan Atual": datas_inicio,
+        "Especificação Técnica Ensaio": "Deformação: 20%"
+    })
+    return df_simulado
+
+def calcular_total_recursos(config):
+    return sum(v for k, v in config.items() if 'CELULA' not in k and 'PAINEL' not in k)
+
+def _executar_replicacao(semente, quantidade_jobs, prazo_dias, tolerancia, num_iteracoes, recursos_fixos, num_candidatos, max_workers, estrategia,
+                         ao_progredir=None):
+    df = gerar_demanda_simulada(quantidade_jobs, prazo_dias, semente)
+    return calcular_parametros_completos(df, prazo_dias, tolerancia, num_iteracoes, recursos_fixos, num_candidatos, max_workers, estrategia,
+                                         ao_progredir=ao_progredir)
+
+def executar_replicacoes(num_simulacoes, quantidade_jobs, prazo_dias, tolerancia, num_iteracoes, recursos_fixos,
+                         num_candidatos=1, max_workers=None, ao_concluir=None, estrategia=ESTRATEGIA_PADRAO, semente=None,
+                         ao_progredir=None):
+    """
+    Executa as replicações Monte Carlo do dimensionamento em um pool de processos.
+
+    Cada replicação sorteia a sua demanda com uma semente própria, derivada de
+    uma única ``SeedSequence`` (criada a partir de ``semente``, quando
+    informada, para repetir um estudo), e roda ``calcular_parametros_completos``.
+    ``ao_concluir(concluidas, total)`` é chamada no processo principal a cada
+    replicação terminada, na ordem em que terminam.
+
+    Com ``ao_progredir``, os avisos de ``calcular_parametros_completos`` de
+    cada replicação chegam ao processo principal como
+    ``ao_progredir(fracao, texto, replicacao=..., **detalhes)``, com a fração
+    média de todas as replicações. Se ``ao_progredir`` ou ``ao_concluir``
+    levantar uma exceção (``motor_heuristica.SimulacaoCancelada``), as
+    replicações pendentes são descartadas, as em andamento param no próximo
+    aviso e a exceção é repassada (ver ``execucao_fundo.executar_em_processos``).
+
+    Returns:
+        list: os resultados de ``calcular_parametros_completos``, na ordem das replicações.
+    """
+    sementes = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(semente).spawn(num_simulacoes)]
+    fracoes = [0.0] * num_simulacoes
+
+    def repassar(i, fracao, texto, **detalhes):
+        fracoes[i] = fracao
+        ao_progredir(sum(fracoes) / num_simulacoes, f"Simulação {i + 1}/{num_simulacoes} — {texto}", replicacao=i + 1, **detalhes)
+
+    if num_simulacoes == 1 or max_workers == 1:
+        # Sem pool de replicações, os candidatos de cada iteração podem usar os processos.
+        resultados = []
+        for i, semente in enumerate(sementes):
+            aviso = (lambda fracao, texto, i=i, **detalhes: repassar(i, fracao, texto, **detalhes)) if ao_progredir else None
+            resultados.append(_executar_replicacao(semente, quantidade_jobs, prazo_dias, tolerancia, num_iteracoes, recursos_fixos, num_candidatos, max_workers, estrategia,
+                                                   ao_progredir=aviso))
+            if ao_concluir:
+                ao_concluir(i + 1, num_simulacoes)
+        return resultados
+
+    # As replicações já ocupam os processos; os candidatos de cada uma são simulados em sequência.
+    concluidas = [0]
+
+    def concluir(i, resultado):
+        concluidas[0] += 1
+        if ao_concluir:
+            ao_concluir(concluidas[0], num_simulacoes)
+
+    tarefas = [(semente, quantidade_jobs, prazo_dias, tolerancia, num_iteracoes, recursos_fixos, num_candidatos, 1, estrategia) for semente in sementes]
+    return executar_em_processos(_executar_replicacao, tarefas, max_workers, ao_progredir=repassar if ao_progredir else None,
+                                 ao_concluir=concluir)
+
+def consolidar_replicacoes(resultados):
+    """
+    Consolida as replicações de ``executar_replicacoes`` no resultado exibido na página.
+
+    Percorre as replicações na ordem e só entram na média as configurações que
+    melhoram a melhor até então: makespan menor em mais de 1,5 h ou, com
+    makespan equivalente, menos recursos. A quantidade média de cada recurso é
+    arredondada para cima; a configuração inicial é sempre a média de todas.
+
+    Returns:
+        dict: 'num_melhores', 'recursos_medios', 'makespan_medio',
+        'makespan_real_medio', 'gargalo_medio', 'gargalo_medio_real' e
+        'historico' (configurações testadas, com a coluna 'Simulação').
+    """
+    recurso_final_tracker = None
+    makespan_final_tracker = float('inf')
+    total_recursos_da_melhor_config_tracker = float('inf')
+
+    soma_makespan = 0.0
+    soma_makespan_real = 0.0
+    soma_recursos = defaultdict(int)
+    soma_gargalo = pd.DataFrame()
+    soma_gargalo_real = pd.DataFrame()
+    num_melhores_encontrados = 0
+    historicos = []
+
+    # Os resultados são acumulados na ordem das replicações, para que a
+    # escolha da melhor configuração não dependa da ordem de conclusão.
+    for i, (recursos_1, makespan_1, gargalo, makespan_real, gargalo_real, historico) in enumerate(resultados):
+        historicos.append(historico.assign(Simulação=i + 1))
+        total_recursos_atual = calcular_total_recursos(recursos_1)
+
+        soma_makespan_real += makespan_real
+        if soma_gargalo_real.empty:
+            soma_gargalo_real = gargalo_real.set_index('Recurso')
+        else:
+            # Alinha os DataFrames pelo 'Recurso' e soma apenas as colunas numéricas
+            soma_gargalo_real = soma_gargalo_real.add(gargalo_real.set_index('Recurso'), fill_value=0)
+
+        # A configuração da replicação atual é a "melhor" até agora?
+        if recurso_final_tracker is None or \
+           makespan_1 < makespan_final_tracker - 1.5 or \
+           (abs(makespan_1 - makespan_final_tracker) < 1.5 and total_recursos_atual < total_recursos_da_melhor_config_tracker):
+            recurso_final_tracker = recursos_1.copy()
+            makespan_final_tracker = makespan_1
+            total_recursos_da_melhor_config_tracker = total_recursos_atual
+
+            print(f"  --> Nova melhor configuração encontrada na simulação {i+1}. Acumulando para média.")
+            num_melhores_encontrados += 1
+            soma_makespan += makespan_1
+            for recurso, quantidade in recursos_1.items():
+                soma_recursos[recurso] += quantidade
+            if soma_gargalo.empty:
+                soma_gargalo = gargalo.set_index('Recurso')
+            else:
+                soma_gargalo = soma_gargalo.add(gargalo.set_index('Recurso'), fill_value=0)
+
+    consolidado = {'num_melhores': num_melhores_encontrados, 'historico': pd.concat(historicos, ignore_index=True) if historicos else pd.DataFrame()}
+    if num_melhores_encontrados == 0:
+        return consolidado
+
+    gargalo_medio = soma_gargalo.divide(num_melhores_encontrados).reset_index()
+    gargalo_medio['Score_Gargalo'] = gargalo_medio['Tempo_Espera'] * (gargalo_medio['Utilizacao'] / 100)
+    # Comportamento dos gargalos para a configuração atual do sistema
+    gargalo_medio_real = soma_gargalo_real.divide(len(resultados)).reset_index()
+    gargalo_medio_real['Score_Gargalo'] = gargalo_medio_real['Tempo_Espera'] * (gargalo_medio_real['Utilizacao'] / 100)
+    consolidado.update({
+        'recursos_medios': {recurso: math.ceil(soma_qtde / num_melhores_encontrados) for recurso, soma_qtde in soma_recursos.items()},
+        'makespan_medio': soma_makespan / num_melhores_encontrados,
+        'makespan_real_medio': soma_makespan_real / len(resultados),
+        'gargalo_medio': gargalo_medio,
+        'gargalo_medio_real': gargalo_medio_real,
+    })
+    return consolidado
@@ -1,9 +1,14 @@
+import os
+import time
+from pathlib import Path
 import pandas as pd
 import numpy as np
-import re
 from collections import defaultdict
 from itertools import combinations
-import streamlit as st # Para usar st.progress_bar
+
+import motor_heuristica
+from execucao_fundo import executar_em_processos
+from parametros_ensaios import CacheParametros, DuracoesEstocasticas, chaves_estaveis
 
 # =========================================================================
 #                   CONFIGURAÇÃO FIXA DE RECURSOS
@@ -20,71 +25,62 @@ CAPACIDADE_RECURSOS_ATUAL = {
 # =========================================================================
 #                   MOTOR DE SIMULAÇÃO (HEURÍSTICA)
 # =========================================================================
-def _executar_heuristica(ensaios, p, r_j, U, etapas_proc, recursos_proc):
+def _executar_heuristica(motor_base, indices_propostas, ao_despachar=None):
     """
-    Função interna que executa a simulação de eventos discretos.
-    Recebe todos os parâmetros já calculados.
+    Função interna que executa a simulação de eventos discretos de um cenário.
+    Parte de uma cópia do motor com a fila real já despachada até a chegada
+    das propostas e ativa os ensaios das propostas do cenário.
     """
-    capacidade_recurso_cenario = CAPACIDADE_RECURSOS_ATUAL
+    motor = motor_base.copiar()
+    motor.ativar(indices_propostas)
+    motor.despachar(ao_despachar=ao_despachar)
+    return motor.agenda_colunar()
 
-    p_total = {job: sum(p.get(job, {}).get(stage, 0) for stage in p[job] if stage != 'Prep_Espera') for job in ensaios}
-    job_stages = {job: [etapa for etapa in etapas_proc if p.get(job, {}).get(etapa, 0) > 0] for job in ensaios}
-    schedule = defaultdict(dict)
-    
-    resource_instance_available_time = {res: [0] * capacidade_recurso_cenario.get(res, 1) for res in recursos_proc}
-    
-    job_progress = {job: {'completed_stages': set()} for job in ensaios}
-    uncompleted_jobs = set(ensaios)
-
-    while uncompleted_jobs:
-        candidate_operations = []
-        for job in uncompleted_jobs:
-            completed_stages = job_progress[job]['completed_stages']
-            next_stage = next((etapa for etapa in job_stages[job] if etapa not in completed_stages), None)
-            if not next_stage: continue
-            
-            job_ready_at = r_j.get(job, 0) if not completed_stages else schedule[job][job_stages[job][len(completed_stages)-1]]['end']
-            
-            resources_ready_at = 0
-            
-            required_resource_types = [res for res in recursos_proc if U.get((job, next_stage, res), 0) == 1]
-            
-            for res_type in required_resource_types:
-                current_res_ready_at = min(resource_instance_available_time.get(res_type, [0]))
-                if current_res_ready_at > resources_ready_at:
-                    resources_ready_at = current_res_ready_at
-
-            earliest_start_time = max(job_ready_at, resources_ready_at)
-
-            candidate_operations.append({'job': job, 'etapa': next_stage, 'start_time': earliest_start_time, 'priority': (r_j.get(job, 0), p_total.get(job, 0))})
-
-        if not candidate_operations:
-            break # Todos os jobs foram agendados
-            
-        best_op = min(candidate_operations, key=lambda op: (op['start_time'], op['priority']))
-        job, etapa, start_time = best_op['job'], best_op['etapa'], best_op['start_time']
-        duration = p.get(job, {}).get(etapa, 0)
-        end_time = start_time + duration
-
-        schedule[job][etapa] = {'start': start_time, 'end': end_time}
-        job_progress[job]['completed_stages'].add(etapa)
-        
-        required_resource_types = [res for res in recursos_proc if U.get((job, etapa, res), 0) == 1]
-        for res_type in required_resource_types:
-            instance_times = resource_instance_available_time[res_type]
-            free_instances = [i for i, t in enumerate(instance_times) if t <= start_time + 1e-5]
-            idx_to_update = free_instances[0] if free_instances else instance_times.index(min(instance_times))
-            resource_instance_available_time[res_type][idx_to_update] = end_time
-
-        if next((etapa for etapa in job_stages[job] if etapa not in job_progress[job]['completed_stages']), None) is None:
-            uncompleted_jobs.remove(job)
-
-    schedule_df = pd.DataFrame([(j, e, s['start'], s['end']) for j, ets in schedule.items() for e, s in ets.items()], columns=['Job', 'Etapa', 'Início', 'Fim'])
-    return schedule_df
+def _pontos_de_retomada(motor_real, instantes, ao_despachar=None):
+    """
+    Despacha a fila real até cada instante (em ordem crescente) e guarda uma
+    cópia do motor em cada um. Até a chegada da primeira proposta de um
+    cenário, o agendamento da fila real não depende das propostas.
+    """
+    pontos = {}
+    for instante in sorted(set(instantes)):
+        motor_real.despachar(ate=instante, ao_despachar=ao_despachar)
+        pontos[instante] = motor_real.copiar()
+    return pontos
 
 # =========================================================================
 #                   PREPARAÇÃO DOS DADOS E PARÂMETROS
 # =========================================================================
+# Parâmetros por ensaio compartilhados por todas as simulações do processo
+# (a fila real muda pouco entre uma simulação e a seguinte) e guardados em
+# disco, para que um processo novo também só parametrize o que mudou na fila.
+# O arquivo fica na pasta de cache do usuário, fora do código;
+# PRAZOS_CACHE_PARAMETROS troca o arquivo e, vazia, deixa o cache só em memória.
+ARQUIVO_CACHE_PARAMETROS = os.environ.get(
+    "PRAZOS_CACHE_PARAMETROS",
+    str(Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "simulador-laboratorio" / "parametros_prazos.parquet"),
+)
+_CACHE_PARAMETROS = CacheParametros(arquivo=ARQUIVO_CACHE_PARAMETROS or None)
+
+def converter_propostas_para_df(propostas_list):
+    """Converte a lista de propostas para um DataFrame padronizado, com uma linha por ensaio."""
+    dados_para_df = []
+    for proposta in propostas_list:
+        for ensaio in proposta['ensaios']:
+            # Para cada ensaio, repetimos a quantidade de vezes especificada
+            for _ in range(ensaio['quantidade']):
+                dados_para_df.append({
+                    'Campanha': proposta['nome_proposta'],
+                    'Ensaio': ensaio['ensaio'],
+                    'Tipo Amostra': ensaio['tipo_amostra'] if ensaio['tipo_amostra'] else 'Indeformada',
+                    # Adicionamos colunas "placeholder" para compatibilidade
+                    'ID Ensaio/CP': f"Manual_{proposta['nome_proposta']}",
+                    'Origem': 'Manual' # Coluna para identificar a origem dos dados
+                })
+    if not dados_para_df:
+        return pd.DataFrame()
+    return pd.DataFrame(dados_para_df)
+
 def _preparar_parametros_simulacao(df_cenario):
     """
     Função interna que pega um DataFrame de um cenário e calcula todos os
@@ -99,235 +95,371 @@ def _preparar_parametros_simulacao(df_cenario):
     # Se 'Início Plan Atual' não existir (caso de dados manuais), usamos a data de chegada da proposta
     if 'data_chegada' in df.columns:
         hoje = pd.Timestamp.today().normalize()
-        df['Release Date'] = df['data_chegada'].apply(lambda x: max(0, (pd.to_datetime(x) - hoje).days) * 24)
+        dias_ate_chegada = (pd.to_datetime(df['data_chegada']) - hoje).dt.days
+        df['Release Date'] = dias_ate_chegada.clip(lower=0).fillna(0) * 24
     else: # Para dados do Drive que já têm 'Início Plan Atual'
-        df['Release Date'] = df['Início Plan Atual'].apply(lambda x: x * 24 + 7 if pd.notnull(x) else 0)
-
-    def prep_ativa_horas(tipo):
-        minutos = 60 if tipo == 'Deformada' else 30
-        return minutos / 60.0
-    df['Prep_Ativa'] = df['Tipo Amostra'].apply(prep_ativa_horas)
-    df['Prep_Espera'] = df['Tipo Amostra'].apply(lambda tipo: 24.0 if tipo == 'Deformada' else 0.0)
-
-    def tempo_formacao_horas(tipo):
-        minutos = 30 if tipo == 'Deformada' else 10
-        return minutos / 60.0
-    df['Tarugo'] = df['Tipo Amostra'].apply(tempo_formacao_horas)
-    df['Montagem Célula'] = 10 / 60.0
-    ensaios_com_saturacao = ["QCSD", "BE", "BEP"]
-
-    def tem_saturacao(ensaio):
-        if isinstance(ensaio, str):
-            return 'sat' in ensaio.lower() or ensaio in ensaios_com_saturacao
-        return False
-    
-    def saturacao_agua(ensaio, nome_amostra):
-        if not tem_saturacao(ensaio): return 0.0
-        if 'aren' in str(nome_amostra).lower(): return 12.0
-        else: return 24.0
+        df['Release Date'] = (df['Início Plan Atual'] * 24 + 7).fillna(0)
 
-    def saturacao_co2(ensaio):
-        return (20/60.0) if tem_saturacao(ensaio) else 0.0
-    
-    def contrapressao(ensaio):
-        return 4.5 if tem_saturacao(ensaio) else 0.0
-    
-    df['Sat H2O'] = df.apply(lambda row: saturacao_agua(row['Ensaio'], row.get('Nome Amostra')), axis=1)
-    df['Sat CO2'] = df['Ensaio'].apply(saturacao_co2)
-    df['Sat Contrapressao'] = df['Ensaio'].apply(contrapressao)
-
-    def tempo_adensamento_horas(nome_amostra):
-        nome = str(nome_amostra).lower()
-        return (40 / 60.0) if 'aren' in nome else 2.0
-    ensaios_sem_adensamento = ['UU', 'UUsat']
-    df['Adensamento'] = np.where(df['Ensaio'].isin(ensaios_sem_adensamento), 0.0, df.get('Nome Amostra', 'default').apply(tempo_adensamento_horas))
-
-    def extrair_deformacao(texto):
-        if pd.isnull(texto): return 20
-        match = re.search(r'Deformação[:\s]*([0-9]+)%', str(texto))
-        if match: return int(match.group(1))
-        return 20
-    df['Deformacao (%)'] = df.get('Especificação Técnica Ensaio', 20).apply(extrair_deformacao)
-
-    def altura_tarugo(nome_ensaio):
-        if isinstance(nome_ensaio, str) and 'GD' in nome_ensaio: return 202
-        return 102
-    df['Altura Tarugo'] = df['Ensaio'].apply(altura_tarugo)
-    ensaios_drenados = ["CID", "CIDsat", "CADsat", "CCIDsat", "QCSD", "CIDsat/GD", "CCADsat"]
-    ensaios_nao_drenados = ["CIUsat", "CIU", "UU", "UUsat", "CAU", "CAUsat", "EIUsat", "CIUsat/GD", "PN", "CK0", "CCAUsat"]
-
-    def velocidade_carregamento(nome_ensaio):
-        if isinstance(nome_ensaio, str):
-            for drenado in ensaios_drenados:
-                if drenado in nome_ensaio: return 0.045
-            for nao_drenado in ensaios_nao_drenados:
-                if nao_drenado in nome_ensaio: return 0.09
-        return 0
-    df['Velocidade'] = df['Ensaio'].apply(velocidade_carregamento)
-
-    def rompido_na_prensa(nome_ensaio):
-        return any(tag in nome_ensaio for tag in ensaios_drenados + ensaios_nao_drenados) if isinstance(nome_ensaio, str) else False
-    df['Rompido?'] = df['Ensaio'].apply(rompido_na_prensa)
-
-    def calcular_rompimento(row):
-        if not row['Rompido?']: return 0
-        deform, altura, vel = row['Deformacao (%)'], row['Altura Tarugo'], row['Velocidade']
-        if deform is None or vel is None or vel == 0: return 0
-        return ((altura * (deform / 100)) / vel) / 60
-    df['Rompimento'] = df.apply(calcular_rompimento, axis=1)
-    df['Desmontagem'] = 20 / 60.0
-
-    def definir_tipo_ensaio(nome_ensaio):
-        nome_ensaio = str(nome_ensaio)
-        if nome_ensaio.startswith('CC'): return 'Ciclico'
-        elif len(nome_ensaio) > 1 and nome_ensaio[1] == 'I': return 'Iso'
-        elif nome_ensaio.startswith('BE'): return 'Bender'
-        else: return 'Aniso'
-    df['Tipo Ensaio'] = df['Ensaio'].apply(definir_tipo_ensaio)
-    
-    Parametros = df[['Job', 'Tipo Amostra', 'Ensaio', 'Tipo Ensaio', 'Release Date', 'Prep_Ativa', 'Prep_Espera', 'Tarugo', 'Montagem Célula', 'Sat CO2','Sat H2O','Sat Contrapressao', 'Adensamento', 'Rompimento', 'Desmontagem']].copy()
-    ensaios = Parametros['Job'].tolist()
-    tipos_ensaio = Parametros.set_index('Job')['Tipo Ensaio'].to_dict()
-    etapas_proc = ['Prep_Ativa', 'Prep_Espera', 'Tarugo', 'Montagem Célula', 'Sat_CO2', 'Sat_H2O', 'Sat_Contrapressao', 'Adensamento', 'Rompimento', 'Romp&Adensa', 'Desmontagem', 'Liberacao_Celula']
-    r_j = Parametros.set_index('Job')['Release Date'].to_dict()
-    p = {job: {} for job in ensaios}
-
-    def to_float(val):
-        try: return max(0.0, float(val))
-        except (ValueError, TypeError): return 0.0
-
-    for job in ensaios:
-        row = Parametros[Parametros['Job'] == job].iloc[0]
-        p[job]['Prep_Ativa'] = to_float(row['Prep_Ativa'])
-        p[job]['Prep_Espera'] = to_float(row['Prep_Espera'])
-        p[job]['Tarugo'] = to_float(row['Tarugo'])
-        p[job]['Montagem Célula'] = to_float(row['Montagem Célula'])
-        p[job]['Sat_CO2'] = to_float(row['Sat CO2'])
-        p[job]['Sat_H2O'] = to_float(row['Sat H2O'])
-        p[job]['Sat_Contrapressao'] = to_float(row['Sat Contrapressao'])
-        p[job]['Desmontagem'] = to_float(row['Desmontagem'])
-        p[job]['Liberacao_Celula'] = 0.0
-        tipo_do_ensaio = tipos_ensaio.get(job)
-        if tipo_do_ensaio in ['Aniso', 'Ciclico']:
-            p[job]['Romp&Adensa'] = to_float(row['Adensamento']) + to_float(row['Rompimento'])
-            p[job]['Adensamento'], p[job]['Rompimento'] = 0.0, 0.0
-        else:
-            p[job]['Romp&Adensa'] = 0.0
-            p[job]['Adensamento'], p[job]['Rompimento'] = to_float(row['Adensamento']), to_float(row['Rompimento'])
-            
     recursos_proc = list(CAPACIDADE_RECURSOS_ATUAL.keys())
-    mapeamento_etapa_recurso = {
-        'Prep_Ativa': ['BANCADA_PREP_ATIVA'], 'Tarugo': ['BANCADA_TARUGO'], 'Montagem Célula': ['BANCADA_MONTAGEM', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'],
-        'Sat_CO2': ['LINHA_SAT_CO2', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'], 'Sat_H2O': ['PAINEL_SAT_H2O', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'],
-        'Sat_Contrapressao': ['PAINEL_SAT_CP', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'], 'Adensamento': ['BANCADA_ADEN_CONVENCIONAL', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'],
-        'Rompimento': ['PRENSA_ROMP_ISO', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'], 'Romp&Adensa': ['PRENSA_ESPECIAL_ANISO_CICLICO', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'],
-        'Desmontagem': ['BANCADA_DESM', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'],
-    }
-    recursos_celulas = [recurso for recurso in recursos_proc if 'CELULA' in recurso]
-    Ajc = pd.DataFrame(0, index=ensaios, columns=recursos_celulas)
-    for job in ensaios:
-        tipo = tipos_ensaio.get(job)
-        if tipo == 'Bender':
-            if 'CELULA_BENDER' in Ajc.columns: Ajc.loc[job, 'CELULA_BENDER'] = 1
-        elif tipo == 'Ciclico':
-            if 'CELULA_CICLICO' in Ajc.columns: Ajc.loc[job, 'CELULA_CICLICO'] = 1
-        elif tipo in ['Iso', 'Aniso']:
-            if 'CELULA_CONVENCIONAL' in Ajc.columns: Ajc.loc[job, 'CELULA_CONVENCIONAL'] = 1
-    U = {}
-    for j in ensaios:
-        for m in etapas_proc:
-            if p.get(j, {}).get(m, 0) > 0:
-                recursos_potenciais = mapeamento_etapa_recurso.get(m, [])
-                for r in recursos_potenciais:
-                    if r in recursos_proc:
-                        if r in recursos_celulas:
-                            if Ajc.loc[j, r] == 1: U[j, m, r] = 1
-                        else: U[j, m, r] = 1
+    # Durações, tipos e incidência montados pelo cache: as linhas da fila já
+    # vistas em simulações anteriores (mesmo 'ID Ensaio/CP' e mesmas colunas
+    # de origem) não são parametrizadas de novo; só a liberação é recalculada.
+    # U é só uma visão da incidência.
+    df['Chave'] = chaves_estaveis(df['ID Ensaio/CP'])
+    ensaios, p, r_j, U, incidencia = _CACHE_PARAMETROS.parametrizar(
+        df, df['Chave'], df['Job'], df['Release Date'], recursos_proc
+    )
     
-    return df, ensaios, p, r_j, U, etapas_proc, recursos_proc
+    return df, ensaios, p, r_j, U, incidencia
+
+# =========================================================================
+#                   PRAZOS DOS CENÁRIOS E REPLICAÇÕES
+# =========================================================================
+# Replicações sugeridas para o modo estocástico na página.
+NUM_REPLICACOES_PADRAO = 50
+# As replicações são divididas em até este número de tarefas por processo,
+# para equilibrar a carga sem enviar os parâmetros a cada replicação.
+TAREFAS_POR_PROCESSO = 2
+
+class _PrazosCenarios:
+    """
+    Prazos (dias úteis) das propostas de cada cenário, para as durações ``p``.
+
+    A fila real é despachada uma vez, guardando o estado na chegada de cada
+    proposta; um cenário retoma do estado na chegada da sua primeira proposta.
+    ``base`` traz os parâmetros comuns a todas as durações (ver
+    ``simular_prazos_propostas``) e ``tempos['despacho']`` acumula o tempo de
+    despacho. Cenários repetidos não são simulados de novo.
+    """
+
+    def __init__(self, base, p, ao_despachar=None, tempos=None):
+        self.base = base
+        self.tempos = {'despacho': 0.0} if tempos is None else tempos
+        inicio = time.perf_counter()
+        # Os prazos não usam a espera por recurso; sem contabilizá-la, o
+        # despacho não reavalia a cada operação todos os ensaios em espera.
+        motor_real = motor_heuristica.MotorDespacho(base['ensaios'], p, base['r_j'], base['incidencia'], CAPACIDADE_RECURSOS_ATUAL,
+                                                    ativos=range(base['n_real']), contabilizar_esperas=False)
+        self.pontos_retomada = _pontos_de_retomada(motor_real, base['chegada_proposta'].values(), ao_despachar)
+        self.tempos['despacho'] += time.perf_counter() - inicio
+        self.prazos_por_cenario = {}
+
+    def prazos(self, nomes_propostas_cenario, ao_despachar=None):
+        """Prazos (dias úteis) gerais e por tipo de ensaio das propostas do cenário."""
+        chave = frozenset(nomes_propostas_cenario)
+        if chave in self.prazos_por_cenario:
+            return self.prazos_por_cenario[chave]
+        base = self.base
+        campanhas, tipos_ensaio = base['campanhas'], base['tipos_ensaio']
+
+        # Executar a heurística a partir do estado salvo da fila real
+        chegada = min(base['chegada_proposta'][nome] for nome in nomes_propostas_cenario)
+        indices_cenario = sorted(k for nome in nomes_propostas_cenario for k in base['indices_proposta'][nome])
+        inicio = time.perf_counter()
+        job, _, _, fim = _executar_heuristica(self.pontos_retomada[chegada], indices_cenario, ao_despachar)
+        self.tempos['despacho'] += time.perf_counter() - inicio
+
+        # Calcular o prazo para cada proposta NESTE cenário
+        # --- 1. CÁLCULO DO PRAZO GERAL DA PROPOSTA (para o st.metric) ---
+        fim_campanha = np.full(len(campanhas), -np.inf)
+        np.maximum.at(fim_campanha, base['codigo_campanha'][job], fim)
+        # --- 2. CÁLCULO DOS PRAZOS DETALHADOS POR TIPO DE ENSAIO (para a tabela) ---
+        # Tempo de conclusão do último ensaio de cada tipo dentro de cada proposta
+        fim_campanha_ensaio = np.full(len(campanhas) * len(tipos_ensaio), -np.inf)
+        np.maximum.at(fim_campanha_ensaio, base['codigo_campanha_ensaio'][job], fim)
+
+        # Converter para dias úteis
+        prazos_gerais, prazos_detalhados = {}, {}
+        for nome_proposta in nomes_propostas_cenario:
+            c = base['indice_campanha'].get(nome_proposta)
+            if c is None or fim_campanha[c] == -np.inf:
+                continue
+            prazos_gerais[nome_proposta] = fim_campanha[c] / 17
+            fins_por_tipo = fim_campanha_ensaio[c * len(tipos_ensaio):(c + 1) * len(tipos_ensaio)]
+            for e in np.flatnonzero(fins_por_tipo > -np.inf):
+                prazos_detalhados[(nome_proposta, tipos_ensaio[e])] = fins_por_tipo[e] / 17
+        self.prazos_por_cenario[chave] = (prazos_gerais, prazos_detalhados)
+        return prazos_gerais, prazos_detalhados
+
+def _simular_replicacoes(base, sorteador, replicacoes, cenarios, total_replicacoes, ao_progredir=None):
+    """
+    Prazos de cada cenário em cada replicação de ``replicacoes``, com as
+    durações sorteadas por ``sorteador`` (``DuracoesEstocasticas``).
+    ``cenarios[i]`` são os cenários (listas de propostas) da replicação
+    ``replicacoes[i]``; ``total_replicacoes`` só aparece nos avisos. Roda no
+    processo principal ou em um processo do pool.
+
+    Returns:
+        list: por replicação, a lista de (prazos gerais, prazos detalhados) de cada cenário.
+    """
+    resultados = []
+    for i, (replicacao, cenarios_replicacao) in enumerate(zip(replicacoes, cenarios)):
+        ao_despachar = None
+        if ao_progredir:
+            texto = f"Replicação {replicacao + 1} de {total_replicacoes}"
+            ao_progredir(i / len(replicacoes), texto, replicacao=replicacao + 1)
+
+            def ao_despachar(agendadas, total, i=i, replicacao=replicacao, texto=texto):
+                ao_progredir((i + agendadas / total) / len(replicacoes), f"{texto}: {agendadas}/{total} operações",
+                             replicacao=replicacao + 1, operacoes=agendadas, total_operacoes=total)
+        simulacao = _PrazosCenarios(base, sorteador.sortear(replicacao), ao_despachar)
+        resultados.append([simulacao.prazos(cenario, ao_despachar) for cenario in cenarios_replicacao])
+    return resultados
+
+# =========================================================================
+#                   AMOSTRAGEM DE CENÁRIOS E ESTATÍSTICAS
+# =========================================================================
+# Até este número de propostas todos os cenários são enumerados; acima dele
+# os cenários são sorteados pela probabilidade de fechamento de cada proposta.
+LIMITE_CENARIOS_EXAUSTIVOS = 4
+PROBABILIDADE_FECHAMENTO_PADRAO = 0.5
+
+# Critério de parada da amostragem: intervalos de confiança de 95% da média e
+# do percentil com meia largura de até LARGURA_IC_DIAS, com pelo menos
+# MIN_AMOSTRAS_PROPOSTA cenários por proposta, verificados a cada
+# LOTE_AMOSTRAS sorteios e limitados a MAX_AMOSTRAS.
+PERCENTIL_PRAZO = 90
+LARGURA_IC_DIAS = 0.5
+MIN_AMOSTRAS_PROPOSTA = 20
+LOTE_AMOSTRAS = 10
+MAX_AMOSTRAS = 400
+Z_95 = 1.96
+
+def _estatisticas_prazo(amostras, com_intervalos=True):
+    """
+    Média, mediana e percentil ``PERCENTIL_PRAZO`` dos prazos (dias úteis).
+
+    Com ``com_intervalos``, inclui o IC 95% da média (aproximação normal) e o
+    IC 95% do percentil pelas estatísticas de ordem (aproximação normal da
+    binomial), que não depende da distribuição dos prazos.
+    """
+    valores = np.sort(np.asarray(amostras, dtype=float))
+    n = len(valores)
+    q = PERCENTIL_PRAZO / 100
+    estatisticas = {
+        'n': n,
+        'media': float(valores.mean()),
+        'p50': float(np.percentile(valores, 50)),
+        'percentil': float(np.percentile(valores, PERCENTIL_PRAZO)),
+        'ic_media': None,
+        'ic_percentil': None,
+    }
+    if com_intervalos and n > 1:
+        meia_largura = Z_95 * valores.std(ddof=1) / np.sqrt(n)
+        estatisticas['ic_media'] = (float(estatisticas['media'] - meia_largura), float(estatisticas['media'] + meia_largura))
+        desvio_posto = Z_95 * np.sqrt(n * q * (1 - q))
+        inferior = int(max(np.floor(n * q - desvio_posto), 1))
+        superior = int(min(np.ceil(n * q + desvio_posto), n))
+        estatisticas['ic_percentil'] = (float(valores[inferior - 1]), float(valores[superior - 1]))
+    return estatisticas
+
+def _intervalos_estreitos(estatisticas):
+    """Indica se os intervalos de confiança já atendem ao critério de parada."""
+    if estatisticas['n'] < MIN_AMOSTRAS_PROPOSTA or estatisticas['ic_media'] is None:
+        return False
+    media_inf, media_sup = estatisticas['ic_media']
+    perc_inf, perc_sup = estatisticas['ic_percentil']
+    return (media_sup - media_inf) / 2 <= LARGURA_IC_DIAS and \
+        max(estatisticas['percentil'] - perc_inf, perc_sup - estatisticas['percentil']) <= LARGURA_IC_DIAS
 
 # =========================================================================
 #                   FUNÇÃO PRINCIPAL ORQUESTRADORA
 # =========================================================================
-def simular_prazos_propostas(df_combinado, propostas_manuais):
+def simular_prazos_propostas(df_combinado, propostas_manuais, modo=None, semente=None, tempos=None, ao_progredir=None,
+                             replicacoes=None, distribuicoes=None, max_workers=None):
     """
     Orquestra a simulação de prazos para várias combinações de propostas.
 
     Args:
         df_combinado (pd.DataFrame): DataFrame com todos os ensaios (fila real + todas as propostas).
-        propostas_manuais (list): A lista de dicionários de propostas do st.session_state.
+        propostas_manuais (list): A lista de dicionários de propostas (a do st.session_state, na página).
+            A chave opcional 'probabilidade_fechamento' (0 a 1) é usada no modo amostrado.
+        modo (str): 'exaustivo' simula todas as combinações não vazias de propostas;
+            'amostrado' sorteia cenários pela probabilidade de fechamento até os
+            intervalos de confiança ficarem estreitos. Por padrão, 'exaustivo' com
+            até LIMITE_CENARIOS_EXAUSTIVOS propostas e 'amostrado' acima disso.
+        semente (int): semente do sorteio de cenários e, no modo estocástico, das durações.
+        tempos (dict): se informado, recebe os segundos gastos em cada etapa:
+            'parametrizacao', 'despacho' (fila real e cenários),
+            'pos_processamento' (prazos e estatísticas) e 'total'.
+        ao_progredir (callable): se informada, é chamada como
+            ``ao_progredir(fracao, texto, **detalhes)`` a cada cenário simulado,
+            com a fração concluída (0 a 1) e uma descrição do cenário, e
+            durante o despacho, com os detalhes 'operacoes' e
+            'total_operacoes'. Se ela levantar ``motor_heuristica.SimulacaoCancelada``,
+            a simulação para ali.
+        replicacoes (int): se informado, liga o modo estocástico: as durações
+            das etapas são sorteadas de ``distribuicoes`` (por padrão
+            ``parametros_ensaios.DISTRIBUICOES_DURACAO_PADRAO``) em cada uma
+            das ``replicacoes``, com números aleatórios comuns entre os
+            cenários (ver ``DuracoesEstocasticas``). No modo exaustivo cada
+            replicação simula todos os cenários; no amostrado, um cenário
+            sorteado pela probabilidade de fechamento. As médias e os
+            percentis passam a cobrir as replicações e os cenários.
+        max_workers (int): processos usados pelas replicações (padrão: todos
+            os núcleos); com 1, elas rodam no processo que chamou.
 
     Returns:
-        dict: Um dicionário com o prazo médio em dias para cada proposta.
-              Ex: {'Proposta A': 25, 'Proposta B': 30}
+        tuple: (prazo médio em dias úteis por proposta, ex: {'Proposta A': 25},
+        lista de prazos médios, P50 e P{PERCENTIL_PRAZO} por proposta e tipo de
+        ensaio, resumo da simulação com o modo, o número de cenários e as
+        estatísticas de cada proposta — ver ``_estatisticas_prazo`` — e, no
+        modo estocástico, o número de replicações e a semente usada).
     """
+    inicio_total = time.perf_counter()
+    tempos = {} if tempos is None else tempos
     nomes_propostas = [p['nome_proposta'] for p in propostas_manuais]
     df_real = df_combinado[df_combinado['Origem'] == 'Planejamento (Drive)']
+    df_propostas = df_combinado[df_combinado['Campanha'].isin(nomes_propostas)]
+    if modo is None:
+        modo = 'exaustivo' if len(nomes_propostas) <= LIMITE_CENARIOS_EXAUSTIVOS else 'amostrado'
     
     # Dicionário para armazenar os prazos de cada proposta em cada cenário
     prazos_detalhados_cenario = defaultdict(list)
     prazos_gerais_cenario = defaultdict(list)
 
+    # O progresso é informado a quem chamou (a página usa uma barra do Streamlit)
+    progredir = ao_progredir or (lambda fracao, texto, **detalhes: None)
+    progredir(0, "Iniciando simulações de cenários...")
+    # Fração já concluída e peso do cenário em andamento, para os avisos do despacho.
+    andamento = {'fracao': 0.0, 'peso': 0.0, 'texto': "Despachando a fila real"}
+
+    def ao_despachar(agendadas, total):
+        progredir(andamento['fracao'] + andamento['peso'] * agendadas / total,
+                  f"{andamento['texto']}: {agendadas}/{total} operações",
+                  operacoes=agendadas, total_operacoes=total)
+    if ao_progredir is None:
+        ao_despachar = None
+
+    # 1. Montar e parametrizar uma única vez a fila real seguida de todas as
+    #    propostas; cada cenário usa a fila real e as linhas das suas propostas.
+    df_base = pd.concat([df_real, df_propostas], ignore_index=True)
+
+    # Adicionar a data de chegada para os cálculos de release date
+    map_proposta_data = {p['nome_proposta']: p['data_chegada'] for p in propostas_manuais}
+    df_base['data_chegada'] = df_base['Campanha'].map(map_proposta_data)
+
+    # 2. Preparar os parâmetros para a simulação
+    df_base, ensaios, p, r_j, U, incidencia = _preparar_parametros_simulacao(df_base)
+    # Códigos de campanha e de (campanha, ensaio) de cada linha, para agrupar
+    # a agenda com reduções vetorizadas em vez de filtros repetidos.
+    codigo_campanha, campanhas = pd.factorize(df_base['Campanha'], use_na_sentinel=False)
+    codigo_ensaio, tipos_ensaio = pd.factorize(df_base['Ensaio'], use_na_sentinel=False)
+
+    n_real = len(df_real)
+    campanha_base = df_base['Campanha'].to_numpy()
+    indices_proposta = {nome: [int(k) for k in np.flatnonzero(campanha_base[n_real:] == nome) + n_real] for nome in nomes_propostas}
+    # Parâmetros comuns a todas as durações simuladas (ver ``_PrazosCenarios``).
+    base = {
+        'ensaios': ensaios, 'r_j': r_j, 'incidencia': incidencia, 'n_real': n_real,
+        'indices_proposta': indices_proposta,
+        'chegada_proposta': {nome: min((r_j[ensaios[k]] for k in indices), default=float('inf')) for nome, indices in indices_proposta.items()},
+        'codigo_campanha': codigo_campanha,
+        'codigo_campanha_ensaio': codigo_campanha * len(tipos_ensaio) + codigo_ensaio,
+        'campanhas': campanhas, 'tipos_ensaio': tipos_ensaio,
+        'indice_campanha': {campanha: c for c, campanha in enumerate(campanhas)},
+    }
+    tempos['parametrizacao'] = time.perf_counter() - inicio_total
+
+    def acumular(prazos_cenario):
+        prazos_gerais, prazos_detalhados = prazos_cenario
+        for nome_proposta, prazo in prazos_gerais.items():
+            prazos_gerais_cenario[nome_proposta].append(prazo)
+        for chave, prazo in prazos_detalhados.items():
+            prazos_detalhados_cenario[chave].append(prazo)
+
     # Gera todas as combinações não vazias de propostas (cenários)
     cenarios = []
-    for i in range(1, len(nomes_propostas) + 1):
-        cenarios.extend(combinations(nomes_propostas, i))
-
-    # Barra de progresso para o Streamlit
-    barra_progresso = st.progress(0, text="Iniciando simulações de cenários...")
-
-    for i, cenario in enumerate(cenarios):
-        nomes_propostas_cenario = list(cenario)
-        barra_progresso.progress((i + 1) / len(cenarios), text=f"Simulando cenário: {', '.join(nomes_propostas_cenario)}")
-
-        # 1. Montar o DataFrame para o cenário atual
-        df_propostas_cenario = df_combinado[df_combinado['Campanha'].isin(nomes_propostas_cenario)]
-        df_cenario_atual = pd.concat([df_real, df_propostas_cenario], ignore_index=True)
-
-        # Adicionar a data de chegada para os cálculos de release date
-        map_proposta_data = {p['nome_proposta']: p['data_chegada'] for p in propostas_manuais}
-        df_cenario_atual['data_chegada'] = df_cenario_atual['Campanha'].map(map_proposta_data)
-
-        # 2. Preparar os parâmetros para a simulação
-        df_cenario_atual, ensaios, p, r_j, U, etapas_proc, recursos_proc = _preparar_parametros_simulacao(df_cenario_atual)
-
-        # 3. Executar a heurística
-        schedule_df = _executar_heuristica(ensaios, p, r_j, U, etapas_proc, recursos_proc)
-
-        # 4. Calcular e armazenar o prazo para cada proposta NESTE cenário
-        if not schedule_df.empty:
-            # Mapear 'Job' de volta para 'Campanha'
-            map_job_campanha = df_cenario_atual.set_index('Job')['Campanha'].to_dict()
-            schedule_df['Campanha'] = schedule_df['Job'].map(map_job_campanha)
-            map_job_ensaio = df_cenario_atual.set_index('Job')['Ensaio'].to_dict()
-            schedule_df['Ensaio'] = schedule_df['Job'].map(map_job_ensaio)
-
-            for nome_proposta in nomes_propostas_cenario:
-                ensaios_da_proposta = schedule_df[schedule_df['Campanha'] == nome_proposta]
-                if not ensaios_da_proposta.empty:
-                    # --- 1. CÁLCULO DO PRAZO GERAL DA PROPOSTA (para o st.metric) ---
-                    tempo_final_proposta_horas = ensaios_da_proposta['Fim'].max()
-                    prazo_dias_uteis_geral = tempo_final_proposta_horas / 17
-                    prazos_gerais_cenario[nome_proposta].append(prazo_dias_uteis_geral)
-
-                    # --- 2. CÁLCULO DOS PRAZOS DETALHADOS POR TIPO DE ENSAIO (para a tabela) ---
-                    # Itera sobre cada tipo de ensaio único dentro da proposta
-                    for tipo_ensaio in ensaios_da_proposta['Ensaio'].unique():
-                        # Encontra o tempo de conclusão do último ensaio DESTE TIPO
-                        ensaios_do_tipo = ensaios_da_proposta[ensaios_da_proposta['Ensaio'] == tipo_ensaio]
-                        tempo_final_ensaio_horas = ensaios_do_tipo['Fim'].max()
-                        
-                        # Converter para dias úteis
-                        prazo_dias_uteis = tempo_final_ensaio_horas / 17 
-                        
-                        # Armazena o prazo para a combinação (proposta, tipo_ensaio)
-                        prazos_detalhados_cenario[(nome_proposta, tipo_ensaio)].append(prazo_dias_uteis)
-
-    # 5. Calcular as médias para ambos os resultados
+    if modo == 'exaustivo':
+        for i in range(1, len(nomes_propostas) + 1):
+            cenarios.extend(combinations(nomes_propostas, i))
+    # Cada proposta entra no cenário com a sua probabilidade de fechamento.
+    probabilidades = np.array([p.get('probabilidade_fechamento', PROBABILIDADE_FECHAMENTO_PADRAO) for p in propostas_manuais], dtype=float)
+    nomes_com_chance = [nome for nome, prob in zip(nomes_propostas, probabilidades) if prob > 0]
+
+    def sortear_cenario(gerador):
+        while True:
+            fecham = gerador.random(len(nomes_propostas)) < probabilidades
+            if fecham.any():
+                return [nome for nome, fecha in zip(nomes_propostas, fecham) if fecha]
+
+    resumo_estocastico = {}
+    if replicacoes:
+        # 3. Modo estocástico: cada replicação sorteia as durações e simula os
+        #    seus cenários; as replicações são divididas entre os processos.
+        if semente is None:
+            semente = int(np.random.SeedSequence().entropy % 2**63)
+        gerador = np.random.default_rng(semente)
+        if modo == 'exaustivo':
+            cenarios_replicacao = [[list(cenario) for cenario in cenarios]] * replicacoes
+        else:
+            cenarios_replicacao = [[sortear_cenario(gerador)] if nomes_com_chance else [] for _ in range(replicacoes)]
+        sorteador = DuracoesEstocasticas(ensaios, p, df_base['Chave'], distribuicoes, semente)
+        processos = max_workers or os.cpu_count() or 1
+        blocos = [bloco.tolist() for bloco in np.array_split(np.arange(replicacoes), min(replicacoes, TAREFAS_POR_PROCESSO * processos))]
+        tarefas = [(base, sorteador, bloco, [cenarios_replicacao[k] for k in bloco], replicacoes) for bloco in blocos]
+        fracoes = [0.0] * len(tarefas)
+
+        def repassar(i, fracao, texto, **detalhes):
+            fracoes[i] = fracao
+            progredir(sum(f * len(bloco) for f, bloco in zip(fracoes, blocos)) / replicacoes, texto, **detalhes)
+
+        inicio = time.perf_counter()
+        if processos == 1:
+            resultados = [
+                _simular_replicacoes(*tarefa, ao_progredir=(lambda fracao, texto, i=i, **detalhes: repassar(i, fracao, texto, **detalhes)) if ao_progredir else None)
+                for i, tarefa in enumerate(tarefas)
+            ]
+        else:
+            resultados = executar_em_processos(_simular_replicacoes, tarefas, max_workers, ao_progredir=repassar if ao_progredir else None)
+        tempos['despacho'] = time.perf_counter() - inicio
+        # Acumulados na ordem das replicações, qualquer que seja a ordem de conclusão.
+        for prazos_bloco in resultados:
+            for prazos_replicacao in prazos_bloco:
+                for prazos_cenario in prazos_replicacao:
+                    acumular(prazos_cenario)
+        num_cenarios = sum(len(cenarios_k) for cenarios_k in cenarios_replicacao)
+        cenarios_distintos = len({frozenset(cenario) for cenarios_k in cenarios_replicacao for cenario in cenarios_k})
+        resumo_estocastico = {'replicacoes': replicacoes, 'semente': semente}
+    else:
+        # 3. Despachar a fila real uma vez e, a partir dela, cada cenário.
+        tempos['despacho'] = 0.0
+        simulacao = _PrazosCenarios(base, p, ao_despachar, tempos)
+        if modo == 'exaustivo':
+            for i, cenario in enumerate(cenarios):
+                nomes_propostas_cenario = list(cenario)
+                andamento.update(fracao=i / len(cenarios), peso=1 / len(cenarios), texto=f"Simulando cenário: {', '.join(nomes_propostas_cenario)}")
+                progredir(andamento['fracao'], andamento['texto'], cenario=i + 1)
+                acumular(simulacao.prazos(nomes_propostas_cenario, ao_despachar))
+            num_cenarios = len(cenarios)
+        else:
+            # Cenários sorteados até os intervalos ficarem estreitos; cenários
+            # repetidos não são simulados de novo.
+            gerador = np.random.default_rng(semente)
+            num_cenarios = 0
+            while nomes_com_chance and num_cenarios < MAX_AMOSTRAS:
+                nomes_propostas_cenario = sortear_cenario(gerador)
+                num_cenarios += 1
+                andamento.update(fracao=(num_cenarios - 1) / MAX_AMOSTRAS, peso=1 / MAX_AMOSTRAS, texto=f"Cenário sorteado {num_cenarios}: {', '.join(nomes_propostas_cenario)}")
+                progredir(andamento['fracao'], andamento['texto'], cenario=num_cenarios)
+                acumular(simulacao.prazos(nomes_propostas_cenario, ao_despachar))
+
+                if num_cenarios % LOTE_AMOSTRAS == 0 and all(
+                    _intervalos_estreitos(_estatisticas_prazo(prazos_gerais_cenario[nome])) for nome in nomes_com_chance
+                ):
+                    break
+        cenarios_distintos = len(simulacao.prazos_por_cenario)
+
+    progredir(1.0, f"{num_cenarios} cenários simulados", cenario=num_cenarios)
+
+    # 4. Calcular as médias e os percentis para ambos os resultados
+    com_intervalos = modo != 'exaustivo' or bool(replicacoes)
     prazos_gerais_medios = {}
+    estatisticas_propostas = {}
     for proposta, lista_prazos in prazos_gerais_cenario.items():
         if lista_prazos:
             prazos_gerais_medios[proposta] = np.mean(lista_prazos)
+            estatisticas_propostas[proposta] = _estatisticas_prazo(lista_prazos, com_intervalos)
 
     prazos_detalhados_medios = []
     for (proposta, ensaio), lista_prazos in prazos_detalhados_cenario.items():
@@ -336,8 +468,19 @@ def simular_prazos_propostas(df_combinado, propostas_manuais):
             prazos_detalhados_medios.append({
                 "Proposta": proposta,
                 "Ensaio": ensaio,
-                "Prazo de Entrega (dias úteis)": prazo_medio
+                "Prazo de Entrega (dias úteis)": prazo_medio,
+                "P50 (dias úteis)": float(np.percentile(lista_prazos, 50)),
+                f"P{PERCENTIL_PRAZO} (dias úteis)": float(np.percentile(lista_prazos, PERCENTIL_PRAZO)),
             })
 
-    barra_progresso.empty() # Limpa a barra de progresso
-    return prazos_gerais_medios, prazos_detalhados_medios
+    resumo = {
+        'modo': modo,
+        'num_cenarios': num_cenarios,
+        'cenarios_distintos': cenarios_distintos,
+        'estatisticas': estatisticas_propostas,
+        **resumo_estocastico,
+    }
+
+    tempos['total'] = time.perf_counter() - inicio_total
+    tempos['pos_processamento'] = tempos['total'] - tempos['parametrizacao'] - tempos['despacho']
+    return prazos_gerais_medios, prazos_detalhados_medios, resumo
@@ -0,0 +1,599 @@
+"""Parametrização compartilhada dos ensaios triaxiais do laboratório.
+
+Reúne as etapas de processamento, o cálculo vetorizado da duração de cada
+etapa, os recursos exigidos por etapa e a forma compilada dessa incidência
+usada pelo motor de despacho (``motor_heuristica``). ``param_capacidade`` e
+``param_prazos`` montam os parâmetros dos seus cenários a partir daqui.
+"""
+
+import logging
+import os
+import re
+import threading
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+ETAPAS_PROC = ['Prep_Ativa', 'Prep_Espera', 'Tarugo', 'Montagem Célula', 'Sat_CO2', 'Sat_H2O', 'Sat_Contrapressao', 'Adensamento', 'Rompimento', 'Romp&Adensa', 'Desmontagem', 'Liberacao_Celula']
+
+MAPEAMENTO_ETAPA_RECURSO = {
+    'Prep_Ativa': ['BANCADA_PREP_ATIVA'], 'Tarugo': ['BANCADA_TARUGO'], 'Montagem Célula': ['BANCADA_MONTAGEM', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'],
+    'Sat_CO2': ['LINHA_SAT_CO2', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'], 'Sat_H2O': ['PAINEL_SAT_H2O', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'],
+    'Sat_Contrapressao': ['PAINEL_SAT_CP', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'], 'Adensamento': ['BANCADA_ADEN_CONVENCIONAL', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'],
+    'Rompimento': ['PRENSA_ROMP_ISO', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'], 'Romp&Adensa': ['PRENSA_ESPECIAL_ANISO_CICLICO', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'],
+    'Desmontagem': ['BANCADA_DESM', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER'],
+}
+
+ENSAIOS_COM_SATURACAO = ["QCSD", "BE", "BEP"]
+ENSAIOS_SEM_ADENSAMENTO = ['UU', 'UUsat']
+ENSAIOS_DRENADOS = ["CID", "CIDsat", "CADsat", "CCIDsat", "QCSD", "CIDsat/GD", "CCADsat"]
+ENSAIOS_NAO_DRENADOS = ["CIUsat", "CIU", "UU", "UUsat", "CAU", "CAUsat", "EIUsat", "CIUsat/GD", "PN", "CK0", "CCAUsat"]
+PADRAO_DEFORMACAO = r'Deformação[:\s]*([0-9]+)%'
+
+# Ordem em que as etapas sempre foram gravadas em p[job]. O tempo total do
+# ensaio é somado nessa ordem, e ele entra no desempate do despacho.
+ORDEM_ETAPAS_P = ['Prep_Ativa', 'Prep_Espera', 'Tarugo', 'Montagem Célula', 'Sat_CO2', 'Sat_H2O', 'Sat_Contrapressao', 'Desmontagem', 'Liberacao_Celula', 'Romp&Adensa', 'Adensamento', 'Rompimento']
+# Colunas da matriz de durações (na ordem de ETAPAS_PROC) que vão para p[job].
+COLUNAS_P = [ETAPAS_PROC.index(etapa) for etapa in ORDEM_ETAPAS_P]
+
+# Cada tipo de ensaio ocupa apenas o seu modelo de célula.
+CELULA_POR_TIPO_ENSAIO = {
+    'Bender': 'CELULA_BENDER',
+    'Ciclico': 'CELULA_CICLICO',
+    'Iso': 'CELULA_CONVENCIONAL',
+    'Aniso': 'CELULA_CONVENCIONAL',
+}
+
+
+class IncidenciaRecursos:
+    """
+    Incidência ensaio × etapa × recurso compilada por tipo de ensaio.
+
+    Em vez de um dicionário esparso com uma chave por (job, etapa, recurso),
+    guarda para cada (tipo de ensaio, etapa) a tupla de índices dos recursos
+    exigidos, em ordem de ``recursos_proc``. Cada ensaio aponta para o seu tipo.
+    """
+
+    def __init__(self, tipos_por_job, etapas_proc, recursos_proc):
+        self.etapas_proc = list(etapas_proc)
+        self.recursos_proc = list(recursos_proc)
+        self.indice_etapa = {etapa: k for k, etapa in enumerate(self.etapas_proc)}
+        self.tipos = sorted(set(tipos_por_job), key=str)
+        indice_tipo = {tipo: t for t, tipo in enumerate(self.tipos)}
+        self.tipo_job = [indice_tipo[tipo] for tipo in tipos_por_job]
+        celulas = [res for res in self.recursos_proc if 'CELULA' in res]
+        self.recursos_tipo_etapa = []
+        for tipo in self.tipos:
+            celula_do_tipo = CELULA_POR_TIPO_ENSAIO.get(tipo)
+            por_etapa = []
+            for etapa in self.etapas_proc:
+                exigidos = set(MAPEAMENTO_ETAPA_RECURSO.get(etapa, []))
+                por_etapa.append(tuple(
+                    r for r, res in enumerate(self.recursos_proc)
+                    if res in exigidos and (res not in celulas or res == celula_do_tipo)
+                ))
+            self.recursos_tipo_etapa.append(por_etapa)
+        self._matriz = None
+
+    def recursos(self, i, k):
+        """Índices dos recursos exigidos pelo ensaio ``i`` na etapa ``k``."""
+        return self.recursos_tipo_etapa[self.tipo_job[i]][k]
+
+    def matriz(self):
+        """Incidência como array booleano tipos × etapas × recursos."""
+        if self._matriz is None:
+            self._matriz = np.zeros((len(self.tipos), len(self.etapas_proc), len(self.recursos_proc)), dtype=bool)
+            for t, por_etapa in enumerate(self.recursos_tipo_etapa):
+                for k, recursos in enumerate(por_etapa):
+                    self._matriz[t, k, list(recursos)] = True
+        return self._matriz
+
+
+class VisaoIncidencia(Mapping):
+    """
+    Visão somente leitura da incidência no formato do antigo dicionário ``U``.
+
+    ``U[(job, etapa, recurso)]`` vale 1 quando a etapa tem duração positiva e
+    exige o recurso; as demais chaves não existem, como antes.
+    """
+
+    def __init__(self, ensaios, p, incidencia):
+        self._ensaios = list(ensaios)
+        self._indice_job = {job: i for i, job in enumerate(self._ensaios)}
+        self._p = p
+        self._incidencia = incidencia
+
+    def _recursos(self, i, etapa):
+        k = self._incidencia.indice_etapa[etapa]
+        return [self._incidencia.recursos_proc[r] for r in self._incidencia.recursos(i, k)]
+
+    def __getitem__(self, chave):
+        job, etapa, recurso = chave
+        i = self._indice_job.get(job)
+        if i is None or etapa not in self._incidencia.indice_etapa or self._p[job].get(etapa, 0) <= 0:
+            raise KeyError(chave)
+        if recurso not in self._recursos(i, etapa):
+            raise KeyError(chave)
+        return 1
+
+    def __iter__(self):
+        for i, job in enumerate(self._ensaios):
+            for etapa in self._incidencia.etapas_proc:
+                if self._p[job].get(etapa, 0) > 0:
+                    for recurso in self._recursos(i, etapa):
+                        yield (job, etapa, recurso)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def compilar_incidencia(ensaios, p, tipos_ensaio, etapas_proc, recursos_proc):
+    """
+    Compila a incidência de recursos dos ensaios.
+
+    Returns:
+        tuple: (IncidenciaRecursos, VisaoIncidencia) — a forma compilada usada
+        pelo motor e a visão compatível com o antigo dicionário ``U``.
+    """
+    incidencia = IncidenciaRecursos([tipos_ensaio.get(job) for job in ensaios], etapas_proc, recursos_proc)
+    return incidencia, VisaoIncidencia(ensaios, p, incidencia)
+
+
+def _contem_algum(texto, termos):
+    return texto.str.contains('|'.join(re.escape(t) for t in termos), regex=True)
+
+
+def calcular_duracoes_etapas(df):
+    """
+    Calcula a duração (h) de cada etapa de todos os ensaios de uma só vez.
+
+    Aplica as mesmas regras que antes eram avaliadas linha a linha com
+    ``apply``: preparação e tarugo pelo tipo de amostra, saturação e
+    adensamento pelo ensaio e pelo nome da amostra (areias são mais rápidas),
+    rompimento pela deformação da especificação técnica, altura do tarugo e
+    velocidade de carregamento.
+
+    Returns:
+        tuple: (matriz n_ensaios × len(ETAPAS_PROC) com as durações,
+        array com o tipo de cada ensaio: 'Iso', 'Aniso', 'Ciclico' ou 'Bender').
+    """
+    n = len(df)
+    ensaio = df['Ensaio']
+    es_texto = np.fromiter((isinstance(v, str) for v in ensaio), dtype=bool, count=n)
+    ensaio_txt = ensaio.where(es_texto, '').astype(str)
+    ensaio_str = ensaio.astype(str)
+    deformada = (df['Tipo Amostra'] == 'Deformada').to_numpy()
+    if 'Nome Amostra' in df.columns:
+        arenosa = df['Nome Amostra'].astype(str).str.lower().str.contains('aren', regex=False).to_numpy()
+    else:
+        arenosa = np.zeros(n, dtype=bool)
+
+    com_saturacao = es_texto & (ensaio_txt.str.lower().str.contains('sat', regex=False) | ensaio_txt.isin(ENSAIOS_COM_SATURACAO)).to_numpy()
+    sat_h2o = np.where(com_saturacao, np.where(arenosa, 12.0, 24.0), 0.0)
+    sat_co2 = np.where(com_saturacao, 20/60.0, 0.0)
+    contrapressao = np.where(com_saturacao, 4.5, 0.0)
+    adensamento = np.where(ensaio.isin(ENSAIOS_SEM_ADENSAMENTO).to_numpy(), 0.0, np.where(arenosa, 40 / 60.0, 2.0))
+
+    if 'Especificação Técnica Ensaio' in df.columns:
+        deformacao = pd.to_numeric(
+            df['Especificação Técnica Ensaio'].astype(str).str.extract(PADRAO_DEFORMACAO, expand=False),
+            errors='coerce',
+        ).fillna(20).to_numpy()
+    else:
+        deformacao = np.full(n, 20)
+    altura = np.where(es_texto & ensaio_txt.str.contains('GD', regex=False).to_numpy(), 202, 102)
+    drenado = es_texto & _contem_algum(ensaio_txt, ENSAIOS_DRENADOS).to_numpy()
+    nao_drenado = es_texto & _contem_algum(ensaio_txt, ENSAIOS_NAO_DRENADOS).to_numpy()
+    velocidade = np.where(drenado, 0.045, np.where(nao_drenado, 0.09, 0.0))
+    rompido = drenado | nao_drenado
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rompimento = np.where(rompido & (velocidade != 0), ((altura * (deformacao / 100)) / velocidade) / 60, 0.0)
+
+    tipos = np.select(
+        [ensaio_str.str.startswith('CC').to_numpy(), (ensaio_str.str[1] == 'I').to_numpy(), ensaio_str.str.startswith('BE').to_numpy()],
+        ['Ciclico', 'Iso', 'Bender'],
+        default='Aniso',
+    )
+
+    def nao_negativo(valores):
+        valores = np.asarray(valores, dtype=float)
+        return np.where(np.isnan(valores) | (valores < 0), 0.0, valores)
+
+    adensamento, rompimento = nao_negativo(adensamento), nao_negativo(rompimento)
+    # Em ensaios anisotrópicos e cíclicos o adensamento e o rompimento são
+    # feitos juntos na prensa especial.
+    junto = np.isin(tipos, ['Aniso', 'Ciclico'])
+    colunas = {
+        'Prep_Ativa': np.where(deformada, 60 / 60.0, 30 / 60.0),
+        'Prep_Espera': np.where(deformada, 24.0, 0.0),
+        'Tarugo': np.where(deformada, 30 / 60.0, 10 / 60.0),
+        'Montagem Célula': np.full(n, 10 / 60.0),
+        'Sat_CO2': sat_co2,
+        'Sat_H2O': sat_h2o,
+        'Sat_Contrapressao': contrapressao,
+        'Adensamento': np.where(junto, 0.0, adensamento),
+        'Rompimento': np.where(junto, 0.0, rompimento),
+        'Romp&Adensa': np.where(junto, adensamento + rompimento, 0.0),
+        'Desmontagem': np.full(n, 20 / 60.0),
+        'Liberacao_Celula': np.zeros(n),
+    }
+    duracoes = np.column_stack([nao_negativo(colunas[etapa]) for etapa in ETAPAS_PROC]) if n else np.zeros((0, len(ETAPAS_PROC)))
+    return duracoes, tipos
+
+
+def identificar_modelos_ensaios(df):
+    """
+    Agrupa os ensaios pela assinatura que determina as durações das etapas.
+
+    A assinatura é (Ensaio, amostra deformada, areia, deformação da
+    especificação técnica). Filas reais e simuladas têm poucas dezenas de
+    assinaturas distintas, então as durações são calculadas uma vez por
+    modelo em vez de uma vez por linha.
+
+    Returns:
+        tuple: (índice do modelo de cada linha, posição da primeira linha de
+        cada modelo em ``df``).
+    """
+    n = len(df)
+    if n == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    def por_valor_distinto(coluna, funcao):
+        # Avalia ``funcao`` só nos valores distintos da coluna.
+        codigos, valores = pd.factorize(coluna, use_na_sentinel=False)
+        return np.asarray(funcao(pd.Series(valores, dtype=object)))[codigos]
+
+    ensaio, _ = pd.factorize(df['Ensaio'], use_na_sentinel=False)
+    deformada = (df['Tipo Amostra'] == 'Deformada').to_numpy()
+    if 'Nome Amostra' in df.columns:
+        arenosa = por_valor_distinto(df['Nome Amostra'], lambda v: v.astype(str).str.lower().str.contains('aren', regex=False))
+    else:
+        arenosa = np.zeros(n, dtype=bool)
+    if 'Especificação Técnica Ensaio' in df.columns:
+        deformacao = por_valor_distinto(
+            df['Especificação Técnica Ensaio'],
+            lambda v: pd.to_numeric(v.astype(str).str.extract(PADRAO_DEFORMACAO, expand=False), errors='coerce').fillna(20),
+        )
+    else:
+        deformacao = np.full(n, 20)
+
+    modelo_job, _ = pd.MultiIndex.from_arrays([ensaio, deformada, arenosa, deformacao]).factorize()
+    # Os códigos seguem a ordem da primeira ocorrência de cada modelo.
+    _, primeira_linha = np.unique(modelo_job, return_index=True)
+    return modelo_job, primeira_linha
+
+
+def _montar_parametros(ensaios, modelo_job, p_modelos, tipos_modelos, liberacao, recursos_proc):
+    """``p``, ``r_j`` e incidência a partir do modelo de cada ensaio."""
+    p = {job: p_modelos[m] for job, m in zip(ensaios, modelo_job.tolist())}
+    r_j = dict(zip(ensaios, pd.Series(liberacao).tolist()))
+    tipos_ensaio = dict(zip(ensaios, [tipos_modelos[m] for m in modelo_job.tolist()]))
+    incidencia, U = compilar_incidencia(ensaios, p, tipos_ensaio, ETAPAS_PROC, recursos_proc)
+    return ensaios, p, r_j, U, incidencia
+
+
+def parametrizar_ensaios(df, ensaios, liberacao, recursos_proc):
+    """
+    Monta todos os parâmetros da heurística para os ensaios de ``df``.
+
+    As durações são calculadas por modelo de ensaio (ver
+    ``identificar_modelos_ensaios``) e ``p[job]`` aponta para o dicionário do
+    seu modelo, compartilhado por todos os ensaios iguais — por isso ele não
+    deve ser alterado no lugar.
+
+    Args:
+        df (pd.DataFrame): uma linha por ensaio, na mesma ordem de ``ensaios``.
+        ensaios (list): identificador (Job) de cada linha.
+        liberacao (array-like): data de liberação (h) de cada linha.
+        recursos_proc (list): recursos considerados, na ordem de desempate do gargalo.
+
+    Returns:
+        tuple: (ensaios, p, r_j, U, incidencia).
+    """
+    ensaios = list(ensaios)
+    modelo_job, primeira_linha = identificar_modelos_ensaios(df)
+    duracoes, tipos = calcular_duracoes_etapas(df.iloc[primeira_linha])
+    p_modelos = [dict(zip(ORDEM_ETAPAS_P, linha)) for linha in duracoes[:, COLUNAS_P].tolist()]
+    return _montar_parametros(ensaios, modelo_job, p_modelos, tipos.tolist(), liberacao, recursos_proc)
+
+
+# =========================================================================
+#         CACHE DOS PARÂMETROS POR ENSAIO ENTRE SIMULAÇÕES
+# =========================================================================
+# Colunas de origem das quais dependem os parâmetros de um ensaio.
+COLUNAS_ORIGEM_PARAMETROS = ['Ensaio', 'Tipo Amostra', 'Nome Amostra', 'Especificação Técnica Ensaio']
+# Acima deste número de linhas guardadas, o cache recomeça vazio.
+MAX_LINHAS_CACHE = 500_000
+# Versão das regras de duração gravada no arquivo do cache. Aumente-a ao
+# mudar ``calcular_duracoes_etapas`` ou ``identificar_modelos_ensaios``: um
+# arquivo gravado com outra versão é descartado na carga.
+VERSAO_PARAMETROS = 1
+
+
+def chaves_estaveis(identificadores):
+    """
+    Identidade estável de cada linha: o identificador (``ID Ensaio/CP``)
+    seguido da ordem da linha entre as de mesmo identificador. Os ensaios
+    de uma proposta, que compartilham o identificador, ficam distintos pela
+    sua posição na proposta.
+    """
+    identificadores = pd.Series(identificadores, dtype=object).astype(str).reset_index(drop=True)
+    ordem = identificadores.groupby(identificadores, sort=False).cumcount().astype(str)
+    return (identificadores + '#' + ordem).to_numpy()
+
+
+def hash_origem(df):
+    """Hash das colunas de origem dos parâmetros de cada linha de ``df``."""
+    colunas = [coluna for coluna in COLUNAS_ORIGEM_PARAMETROS if coluna in df.columns]
+    return pd.util.hash_pandas_object(df[colunas].astype(str), index=False).to_numpy()
+
+
+class CacheParametros:
+    """
+    Parâmetros dos ensaios guardados entre chamadas, pela identidade estável da linha.
+
+    Cada linha já vista guarda o hash das suas colunas de origem e o modelo de
+    durações a que pertence; numa nova chamada, só as linhas novas ou
+    alteradas passam por ``identificar_modelos_ensaios`` e
+    ``calcular_duracoes_etapas``, e as demais são montadas por consulta. Os
+    modelos com as mesmas durações e tipo compartilham o dicionário de ``p``,
+    como em ``parametrizar_ensaios``. A data de liberação é sempre a informada
+    na chamada. Pode ser usado por várias threads.
+
+    Com ``arquivo``, o cache também fica em disco, em Parquet: é carregado na
+    primeira chamada e regravado quando alguma linha é parametrizada. Assim
+    um processo novo (a página reiniciada ou uma execução em lote) só
+    parametriza o que mudou na fila desde a última simulação. Falhas de
+    leitura ou gravação do arquivo são registradas no ``logging`` e o cache
+    segue em memória; a gravação é tentada de novo na próxima parametrização.
+    """
+
+    def __init__(self, max_linhas=MAX_LINHAS_CACHE, arquivo=None):
+        self.max_linhas = max_linhas
+        self.arquivo = arquivo
+        self._trava = threading.Lock()
+        self._carregado = arquivo is None
+        self.limpar()
+
+    def limpar(self):
+        """Esvazia o cache (e o arquivo, se houver)."""
+        self._p_modelos, self._tipos_modelos, self._indice_modelo = [], [], {}
+        self._chaves = pd.Index([], dtype=object)
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._modelo_linha = np.zeros(0, dtype=np.int64)
+        self.acertos = self.faltas = 0
+        if self._carregado and self.arquivo and os.path.exists(self.arquivo):
+            try:
+                os.remove(self.arquivo)
+            except OSError as erro:
+                logger.warning("Cache de parâmetros: não foi possível apagar '%s' (%s).", self.arquivo, erro)
+
+    # ---------------------------------------------------------------------
+    # Arquivo Parquet: uma linha por ensaio, com a chave estável, o hash da
+    # origem, o modelo, o tipo e as durações de cada etapa (colunas de
+    # ORDEM_ETAPAS_P). O modelo numera as combinações de durações e tipo do
+    # próprio arquivo e evita reagrupar as linhas na carga.
+    # É regravado inteiro, em um arquivo temporário trocado de uma vez, para
+    # que outro processo nunca leia um arquivo pela metade.
+    # ---------------------------------------------------------------------
+    def _carregar(self):
+        self._carregado = True
+        if not os.path.exists(self.arquivo):
+            return
+        try:
+            tabela = pd.read_parquet(self.arquivo)
+        except (OSError, pa.ArrowException) as erro:
+            # O arquivo ilegível é substituído na próxima gravação.
+            logger.warning("Cache de parâmetros: arquivo '%s' ignorado (%s).", self.arquivo, erro)
+            return
+        colunas = ['chave', 'hash', 'modelo', 'tipo'] + ORDEM_ETAPAS_P
+        if tabela.attrs.get('versao_parametros') != VERSAO_PARAMETROS or not set(colunas) <= set(tabela.columns):
+            return
+        modelo_tabela, primeira_linha = np.unique(tabela['modelo'].to_numpy(dtype=np.int64), return_index=True)
+        primeiras = tabela.iloc[primeira_linha]
+        modelos = np.zeros(modelo_tabela.max() + 1 if len(modelo_tabela) else 0, dtype=np.int64)
+        modelos[modelo_tabela] = [
+            self._modelo(tuple(linha), tipo)
+            for linha, tipo in zip(primeiras[ORDEM_ETAPAS_P].to_numpy(dtype=float).tolist(), primeiras['tipo'].tolist())
+        ]
+        self._chaves = pd.Index(tabela['chave'].to_numpy(dtype=object), dtype=object)
+        self._hashes = tabela['hash'].to_numpy(dtype=np.int64).view(np.uint64)
+        self._modelo_linha = modelos[tabela['modelo'].to_numpy(dtype=np.int64)]
+
+    def _gravar(self):
+        duracoes = np.array([[p[etapa] for etapa in ORDEM_ETAPAS_P] for p in self._p_modelos], dtype=float).reshape(-1, len(ORDEM_ETAPAS_P))
+        tabela = pd.DataFrame(duracoes[self._modelo_linha], columns=ORDEM_ETAPAS_P)
+        tabela.insert(0, 'chave', self._chaves.to_numpy(dtype=object))
+        tabela.insert(1, 'hash', self._hashes.view(np.int64))
+        tabela.insert(2, 'modelo', self._modelo_linha)
+        tabela.insert(3, 'tipo', np.array(self._tipos_modelos, dtype=object)[self._modelo_linha])
+        tabela.attrs['versao_parametros'] = VERSAO_PARAMETROS
+        temporario = f"{self.arquivo}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.arquivo)), exist_ok=True)
+            tabela.to_parquet(temporario, index=False)
+            os.replace(temporario, self.arquivo)
+        except (OSError, pa.ArrowException) as erro:
+            logger.warning("Cache de parâmetros: não foi possível gravar '%s' (%s).", self.arquivo, erro)
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+    def _modelos_das_linhas(self, df, chaves):
+        hashes = hash_origem(df)
+        posicao = self._chaves.get_indexer(chaves)
+        conhecida = posicao >= 0
+        acerto = np.zeros(len(chaves), dtype=bool)
+        acerto[conhecida] = self._hashes[posicao[conhecida]] == hashes[conhecida]
+        modelo_job = np.zeros(len(chaves), dtype=np.int64)
+        modelo_job[acerto] = self._modelo_linha[posicao[acerto]]
+
+        faltantes = np.flatnonzero(~acerto)
+        if len(faltantes):
+            modelo_local, primeira_linha = identificar_modelos_ensaios(df.iloc[faltantes])
+            duracoes, tipos = calcular_duracoes_etapas(df.iloc[faltantes[primeira_linha]])
+            modelos = np.array([
+                self._modelo(tuple(linha), tipo) for linha, tipo in zip(duracoes[:, COLUNAS_P].tolist(), tipos.tolist())
+            ], dtype=np.int64)
+            modelo_job[faltantes] = modelos[modelo_local]
+            # Linhas alteradas são atualizadas no lugar; as novas entram no fim.
+            alteradas = faltantes[conhecida[faltantes]]
+            self._hashes[posicao[alteradas]] = hashes[alteradas]
+            self._modelo_linha[posicao[alteradas]] = modelo_job[alteradas]
+            novas = faltantes[~conhecida[faltantes]]
+            self._chaves = self._chaves.append(pd.Index(chaves[novas], dtype=object))
+            self._hashes = np.concatenate([self._hashes, hashes[novas]])
+            self._modelo_linha = np.concatenate([self._modelo_linha, modelo_job[novas]])
+            if self.arquivo:
+                self._gravar()
+        self.acertos += len(chaves) - len(faltantes)
+        self.faltas += len(faltantes)
+        return modelo_job
+
+    def _modelo(self, duracoes, tipo):
+        chave = (duracoes, tipo)
+        if chave not in self._indice_modelo:
+            self._indice_modelo[chave] = len(self._p_modelos)
+            self._p_modelos.append(dict(zip(ORDEM_ETAPAS_P, duracoes)))
+            self._tipos_modelos.append(tipo)
+        return self._indice_modelo[chave]
+
+    def parametrizar(self, df, chaves, ensaios, liberacao, recursos_proc):
+        """
+        Mesmo resultado de ``parametrizar_ensaios``, consultando o cache.
+
+        Args:
+            chaves (array-like): identidade estável de cada linha (ver ``chaves_estaveis``), sem repetições.
+        """
+        ensaios = list(ensaios)
+        chaves = np.asarray(chaves, dtype=object)
+        with self._trava:
+            if not self._carregado:
+                self._carregar()
+            if len(self._chaves) > self.max_linhas:
+                self.limpar()
+            modelo_job = self._modelos_das_linhas(df, chaves)
+            p_modelos, tipos_modelos = list(self._p_modelos), list(self._tipos_modelos)
+        return _montar_parametros(ensaios, modelo_job, p_modelos, tipos_modelos, liberacao, recursos_proc)
+
+
+# =========================================================================
+#         DURAÇÕES ESTOCÁSTICAS DAS ETAPAS
+# =========================================================================
+# Distribuição do fator que multiplica a duração nominal de cada etapa:
+# ('triangular', mínimo, moda, máximo) ou ('lognormal', coeficiente de
+# variação), esta com média 1. A moda 1 mantém a duração nominal como a mais
+# provável; a cauda à direita representa os atrasos, mais longos nas etapas
+# que dependem do solo (saturação, adensamento e rompimento) do que nas de
+# bancada. Etapas ausentes, como a espera da preparação, ficam com a
+# duração nominal.
+DISTRIBUICOES_DURACAO_PADRAO = {
+    'Prep_Ativa': ('triangular', 0.8, 1.0, 1.5),
+    'Tarugo': ('triangular', 0.8, 1.0, 1.5),
+    'Montagem Célula': ('triangular', 0.8, 1.0, 1.5),
+    'Sat_H2O': ('triangular', 0.75, 1.0, 2.0),
+    'Sat_Contrapressao': ('triangular', 0.8, 1.0, 1.6),
+    'Adensamento': ('triangular', 0.75, 1.0, 2.0),
+    'Rompimento': ('lognormal', 0.15),
+    'Romp&Adensa': ('lognormal', 0.2),
+    'Desmontagem': ('triangular', 0.8, 1.0, 1.5),
+}
+
+
+def validar_distribuicoes(distribuicoes):
+    """Levanta ``ValueError`` se alguma etapa ou distribuição de ``distribuicoes`` for inválida."""
+    for etapa, distribuicao in distribuicoes.items():
+        if etapa not in ORDEM_ETAPAS_P:
+            raise ValueError(f"Etapa desconhecida nas distribuições de duração: '{etapa}'.")
+        distribuicao = tuple(distribuicao)
+        if distribuicao[:1] == ('triangular',) and len(distribuicao) == 4 and 0 <= distribuicao[1] <= distribuicao[2] <= distribuicao[3]:
+            continue
+        if distribuicao[:1] == ('lognormal',) and len(distribuicao) == 2 and distribuicao[1] >= 0:
+            continue
+        raise ValueError(
+            f"Distribuição inválida para '{etapa}': {distribuicao!r}. "
+            "Use ('triangular', mínimo, moda, máximo) ou ('lognormal', coeficiente de variação)."
+        )
+
+
+def _misturar(x):
+    """Finalizador do splitmix64: espalha os bits de cada inteiro de ``x`` (array uint64)."""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _fatores(distribuicao, u1, u2):
+    """Fatores da ``distribuicao`` pela inversa da acumulada (triangular) ou por Box-Muller (lognormal)."""
+    if distribuicao[0] == 'triangular':
+        _, minimo, moda, maximo = distribuicao
+        amplitude = maximo - minimo
+        if amplitude <= 0:
+            return np.full(len(u1), float(moda))
+        return np.where(
+            u1 < (moda - minimo) / amplitude,
+            minimo + np.sqrt(u1 * amplitude * (moda - minimo)),
+            maximo - np.sqrt((1 - u1) * amplitude * (maximo - moda)),
+        )
+    sigma = np.sqrt(np.log1p(distribuicao[1] ** 2))
+    normal = np.sqrt(-2 * np.log(u1)) * np.cos(2 * np.pi * u2)
+    return np.exp(sigma * normal - sigma ** 2 / 2)
+
+
+class DuracoesEstocasticas:
+    """
+    Sorteio das durações das etapas de cada ensaio, replicação a replicação.
+
+    Cada etapa com distribuição em ``distribuicoes`` tem a duração nominal de
+    ``p`` multiplicada por um fator sorteado; as demais, e as etapas que o
+    ensaio não tem, ficam como estão. Os números aleatórios são comuns: o
+    fator de um ensaio na replicação ``k`` depende só da sua chave estável
+    (ver ``chaves_estaveis``), de ``k``, da etapa e da ``semente``. O mesmo
+    ensaio tem, portanto, as mesmas durações em todos os cenários de
+    propostas de uma replicação e em execuções com a mesma semente, e a
+    diferença entre dois cenários não se mistura com o ruído do sorteio. O
+    sorteio é vetorizado sobre todos os ensaios e não depende de estado
+    guardado, então as replicações podem ser feitas em qualquer processo.
+    """
+
+    def __init__(self, ensaios, p, chaves, distribuicoes=None, semente=0):
+        distribuicoes = DISTRIBUICOES_DURACAO_PADRAO if distribuicoes is None else distribuicoes
+        validar_distribuicoes(distribuicoes)
+        self.ensaios = list(ensaios)
+        self.semente = np.uint64(int(semente) % 2**64)
+        # Durações nominais por ensaio, montadas uma vez por modelo (dicionário de p).
+        indice_modelo, modelos = {}, []
+        modelo_job = np.empty(len(self.ensaios), dtype=np.int64)
+        for k, job in enumerate(self.ensaios):
+            p_job = p[job]
+            if id(p_job) not in indice_modelo:
+                indice_modelo[id(p_job)] = len(modelos)
+                modelos.append([p_job.get(etapa, 0.0) for etapa in ORDEM_ETAPAS_P])
+            modelo_job[k] = indice_modelo[id(p_job)]
+        self.nominais = np.array(modelos, dtype=float).reshape(-1, len(ORDEM_ETAPAS_P))[modelo_job]
+        self.hash_chaves = pd.util.hash_array(np.asarray(chaves, dtype=object))
+        self.distribuicoes = [(ORDEM_ETAPAS_P.index(etapa), tuple(d)) for etapa, d in distribuicoes.items()]
+
+    def _uniformes(self, replicacao, fluxo):
+        """Uniformes em (0, 1), uma por ensaio, do ``fluxo`` da ``replicacao``."""
+        chave = _misturar(_misturar(_misturar(np.array([self.semente])) ^ np.uint64(replicacao)) ^ np.uint64(fluxo))
+        bits = _misturar(self.hash_chaves ^ chave) >> np.uint64(11)
+        return (bits.astype(float) + 0.5) * 2.0 ** -53
+
+    def sortear(self, replicacao):
+        """
+        Durações da ``replicacao`` (inteiro não negativo).
+
+        Returns:
+            dict: ``p`` no formato de ``parametrizar_ensaios``, com um
+            dicionário próprio por ensaio.
+        """
+        duracoes = self.nominais.copy()
+        for coluna, distribuicao in self.distribuicoes:
+            # Dois fluxos por etapa, fixos pela posição da etapa em ORDEM_ETAPAS_P.
+            u1, u2 = self._uniformes(replicacao, 2 * coluna), self._uniformes(replicacao, 2 * coluna + 1)
+            duracoes[:, coluna] *= _fatores(distribuicao, u1, u2)
+        return {job: dict(zip(ORDEM_ETAPAS_P, linha)) for job, linha in zip(self.ensaios, duracoes.tolist())}
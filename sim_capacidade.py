@@ -1,63 +1,12 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import math
-from datetime import datetime, timedelta
-from collections import defaultdict
+import os
 import matplotlib.pyplot as plt
-from param_capacidade import calcular_parametros_completos # Mantenha a importação do seu motor de cálculo
+from param_capacidade import executar_replicacoes, consolidar_replicacoes, ESTRATEGIA_PADRAO # Mantenha a importação do seu motor de cálculo
+from execucao_fundo import ExecucaoEmSegundoPlano, acompanhar_execucao
 
 
-def gerar_demanda_simulada(num_jobs, prazo_dias):
-    """
-    Cria um DataFrame com a demanda de jobs simulada.
-    (Esta função foi movida para cá, pois é específica desta simulação)
-    """
-    print(f"--- Gerando demanda simulada para {num_jobs} jobs ---")
-    distribuicao_historica = [
-        {"Ensaio": "CIUsat", "Tipo Amostra": "Indeformada", "Percentual": 34.8},
-        {"Ensaio": "CIUsat", "Tipo Amostra": "Deformada", "Percentual": 22.7},
-        {"Ensaio": "CIDsat", "Tipo Amostra": "Indeformada", "Percentual": 22.5},
-        {"Ensaio": "CIDsat", "Tipo Amostra": "Deformada", "Percentual": 9.2},
-        {"Ensaio": "CADsat", "Tipo Amostra": "Deformada", "Percentual": 1.5},
-        {"Ensaio": "CAUsat", "Tipo Amostra": "Deformada", "Percentual": 1.4},
-        {"Ensaio": "CAUsat", "Tipo Amostra": "Indeformada", "Percentual": 1.4},
-        {"Ensaio": "CADsat", "Tipo Amostra": "Indeformada", "Percentual": 1.1},
-        {"Ensaio": "CIU", "Tipo Amostra": "Indeformada", "Percentual": 1.0},
-        {"Ensaio": "BE", "Tipo Amostra": "Indeformada", "Percentual": 0.8},
-        {"Ensaio": "CID", "Tipo Amostra": "Indeformada", "Percentual": 0.6},
-        {"Ensaio": "CIDsat/GD", "Tipo Amostra": "Deformada", "Percentual": 0.4},
-        {"Ensaio": "CIUsat/GD", "Tipo Amostra": "Deformada", "Percentual": 0.4},
-        {"Ensaio": "BEP", "Tipo Amostra": "Deformada", "Percentual": 0.3},
-        {"Ensaio": "UUsat", "Tipo Amostra": "Deformada", "Percentual": 0.3},
-        {"Ensaio": "BE", "Tipo Amostra": "Deformada", "Percentual": 0.2},
-        {"Ensaio": "PN", "Tipo Amostra": "Indeformada", "Percentual": 0.2},
-        {"Ensaio": "UUsat", "Tipo Amostra": "Indeformada", "Percentual": 0.2},
-    ]
-    df_dist = pd.DataFrame(distribuicao_historica)
-    df_dist['Probabilidade'] = df_dist['Percentual'] / df_dist['Percentual'].sum()
-
-    indices_sorteados = np.random.choice(df_dist.index, size=num_jobs, p=df_dist['Probabilidade'])
-    df_sorteado = df_dist.loc[indices_sorteados].reset_index(drop=True)
-
-    random_days = np.random.randint(0, prazo_dias, size=num_jobs)
-    datas_inicio = random_days
-
-    df_simulado = pd.DataFrame({
-        "ID Ensaio/CP": range(num_jobs),
-        "Campanha": "Simulada",
-        "Amostra": [f"Amostra_Sim_{i}" for i in range(num_jobs)],
-        "Nome Amostra": np.random.choice(['Argila arenosa', 'Silte argiloso', 'Areia siltosa'], size=num_jobs),
-        "Tipo Amostra": df_sorteado["Tipo Amostra"],
-        "Ensaio": df_sorteado["Ensaio"],
-        "Início Plan Atual": datas_inicio,
-        "Especificação Técnica Ensaio": "Deformação: 20%"
-    })
-    return df_simulado
-
-def calcular_total_recursos(config):
-    return sum(v for k, v in config.items() if 'CELULA' not in k and 'PAINEL' not in k)
-
 def render():
     """
     Renderiza a página de Simulação de Capacidade.
@@ -104,7 +53,7 @@ def render_triaxial():
         prazo_dias = st.number_input("Prazo ideal (dias):", min_value=1, max_value=365, value=22, step=1)
 
     with col2:
-        num_simulacoes = st.number_input("Número de simulações:", min_value=1, max_value=10, value=1, step=1)
+        num_simulacoes = st.number_input("Número de simulações:", min_value=1, max_value=100, value=1, step=1)
         recursos_dimensionaveis = [
             'BANCADA_PREP_ATIVA', 'BANCADA_TARUGO', 'BANCADA_MONTAGEM',
             'LINHA_SAT_CO2', 'BANCADA_DESM', 'PRENSA_ESPECIAL_ANISO_CICLICO',
@@ -116,88 +65,62 @@ def render_triaxial():
             options=sorted(recursos_dimensionaveis),
             help="Selecione os recursos que você NÃO quer que o simulador aumente a capacidade."
         )
+        estrategia = st.radio(
+            "Estratégia de dimensionamento:", options=['incremental', 'bissecao'],
+            index=['incremental', 'bissecao'].index(ESTRATEGIA_PADRAO), horizontal=True,
+            format_func={'bissecao': "Busca binária no gargalo", 'incremental': "+1 por iteração"}.get,
+            help="A busca binária encontra quantas unidades tiram o recurso da posição de gargalo com menos simulações, "
+                 "mas pode recomendar uma configuração diferente da do +1 por iteração."
+        )
+        num_candidatos = st.number_input(
+            "Gargalos avaliados por iteração:", min_value=1, max_value=5, value=1, step=1,
+            disabled=estrategia != 'incremental',
+            help="Com mais de um, o +1 em cada um dos maiores gargalos é simulado em paralelo e o melhor resultado é mantido."
+        )
+        max_workers = st.number_input("Processos paralelos:", min_value=1, max_value=os.cpu_count() or 1, value=os.cpu_count() or 1, step=1)
     tolerancia_prazo = 5
 
     st.markdown("---")
     
-    iniciar_simulacao = st.button("Iniciar Dimensionamento", type="primary", use_container_width=True)
+    # O dimensionamento roda em segundo plano; a página acompanha o progresso
+    # e pode cancelá-lo, sem ficar bloqueada até o fim.
+    execucao = st.session_state.get('execucao_capacidade')
+    em_andamento = execucao is not None and execucao.em_andamento()
+    iniciar_simulacao = st.button("Iniciar Dimensionamento", type="primary", use_container_width=True, disabled=em_andamento)
     if iniciar_simulacao:
-        st.info("Iniciando a simulação... Por favor, aguarde.")
-        barra_de_progresso = st.progress(0, text="Inicializando...")
-        
-        recurso_final_tracker = None
-        makespan_final_tracker = float('inf')
-        total_recursos_da_melhor_config_tracker = float('inf')
-
-        soma_makespan = 0.0
-        soma_makespan_real = 0.0
-        soma_recursos = defaultdict(int)
-        soma_gargalo = pd.DataFrame()
-        soma_gargalo_real = pd.DataFrame()
-        num_melhores_encontrados = 0
-
-        for i in range(num_simulacoes):
-            barra_de_progresso.progress(i / num_simulacoes, text=f"Executando Simulação Mestra {i+1}/{num_simulacoes}...")
-            
-            df = gerar_demanda_simulada(quantidade_jobs,prazo_dias)
-            recursos_1, makespan_1, gargalo, makespan_real, gargalo_real = calcular_parametros_completos(df, prazo_dias, tolerancia_prazo/100, 5 + num_simulacoes, recursos_fixos)
-            total_recursos_atual = calcular_total_recursos(recursos_1)
-
-            soma_makespan_real+=makespan_real
-            if soma_gargalo_real.empty:
-                soma_gargalo_real = gargalo_real.set_index('Recurso')
-            else:
-                # Alinha os DataFrames pelo 'Recurso' e soma apenas as colunas numéricas
-                soma_gargalo_real = soma_gargalo_real.add(gargalo_real.set_index('Recurso'), fill_value=0)
-
-
-            # Lógica para determinar se a configuração da simulação atual é a "melhor" até agora
-            if recurso_final_tracker is None or \
-               makespan_1 < makespan_final_tracker - 1.5 or \
-               (abs(makespan_1 - makespan_final_tracker) < 1.5 and total_recursos_atual < total_recursos_da_melhor_config_tracker):
-                
-                # Atualiza o tracker da melhor configuração
-                recurso_final_tracker = recursos_1.copy()
-                makespan_final_tracker = makespan_1
-                total_recursos_da_melhor_config_tracker = total_recursos_atual
-                
-                # --- ACUMULA OS VALORES PARA A MÉDIA ---
-                print(f"  --> Nova melhor configuração encontrada na simulação {i+1}. Acumulando para média.")
-                num_melhores_encontrados += 1
-                soma_makespan += makespan_1
-                for recurso, quantidade in recursos_1.items():
-                    soma_recursos[recurso] += quantidade
-                
-                if soma_gargalo.empty:
-                    soma_gargalo = gargalo.set_index('Recurso')
-                else:
-                    # Alinha os DataFrames pelo 'Recurso' e soma apenas as colunas numéricas
-                    soma_gargalo = soma_gargalo.add(gargalo.set_index('Recurso'), fill_value=0)
-                # ---------------------------------------
-        barra_de_progresso.progress(100, text="Simulação concluída!")
-        st.success("Dimensionamento concluído com sucesso!")
+        execucao = st.session_state.execucao_capacidade = ExecucaoEmSegundoPlano(
+            executar_replicacoes,
+            num_simulacoes, quantidade_jobs, prazo_dias, tolerancia_prazo/100, 5 + num_simulacoes, recursos_fixos,
+            num_candidatos, max_workers, estrategia=estrategia
+        )
+        em_andamento = True
+
+    if execucao is None:
+        return
+    if em_andamento:
+        st.info("Simulação em andamento. Você pode cancelá-la a qualquer momento.")
+        acompanhar_execucao(execucao, 'capacidade')
+    elif execucao.estado == 'cancelada':
+        st.warning(f"Simulação cancelada após {execucao.duracao():.0f} s.")
+    elif execucao.estado == 'erro':
+        st.error(f"A simulação falhou: {execucao.erro}")
+    else:
+        consolidado = consolidar_replicacoes(execucao.resultado)
+        st.success(f"Dimensionamento concluído com sucesso em {execucao.duracao():.0f} s!")
         
         # --- INÍCIO DA EXIBIÇÃO DOS RESULTADOS ---
         st.markdown("---")
         st.header("Resultados do Dimensionamento")
 
-        if num_melhores_encontrados > 0:
-            # Calcular as médias
-            makespan_medio = soma_makespan / num_melhores_encontrados
+        if consolidado['num_melhores'] > 0:
+            makespan_medio = consolidado['makespan_medio']
             #Makespan médio da configuração real para cada instância de dados
-            makespan_real_medio = soma_makespan_real/num_simulacoes
-            
-            recursos_medios = {}
-            for recurso, soma_qtde in soma_recursos.items():
-                media = soma_qtde / num_melhores_encontrados
-                recursos_medios[recurso] = math.ceil(media) # Arredonda para cima
+            makespan_real_medio = consolidado['makespan_real_medio']
+            recursos_medios = consolidado['recursos_medios']
             #Gargalo para a nova configuração sugerida
-            gargalo_medio = soma_gargalo.divide(num_melhores_encontrados).reset_index()
-            gargalo_medio['Score_Gargalo'] = gargalo_medio['Tempo_Espera'] * (gargalo_medio['Utilizacao']/100)
-
+            gargalo_medio = consolidado['gargalo_medio']
             #Comportamento dos gargalos para a configuração atual do sistema
-            gargalo_medio_real = soma_gargalo_real.divide(num_simulacoes).reset_index()
-            gargalo_medio_real['Score_Gargalo'] = gargalo_medio_real['Tempo_Espera'] * (gargalo_medio_real['Utilizacao']/100)
+            gargalo_medio_real = consolidado['gargalo_medio_real']
 
 
             col_inicial, col_otimizada = st.columns(2)
@@ -211,7 +134,7 @@ def render_triaxial():
 
             with col_otimizada:
                 # Calcula a diferença em dias
-                diferenca_dias = (makespan_medio / 24) - (makespan_real / 24)
+                diferenca_dias = (makespan_medio / 24) - (makespan_real_medio / 24)
                 
                 # Mostra o resultado com a configuração otimizada e a melhoria
                 st.metric(
@@ -289,6 +212,13 @@ def render_triaxial():
             # 4. EXIBE o DataFrame já ordenado e formatado
             st.dataframe(gargalo_medio_formatado, use_container_width=True)
 
+            # Configurações testadas em cada replicação, na ordem em que foram simuladas
+            with st.expander("Configurações testadas durante a busca"):
+                df_historico = consolidado['historico'].copy()
+                df_historico['Configuração'] = df_historico['Configuração'].map(str)
+                colunas = ['Simulação', 'Iteração', 'Recurso Ajustado', 'Quantidade', 'Makespan (h)', 'Gargalo', 'Configuração']
+                st.dataframe(df_historico[colunas], use_container_width=True, hide_index=True)
+
             st.markdown("---")
             st.header("Análise Comparativa de Desempenho")
 
@@ -3,10 +3,12 @@
 import streamlit as st
 import pandas as pd
 from datetime import date, timedelta
+import copy
 import json
 import os
 from google_drive_loader import carregar_e_filtrar_dados
-from param_prazos import simular_prazos_propostas
+from param_prazos import simular_prazos_propostas, converter_propostas_para_df, PROBABILIDADE_FECHAMENTO_PADRAO, PERCENTIL_PRAZO, NUM_REPLICACOES_PADRAO
+from execucao_fundo import ExecucaoEmSegundoPlano, acompanhar_execucao
 
 # =========================================================================
 #                   CONSTANTES E CONFIGURAÇÕES
@@ -72,34 +74,15 @@ def limpar_tudo():
         os.remove(LOG_FILE)
     st.toast("🗑️ Todas as propostas foram limpas.", icon="🗑️")
 
-def converter_propostas_para_df(propostas_list):
-    """Converte a lista de propostas do session_state para um DataFrame padronizado."""
-    dados_para_df = []
-    for proposta in propostas_list:
-        for ensaio in proposta['ensaios']:
-            # Para cada ensaio, repetimos a quantidade de vezes especificada
-            for _ in range(ensaio['quantidade']):
-                dados_para_df.append({
-                    'Campanha': proposta['nome_proposta'],
-                    'Ensaio': ensaio['ensaio'],
-                    'Tipo Amostra': ensaio['tipo_amostra'] if ensaio['tipo_amostra'] else 'Indeformada',
-                    # Adicionamos colunas "placeholder" para compatibilidade
-                    'ID Ensaio/CP': f"Manual_{proposta['nome_proposta']}",
-                    'Origem': 'Manual' # Coluna para identificar a origem dos dados
-                })
-    if not dados_para_df:
-        return pd.DataFrame()
-    return pd.DataFrame(dados_para_df)
-
-
 # Callback para limpar os resultados da simulação anterior se as propostas mudarem
 def on_proposta_change():
     st.session_state.prazos_gerais = None
     st.session_state.prazos_detalhados = None
+    st.session_state.resumo_prazos = None
 
 # --- Funções existentes (sem alterações, exceto o callback) ---
 def adicionar_proposta(nome_proposta):
-    nova_proposta = {"nome_proposta": nome_proposta, "data_chegada": date.today(), "ensaios": [{"ensaio": ENSAIO_PADRAO_DEFAULT, "tipo_amostra": "", "quantidade": 1}]}
+    nova_proposta = {"nome_proposta": nome_proposta, "data_chegada": date.today(), "probabilidade_fechamento": PROBABILIDADE_FECHAMENTO_PADRAO, "ensaios": [{"ensaio": ENSAIO_PADRAO_DEFAULT, "tipo_amostra": "", "quantidade": 1}]}
     st.session_state.propostas.append(nova_proposta)
     on_proposta_change() # Limpa os resultados ao adicionar proposta
 
@@ -148,6 +131,7 @@ def render():
         # Inicializa os placeholders para os resultados da simulação
         st.session_state.prazos_gerais = None
         st.session_state.prazos_detalhados = None
+        st.session_state.resumo_prazos = None
         st.session_state.schedules_por_cenario = None
         st.session_state.propostas_manuais_cache = None
 
@@ -179,11 +163,19 @@ def render():
     for i, proposta in enumerate(st.session_state.propostas):
         with st.container(border=True):
             # ... (código para exibir cada proposta, sem alterações) ...
-            col1, col2, col3 = st.columns([4, 2, 1])
+            col1, col2, col_prob, col3 = st.columns([4, 2, 2, 1])
             with col1:
                 st.subheader(f"Proposta: {proposta['nome_proposta']}")
             with col2:
                 proposta['data_chegada'] = st.date_input("Data Estimada de Chegada", key=f"data_{proposta['nome_proposta']}", value=proposta['data_chegada'], on_change=on_proposta_change)
+            with col_prob:
+                probabilidade_pct = st.number_input(
+                    "Chance de Fechamento (%)", min_value=0, max_value=100, step=5,
+                    value=int(round(proposta.get('probabilidade_fechamento', PROBABILIDADE_FECHAMENTO_PADRAO) * 100)),
+                    key=f"prob_{proposta['nome_proposta']}", on_change=on_proposta_change,
+                    help="Usada quando há muitas propostas e os cenários de fechamento são sorteados em vez de enumerados."
+                )
+                proposta['probabilidade_fechamento'] = probabilidade_pct / 100
             with col3:
                 st.write(" &nbsp; ")
                 st.button("❌ Remover", key=f"remover_proposta_{proposta['nome_proposta']}", on_click=remover_proposta, args=(proposta['nome_proposta'],), use_container_width=True)
@@ -216,7 +208,24 @@ def render():
 
     if st.session_state.propostas:
         st.markdown("---")
-        if st.button("Executar Simulação de Prazos", use_container_width=True, type="primary"):
+        execucao = st.session_state.get('execucao_prazos')
+        em_andamento = execucao is not None and execucao.em_andamento()
+        col_variabilidade, col_replicacoes = st.columns([3, 1])
+        variabilidade = col_variabilidade.checkbox(
+            "Considerar variabilidade das durações das etapas",
+            value=False,
+            disabled=em_andamento,
+            help="Sorteia as durações das etapas em várias replicações e estima a média e os percentis dos prazos. A simulação fica proporcionalmente mais demorada."
+        )
+        num_replicacoes = col_replicacoes.number_input(
+            "Replicações",
+            min_value=2,
+            max_value=1000,
+            value=NUM_REPLICACOES_PADRAO,
+            step=10,
+            disabled=em_andamento or not variabilidade
+        )
+        if st.button("Executar Simulação de Prazos", use_container_width=True, type="primary", disabled=em_andamento):
             # ETAPA 1: Carregar dados reais do Drive
             with st.spinner("Executando... (1/3) Carregando Dados da Fila Real..."):
                 df_real = carregar_e_filtrar_dados()
@@ -241,14 +250,35 @@ def render():
             st.markdown("---")
             st.subheader("📊 Resultados da Simulação de Prazos")
             
-            # Chamar a nova função orquestradora
-            st.session_state.prazos_gerais, st.session_state.prazos_detalhados = simular_prazos_propostas(df_combinado, propostas_manuais)
+            # Chamar a nova função orquestradora em segundo plano; os
+            # resultados entram no session_state quando ela terminar. A
+            # simulação recebe uma cópia das propostas, que seguem editáveis na tela.
+            on_proposta_change()
+            execucao = st.session_state.execucao_prazos = ExecucaoEmSegundoPlano(
+                simular_prazos_propostas, df_combinado, copy.deepcopy(propostas_manuais),
+                replicacoes=int(num_replicacoes) if variabilidade else None
+            )
+            em_andamento = True
             # Salva a lista de propostas usada na simulação para referência futura
             st.session_state.propostas_manuais_cache = propostas_manuais
 
+        if em_andamento:
+            acompanhar_execucao(execucao, 'prazos')
+        elif execucao is not None:
+            # Execução terminada: os resultados são guardados uma única vez.
+            st.session_state.execucao_prazos = None
+            if execucao.estado == 'concluida':
+                st.session_state.prazos_gerais, st.session_state.prazos_detalhados, st.session_state.resumo_prazos = execucao.resultado
+            elif execucao.estado == 'cancelada':
+                st.warning(f"Simulação cancelada após {execucao.duracao():.0f} s.")
+            else:
+                st.error(f"A simulação falhou: {execucao.erro}")
+
         # ETAPA 5: EXIBIR OS RESULTADOS (agora fora do if do botão)
         resultados_gerais = st.session_state.get('prazos_gerais')
         resultados_detalhados = st.session_state.get('prazos_detalhados')
+        resumo = st.session_state.get('resumo_prazos') or {}
+        estatisticas = resumo.get('estatisticas', {})
 
         if resultados_gerais is not None:
             if not resultados_gerais:
@@ -271,6 +301,15 @@ def render():
                             value=f"{prazo_em_dias:.0f} dias úteis",
                             help=f"Este é o prazo para a conclusão do último ensaio da proposta. O valor é uma média considerando todos os cenários de fechamento das propostas simuladas. {data_chegada_str}"
                         )
+                        est = estatisticas.get(proposta)
+                        if est:
+                            texto = f"P{PERCENTIL_PRAZO}: {est['percentil']:.1f} dias úteis"
+                            if est['ic_media'] is not None:
+                                texto = (f"IC 95% da média: {est['ic_media'][0]:.1f} – {est['ic_media'][1]:.1f} · {texto} "
+                                         f"(IC 95%: {est['ic_percentil'][0]:.1f} – {est['ic_percentil'][1]:.1f}) · {est['n']} cenários")
+                                if resumo.get('replicacoes'):
+                                    texto = f"P50: {est['p50']:.1f} dias úteis · {texto}"
+                            st.caption(texto)
 
                 # --- EXIBIÇÃO DOS PRAZOS DETALHADOS (TABELA) ---
                 if resultados_detalhados:
@@ -285,10 +324,17 @@ def render():
                     
                     # Formata a coluna de prazo para exibir apenas o número inteiro
                     df_prazos_formatado = df_prazos.style.format({
-                        "Prazo de Entrega (dias úteis)": "{:.0f}"
+                        "Prazo de Entrega (dias úteis)": "{:.0f}",
+                        "P50 (dias úteis)": "{:.0f}",
+                        f"P{PERCENTIL_PRAZO} (dias úteis)": "{:.0f}"
                     })
                     
                     st.dataframe(df_prazos_formatado, use_container_width=True)
                 
 
-                st.info("Nota: Todos os prazos são uma média considerando os diferentes cenários de fechamento das propostas simuladas.")
+                if resumo.get('replicacoes'):
+                    st.info(f"Nota: As durações das etapas foram sorteadas em {resumo['replicacoes']} replicações (semente {resumo['semente']}); os prazos são médias e percentis sobre as replicações e os cenários de fechamento das propostas.")
+                elif resumo.get('modo') == 'amostrado':
+                    st.info(f"Nota: Os prazos são estimados a partir de {resumo['num_cenarios']} cenários de fechamento sorteados pela chance de fechamento de cada proposta ({resumo['cenarios_distintos']} distintos).")
+                else:
+                    st.info("Nota: Todos os prazos são uma média considerando os diferentes cenários de fechamento das propostas simuladas.")
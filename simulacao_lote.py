@@ -0,0 +1,322 @@
+"""
+Execução em lote dos simuladores do laboratório, sem o Streamlit.
+
+Expõe as mesmas simulações das páginas de capacidade e de prazos como funções
+Python puras, que recebem DataFrames e devolvem um resultado com um resumo e
+tabelas, e uma linha de comando que lê a fila de um arquivo e grava o
+resultado em JSON ou Parquet, para estudos noturnos e varreduras de parâmetros.
+
+Uso:
+    python simulacao_lote.py capacidade --fila fila.xlsx --prazo-dias 22 --saida capacidade.json
+    python simulacao_lote.py capacidade --ensaios 576 --prazo-dias 22 --replicacoes 20 --saida estudo/
+    python simulacao_lote.py prazos --fila fila.parquet --propostas propostas_log.json --saida prazos.json
+    python simulacao_lote.py prazos --fila fila.parquet --propostas propostas_log.json --replicacoes 50 --saida prazos/
+
+Com ``--saida`` terminada em ``.json`` o resultado inteiro vai para um único
+arquivo JSON; caso contrário, ``--saida`` é uma pasta que recebe um arquivo
+Parquet por tabela e o ``resumo.json``.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from param_capacidade import (calcular_parametros_completos, consolidar_replicacoes, executar_replicacoes,
+                              ESTRATEGIA_PADRAO)
+from param_prazos import converter_propostas_para_df, simular_prazos_propostas
+from parametros_ensaios import validar_distribuicoes
+
+# Mesmos valores usados pela página de capacidade.
+TOLERANCIA_PADRAO = 0.05
+ITERACOES_PADRAO = 6
+
+
+# =========================================================================
+#                   LEITURA DAS ENTRADAS
+# =========================================================================
+def carregar_fila(caminho):
+    """Lê a fila de ensaios de um arquivo .xlsx, .csv, .parquet ou .json (lista de registros)."""
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao in ('.xlsx', '.xls'):
+        return pd.read_excel(caminho)
+    if extensao == '.csv':
+        return pd.read_csv(caminho)
+    if extensao == '.parquet':
+        return pd.read_parquet(caminho)
+    if extensao == '.json':
+        return pd.read_json(caminho, orient='records')
+    raise ValueError(f"Formato de fila não suportado: '{extensao}'. Use .xlsx, .csv, .parquet ou .json.")
+
+
+def carregar_propostas(caminho):
+    """Lê as propostas no formato do ``propostas_log.json`` gravado pela página de prazos."""
+    with open(caminho, encoding='utf-8') as arquivo:
+        propostas = json.load(arquivo)
+    for proposta in propostas:
+        proposta['data_chegada'] = date.fromisoformat(proposta['data_chegada'])
+    return propostas
+
+
+def carregar_distribuicoes(caminho):
+    """
+    Lê as distribuições das durações das etapas de um JSON no formato
+    ``{"Rompimento": ["lognormal", 0.15], "Adensamento": ["triangular", 0.75, 1.0, 2.0]}``.
+    """
+    with open(caminho, encoding='utf-8') as arquivo:
+        distribuicoes = {etapa: tuple(distribuicao) for etapa, distribuicao in json.load(arquivo).items()}
+    validar_distribuicoes(distribuicoes)
+    return distribuicoes
+
+
+def _dias_de_inicio(df_fila):
+    """
+    'Início Plan Atual' em dias a partir do primeiro início, como o
+    dimensionamento espera; datas da planilha são convertidas.
+    """
+    df = df_fila.copy()
+    inicio = df['Início Plan Atual']
+    if not pd.api.types.is_numeric_dtype(inicio):
+        inicio = pd.to_datetime(inicio, dayfirst=True)
+        df['Início Plan Atual'] = (inicio - inicio.min()).dt.days
+    return df
+
+
+# =========================================================================
+#                   SIMULAÇÕES
+# =========================================================================
+def dimensionar_capacidade(df_fila, prazo_dias, tolerancia=TOLERANCIA_PADRAO, num_iteracoes=ITERACOES_PADRAO,
+                           recursos_fixos=(), estrategia=ESTRATEGIA_PADRAO, num_candidatos=1, max_workers=None,
+                           ao_progredir=None):
+    """
+    Dimensiona os recursos para uma fila conhecida (``calcular_parametros_completos``).
+    ``ao_progredir(fracao, texto, **detalhes)`` recebe os avisos do dimensionamento.
+
+    Returns:
+        dict: {'simulador', 'resumo', 'tabelas'}; as tabelas são a
+        configuração recomendada, as análises de gargalo da configuração
+        inicial e da recomendada e o histórico da busca.
+    """
+    (configuracao, makespan, df_gargalo, makespan_inicial,
+     df_gargalo_inicial, historico) = calcular_parametros_completos(
+        _dias_de_inicio(df_fila), prazo_dias, tolerancia, num_iteracoes, list(recursos_fixos),
+        num_candidatos, max_workers, estrategia, ao_progredir=ao_progredir)
+    return {
+        'simulador': 'capacidade',
+        'resumo': {
+            'num_ensaios': len(df_fila),
+            'prazo_dias': prazo_dias,
+            'makespan_inicial_h': float(makespan_inicial),
+            'makespan_recomendado_h': float(makespan),
+            'atende_prazo': bool(makespan <= prazo_dias * 24 * (1 + tolerancia)),
+        },
+        'tabelas': {
+            'configuracao': pd.DataFrame(list(configuracao.items()), columns=['Recurso', 'Quantidade']),
+            'gargalo_inicial': df_gargalo_inicial,
+            'gargalo_recomendado': df_gargalo,
+            'historico': historico,
+        },
+    }
+
+
+def dimensionar_capacidade_simulada(num_simulacoes, quantidade_jobs, prazo_dias, tolerancia=TOLERANCIA_PADRAO,
+                                    num_iteracoes=None, recursos_fixos=(), estrategia=ESTRATEGIA_PADRAO,
+                                    num_candidatos=1, max_workers=None, semente=None, ao_progredir=None):
+    """
+    Estudo Monte Carlo da página de capacidade: ``num_simulacoes`` demandas
+    sorteadas, dimensionadas em paralelo e consolidadas como na página.
+
+    Sem ``num_iteracoes``, usa as 5 + ``num_simulacoes`` iterações da página.
+    ``ao_progredir(fracao, texto, **detalhes)`` recebe os avisos de todas as replicações.
+    """
+    num_iteracoes = 5 + num_simulacoes if num_iteracoes is None else num_iteracoes
+    resultados = executar_replicacoes(num_simulacoes, quantidade_jobs, prazo_dias, tolerancia, num_iteracoes,
+                                      list(recursos_fixos), num_candidatos, max_workers, estrategia=estrategia,
+                                      semente=semente, ao_progredir=ao_progredir)
+    consolidado = consolidar_replicacoes(resultados)
+    replicacoes = pd.DataFrame({
+        'Simulação': range(1, len(resultados) + 1),
+        'Makespan Inicial (h)': [float(r[3]) for r in resultados],
+        'Makespan Recomendado (h)': [float(r[1]) for r in resultados],
+    })
+    tabelas = {'replicacoes': replicacoes, 'historico': consolidado['historico']}
+    resumo = {
+        'num_simulacoes': num_simulacoes,
+        'num_ensaios': quantidade_jobs,
+        'prazo_dias': prazo_dias,
+        'semente': semente,
+        'configuracoes_na_media': consolidado['num_melhores'],
+    }
+    if consolidado['num_melhores'] > 0:
+        resumo['makespan_inicial_medio_h'] = float(consolidado['makespan_real_medio'])
+        resumo['makespan_recomendado_medio_h'] = float(consolidado['makespan_medio'])
+        tabelas['configuracao'] = pd.DataFrame(list(consolidado['recursos_medios'].items()),
+                                               columns=['Recurso', 'Quantidade Média Recomendada'])
+        tabelas['gargalo_inicial'] = consolidado['gargalo_medio_real']
+        tabelas['gargalo_recomendado'] = consolidado['gargalo_medio']
+    return {'simulador': 'capacidade', 'resumo': resumo, 'tabelas': tabelas}
+
+
+def simular_prazos(df_fila, propostas, modo=None, semente=None, ao_progredir=None,
+                   replicacoes=None, distribuicoes=None, max_workers=None):
+    """
+    Prazos das propostas sobre a fila real (``simular_prazos_propostas``),
+    combinando a fila e as propostas como a página de prazos. Com
+    ``replicacoes``, as durações das etapas são sorteadas de ``distribuicoes``.
+
+    Returns:
+        dict: {'simulador', 'resumo', 'tabelas'}; as tabelas são os prazos
+        gerais e os prazos por proposta e tipo de ensaio.
+    """
+    df_real = df_fila.copy()
+    df_real['Origem'] = 'Planejamento (Drive)'
+    df_combinado = pd.concat([df_real, converter_propostas_para_df(propostas)], ignore_index=True)
+    prazos_gerais, prazos_detalhados, resumo = simular_prazos_propostas(
+        df_combinado, propostas, modo=modo, semente=semente, ao_progredir=ao_progredir,
+        replicacoes=replicacoes, distribuicoes=distribuicoes, max_workers=max_workers)
+    estatisticas = resumo.pop('estatisticas')
+    df_gerais = pd.DataFrame([
+        {
+            'Proposta': proposta,
+            'Prazo Médio (dias úteis)': float(prazo),
+            'P50 (dias úteis)': estatisticas[proposta]['p50'],
+            'Percentil (dias úteis)': estatisticas[proposta]['percentil'],
+            'Cenários': estatisticas[proposta]['n'],
+        }
+        for proposta, prazo in sorted(prazos_gerais.items())
+    ])
+    # No modo estocástico o resumo já traz a semente sorteada.
+    resumo.setdefault('semente', semente)
+    resumo.update({'num_ensaios_fila': len(df_fila), 'estatisticas': estatisticas})
+    return {
+        'simulador': 'prazos',
+        'resumo': resumo,
+        'tabelas': {'prazos_gerais': df_gerais, 'prazos_detalhados': pd.DataFrame(prazos_detalhados)},
+    }
+
+
+# =========================================================================
+#                   GRAVAÇÃO DOS RESULTADOS
+# =========================================================================
+def _para_json(valor):
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if isinstance(valor, (date, pd.Timestamp)):
+        return valor.isoformat()
+    raise TypeError(f"Valor não serializável em JSON: {type(valor).__name__}")
+
+
+def gravar_resultado(resultado, caminho):
+    """
+    Grava o resultado de uma simulação: em um único JSON quando ``caminho``
+    termina em .json; senão, em uma pasta com ``<tabela>.parquet`` e ``resumo.json``.
+    """
+    resumo = {'simulador': resultado['simulador'], 'resumo': resultado['resumo']}
+    if caminho.lower().endswith('.json'):
+        documento = dict(resumo, tabelas={
+            nome: json.loads(tabela.to_json(orient='records', force_ascii=False, date_format='iso'))
+            for nome, tabela in resultado['tabelas'].items()
+        })
+        with open(caminho, 'w', encoding='utf-8') as arquivo:
+            json.dump(documento, arquivo, indent=2, ensure_ascii=False, default=_para_json)
+        return
+
+    os.makedirs(caminho, exist_ok=True)
+    for nome, tabela in resultado['tabelas'].items():
+        tabela = tabela.copy()
+        # Colunas de dicionários (como a 'Configuração' do histórico) viram texto JSON.
+        for coluna in tabela.columns[tabela.dtypes == object]:
+            if tabela[coluna].map(lambda v: isinstance(v, (dict, list))).any():
+                tabela[coluna] = tabela[coluna].map(lambda v: json.dumps(v, ensure_ascii=False, default=_para_json))
+        tabela.to_parquet(os.path.join(caminho, f"{nome}.parquet"), index=False)
+    with open(os.path.join(caminho, 'resumo.json'), 'w', encoding='utf-8') as arquivo:
+        json.dump(resumo, arquivo, indent=2, ensure_ascii=False, default=_para_json)
+
+
+# =========================================================================
+#                   LINHA DE COMANDO
+# =========================================================================
+# Intervalo mínimo (s) entre as linhas de progresso no terminal.
+INTERVALO_PROGRESSO_TERMINAL = 1.0
+
+
+def _impressora_de_progresso():
+    """Callback que escreve o progresso no stderr, no máximo uma linha por intervalo."""
+    ultimo = [-INTERVALO_PROGRESSO_TERMINAL]
+
+    def imprimir(fracao, texto, **detalhes):
+        agora = time.monotonic()
+        if agora - ultimo[0] >= INTERVALO_PROGRESSO_TERMINAL or fracao >= 1:
+            ultimo[0] = agora
+            print(f"[{fracao:6.1%}] {texto}", file=sys.stderr, flush=True)
+    return imprimir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulações de capacidade e de prazos do laboratório em lote, sem a interface.")
+    parser.add_argument('--verboso', action='store_true', help="Mostra as mensagens detalhadas dos simuladores.")
+    subparsers = parser.add_subparsers(dest='simulador', required=True)
+
+    capacidade = subparsers.add_parser('capacidade', help="Dimensionamento de recursos para uma fila ou para demandas sorteadas.")
+    origem = capacidade.add_mutually_exclusive_group(required=True)
+    origem.add_argument('--fila', help="Arquivo da fila (.xlsx, .csv, .parquet ou .json) com 'Início Plan Atual' em dias ou datas.")
+    origem.add_argument('--ensaios', type=int, help="Sorteia demandas com este número de ensaios, como a página.")
+    capacidade.add_argument('--prazo-dias', type=int, required=True)
+    capacidade.add_argument('--tolerancia', type=float, default=TOLERANCIA_PADRAO, help="Folga relativa sobre o prazo.")
+    capacidade.add_argument('--iteracoes', type=int, help="Iterações de dimensionamento (padrão: o mesmo da página).")
+    capacidade.add_argument('--recursos-fixos', nargs='*', default=[], help="Recursos que não devem ser aumentados.")
+    capacidade.add_argument('--estrategia', choices=['incremental', 'bissecao'], default=ESTRATEGIA_PADRAO,
+                            help="'bissecao' usa menos simulações, mas pode recomendar outra configuração.")
+    capacidade.add_argument('--candidatos', type=int, default=1, help="Gargalos avaliados por iteração (estratégia incremental).")
+    capacidade.add_argument('--replicacoes', type=int, default=1, help="Demandas sorteadas com --ensaios.")
+    capacidade.add_argument('--processos', type=int, help="Processos paralelos (padrão: todos os núcleos).")
+    capacidade.add_argument('--semente', type=int)
+    capacidade.add_argument('--saida', required=True, help="Arquivo .json ou pasta para os arquivos Parquet.")
+
+    prazos = subparsers.add_parser('prazos', help="Prazos de entrega das propostas sobre a fila real.")
+    prazos.add_argument('--fila', required=True, help="Arquivo da fila real (.xlsx, .csv, .parquet ou .json).")
+    prazos.add_argument('--propostas', required=True, help="JSON de propostas no formato do propostas_log.json.")
+    prazos.add_argument('--modo', choices=['exaustivo', 'amostrado'], help="Padrão: definido pelo número de propostas.")
+    prazos.add_argument('--semente', type=int)
+    prazos.add_argument('--replicacoes', type=int, help="Sorteia as durações das etapas neste número de replicações.")
+    prazos.add_argument('--distribuicoes', help="JSON com as distribuições das durações por etapa (padrão: as do simulador).")
+    prazos.add_argument('--processos', type=int, help="Processos paralelos das replicações (padrão: todos os núcleos).")
+    prazos.add_argument('--saida', required=True, help="Arquivo .json ou pasta para os arquivos Parquet.")
+    args = parser.parse_args(argv)
+
+    # Os simuladores narram cada iteração no stdout; sem --verboso, só o progresso aparece.
+    saida_simuladores = contextlib.nullcontext() if args.verboso else contextlib.redirect_stdout(io.StringIO())
+    ao_progredir = _impressora_de_progresso()
+    with saida_simuladores:
+        if args.simulador == 'prazos':
+            resultado = simular_prazos(carregar_fila(args.fila), carregar_propostas(args.propostas),
+                                       args.modo, args.semente, ao_progredir=ao_progredir,
+                                       replicacoes=args.replicacoes,
+                                       distribuicoes=carregar_distribuicoes(args.distribuicoes) if args.distribuicoes else None,
+                                       max_workers=args.processos)
+        elif args.fila:
+            resultado = dimensionar_capacidade(carregar_fila(args.fila), args.prazo_dias, args.tolerancia,
+                                               args.iteracoes or ITERACOES_PADRAO, args.recursos_fixos,
+                                               args.estrategia, args.candidatos, args.processos,
+                                               ao_progredir=ao_progredir)
+        else:
+            resultado = dimensionar_capacidade_simulada(args.replicacoes, args.ensaios, args.prazo_dias, args.tolerancia,
+                                                        args.iteracoes, args.recursos_fixos, args.estrategia,
+                                                        args.candidatos, args.processos, args.semente,
+                                                        ao_progredir=ao_progredir)
+
+    gravar_resultado(resultado, args.saida)
+    print(json.dumps(resultado['resumo'], indent=2, ensure_ascii=False, default=_para_json))
+    print(f"Resultado gravado em {args.saida}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Cópias locais (snapshots) das entradas baixadas do Google Drive.
+
+Depois de um reinício do servidor, as páginas começam pelas cópias gravadas em
+disco, em vez de esperar o download e a leitura das planilhas, e conferem em
+segundo plano se os arquivos mudaram no Drive. Cada cópia é marcada com a
+revisão dos arquivos de origem (ver ``revisao_arquivo``):
+
+- tabelas já processadas, como a fila do laboratório, ficam em um Parquet
+  (``ler_tabela`` / ``gravar_tabela``);
+- arquivos baixados como estão, como as planilhas do CTO, ficam em uma pasta
+  por conjunto de revisões (``ler_pasta`` / ``criar_pasta`` / ``concluir_pasta``).
+
+As cópias ficam na pasta de cache do usuário, fora do código, junto do
+cache de parâmetros de ``param_prazos``. A variável de ambiente
+DRIVE_SNAPSHOTS troca a pasta das cópias; vazia, elas são desativadas e os
+downloads vão para pastas temporárias. Falhas de leitura e gravação são
+registradas no ``logging``, como no ``parametros_ensaios.CacheParametros``.
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+PASTA_SNAPSHOTS = os.environ.get(
+    "DRIVE_SNAPSHOTS",
+    str(Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "simulador-laboratorio" / "snapshots_drive"),
+)
+# Pastas de arquivos mantidas por nome: a atual e a anterior, que ainda pode
+# estar sendo lida por uma sessão quando a nova é concluída.
+PASTAS_MANTIDAS = 2
+ARQUIVO_REVISOES = "revisoes.json"
+
+
+def revisao_arquivo(metadados):
+    """Identifica o conteúdo de um arquivo do Drive: o id e o md5 (ou, nas planilhas Google, a data de modificação)."""
+    return f"{metadados['id']}:{metadados.get('md5Checksum') or metadados.get('modifiedTime')}"
+
+
+def _pasta():
+    if not PASTA_SNAPSHOTS:
+        return None
+    pasta = Path(PASTA_SNAPSHOTS)
+    try:
+        pasta.mkdir(parents=True, exist_ok=True)
+    except OSError as erro:
+        # Sem a pasta, as cópias ficam desativadas nesta chamada.
+        logger.warning("Pasta das cópias locais '%s' indisponível (%s).", pasta, erro)
+        return None
+    return pasta
+
+
+# =========================================================================
+#                   TABELAS PROCESSADAS (PARQUET)
+# =========================================================================
+# Colunas de texto com valores de outros tipos (ex.: amostras "12A" e 12) não
+# cabem em uma coluna Parquet; elas são gravadas com o tipo de cada valor na
+# primeira letra e restauradas na leitura.
+_DECODIFICADORES = {
+    's': str,
+    'i': int,
+    'f': float,
+    'b': lambda texto: texto == 'True',
+    't': pd.Timestamp,
+}
+
+
+def _codificar(valor):
+    if valor is None or (isinstance(valor, float) and np.isnan(valor)):
+        return None
+    if isinstance(valor, str):
+        return 's' + valor
+    if isinstance(valor, (bool, np.bool_)):
+        return 'b' + str(bool(valor))
+    if isinstance(valor, (int, np.integer)):
+        return 'i' + str(int(valor))
+    if isinstance(valor, (float, np.floating)):
+        return 'f' + repr(float(valor))
+    if isinstance(valor, datetime):
+        return 't' + pd.Timestamp(valor).isoformat()
+    return 's' + str(valor)
+
+
+def _decodificar(texto):
+    if texto is None:
+        return np.nan
+    return _DECODIFICADORES[texto[0]](texto[1:])
+
+
+def ler_tabela(nome):
+    """(revisão, DataFrame) da cópia ``nome``, ou (None, None) se ela não existir ou não puder ser lida."""
+    pasta = _pasta()
+    arquivo = pasta / f"{nome}.parquet" if pasta else None
+    if arquivo is None or not arquivo.exists():
+        return None, None
+    try:
+        tabela = pd.read_parquet(arquivo)
+    except (OSError, pa.ArrowException) as erro:
+        logger.warning("Cópia local '%s' ignorada (%s).", arquivo, erro)
+        return None, None
+    revisao = tabela.attrs.pop('revisao', None)
+    codificadas = tabela.attrs.pop('colunas_codificadas', [])
+    for coluna in tabela.columns:
+        if coluna in codificadas:
+            tabela[coluna] = [_decodificar(texto) for texto in tabela[coluna].tolist()]
+        elif tabela[coluna].dtype == object:
+            # O Parquet devolve None nas células de texto vazias; a leitura da planilha, NaN.
+            tabela[coluna] = tabela[coluna].where(tabela[coluna].notna(), np.nan)
+    return revisao, tabela
+
+
+def gravar_tabela(nome, revisao, tabela):
+    """Grava ``tabela`` como a cópia ``nome``, marcada com ``revisao``; falhas só são avisadas."""
+    pasta = _pasta()
+    if pasta is None:
+        return
+    tabela = tabela.reset_index(drop=True)
+    codificadas = [
+        coluna for coluna in tabela.columns
+        if tabela[coluna].dtype == object and pd.api.types.infer_dtype(tabela[coluna], skipna=True) not in ('string', 'empty')
+    ]
+    for coluna in codificadas:
+        tabela[coluna] = [_codificar(valor) for valor in tabela[coluna].tolist()]
+    tabela.attrs = {'revisao': revisao, 'colunas_codificadas': codificadas}
+    arquivo = pasta / f"{nome}.parquet"
+    temporario = f"{arquivo}.{os.getpid()}.tmp"
+    try:
+        tabela.to_parquet(temporario, index=False)
+        os.replace(temporario, arquivo)
+    except (OSError, pa.ArrowException) as erro:
+        logger.warning("Não foi possível gravar a cópia local '%s' (%s).", arquivo, erro)
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+
+# =========================================================================
+#                   ARQUIVOS BAIXADOS (PASTAS)
+# =========================================================================
+def _pastas_concluidas(nome):
+    pasta = _pasta()
+    if pasta is None:
+        return []
+    # O nome de cada pasta termina no instante da criação, então a ordem é a de criação.
+    return sorted(p for p in pasta.glob(f"{nome}_*") if (p / ARQUIVO_REVISOES).exists())
+
+
+def ler_pasta(nome):
+    """(revisões, pasta) da cópia mais recente ``nome``, ou (None, None) se não houver."""
+    for pasta in reversed(_pastas_concluidas(nome)):
+        try:
+            return json.loads((pasta / ARQUIVO_REVISOES).read_text(encoding="utf-8")), pasta
+        except (OSError, ValueError) as erro:
+            logger.warning("Cópia local '%s' ignorada (%s).", pasta, erro)
+    return None, None
+
+
+def criar_pasta(nome):
+    """Pasta nova para os arquivos da cópia ``nome`` (temporária, se as cópias estiverem desativadas)."""
+    pasta = _pasta()
+    if pasta is None:
+        return Path(tempfile.mkdtemp(prefix=f"{nome}_"))
+    destino = pasta / f"{nome}_{time.time_ns()}"
+    destino.mkdir()
+    return destino
+
+
+def concluir_pasta(nome, pasta, revisoes):
+    """
+    Marca a ``pasta`` criada por ``criar_pasta`` como a cópia atual ``nome``,
+    com as ``revisoes`` dos arquivos, e apaga as cópias mais antigas.
+    """
+    if _pasta() is None:
+        return
+    # O arquivo de revisões é gravado por último: sem ele a pasta não é lida.
+    temporario = pasta / f"{ARQUIVO_REVISOES}.tmp"
+    temporario.write_text(json.dumps(revisoes, ensure_ascii=False), encoding="utf-8")
+    os.replace(temporario, pasta / ARQUIVO_REVISOES)
+    # Também saem as pastas mais antigas que ficaram incompletas (download interrompido).
+    mantidas = set(_pastas_concluidas(nome)[-PASTAS_MANTIDAS:])
+    for antiga in _pasta().glob(f"{nome}_*"):
+        if antiga not in mantidas and antiga.name < pasta.name:
+            shutil.rmtree(antiga, ignore_errors=True)
@@ -0,0 +1,59 @@
+"""Leitura da fila do laboratório: o caminho em streaming contra o ``pd.read_excel`` + filtro original."""
+
+import io
+from datetime import datetime
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+import google_drive_loader as gdl
+
+CONFIG = {"nome_aba_xlsx": "BASE"}
+
+
+def _planilha_exemplo(n=300, semente=0):
+    rng = np.random.default_rng(semente)
+    cabecalho = ["Status Ensaio/CP", "ID Ensaio/CP", "Campanha", "Amostra", "Nome Amostra", "Tipo Amostra",
+                 "Ensaio", "Extra", "Início Plan Atual", "Especificação Técnica Ensaio", "Ensaio"]
+    workbook = openpyxl.Workbook()
+    planilha = workbook.active
+    planilha.title = "BASE"
+    planilha.append(cabecalho)
+    for i in range(n):
+        planilha.append([
+            rng.choice(gdl.STATUS_DESEJADOS + ["3) Concluído"]),
+            f"E{i}" if i % 5 else i,
+            rng.choice(["C1", "C2"]),
+            float(rng.integers(0, 50)) + (0.5 if i % 11 == 0 else 0),
+            None if i % 7 == 0 else "Argila",
+            rng.choice(["Indeformada", "Deformada"]),
+            rng.choice(gdl.ENSAIOS_DESEJADOS[:6] + ["Granulometria"]),
+            "#N/A" if i % 13 == 0 else rng.random(),
+            datetime(2025, 1, 1 + i % 28),
+            "" if i % 3 == 0 else "Deformação: 20%",
+            "duplicada",
+        ])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def _caminho_original(conteudo):
+    df = pd.read_excel(io.BytesIO(conteudo), sheet_name=CONFIG["nome_aba_xlsx"], engine="openpyxl")
+    filtrado = df[df["Ensaio"].isin(gdl.ENSAIOS_DESEJADOS) & df["Status Ensaio/CP"].isin(gdl.STATUS_DESEJADOS)]
+    return filtrado[[col for col in gdl.COLUNAS_DESEJADAS if col in filtrado.columns]].reset_index(drop=True)
+
+
+def test_leitura_em_streaming_igual_ao_read_excel():
+    conteudo = _planilha_exemplo()
+    novo = gdl._ler_e_filtrar(io.BytesIO(conteudo), CONFIG)
+    pd.testing.assert_frame_equal(novo, _caminho_original(conteudo))
+
+
+def test_tipos_inferidos_so_das_linhas_guardadas():
+    coluna = gdl._tipar_coluna(pd.Series([3, None, "", "#N/A", 5.0], dtype=object))
+    assert coluna.dtype == np.float64
+    assert coluna.isna().tolist() == [False, True, True, True, False]
+    assert gdl._tipar_coluna(pd.Series([3, 5.0], dtype=object)).dtype == np.int64
+    assert gdl._tipar_coluna(pd.Series(["a", 1], dtype=object)).tolist() == ["a", 1]
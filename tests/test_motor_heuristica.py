@@ -0,0 +1,200 @@
+"""Equivalência do motor de despacho com a regra original da heurística."""
+
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import motor_heuristica
+from param_capacidade import gerar_demanda_simulada
+from parametros_ensaios import CacheParametros, chaves_estaveis, parametrizar_ensaios
+
+RECURSOS_PROC = ['BANCADA_PREP_ATIVA', 'BANCADA_TARUGO', 'BANCADA_MONTAGEM', 'LINHA_SAT_CO2', 'PAINEL_SAT_H2O',
+                 'PAINEL_SAT_CP', 'BANCADA_ADEN_CONVENCIONAL', 'PRENSA_ROMP_ISO', 'PRENSA_ESPECIAL_ANISO_CICLICO',
+                 'BANCADA_DESM', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER']
+CAPACIDADE_APERTADA = {
+    'BANCADA_PREP_ATIVA': 1, 'BANCADA_TARUGO': 1, 'BANCADA_MONTAGEM': 1, 'LINHA_SAT_CO2': 1, 'BANCADA_DESM': 1,
+    'PRENSA_ESPECIAL_ANISO_CICLICO': 1, 'PRENSA_ROMP_ISO': 2, 'BANCADA_ADEN_CONVENCIONAL': 2, 'PAINEL_SAT_H2O': 6,
+    'PAINEL_SAT_CP': 3, 'CELULA_CONVENCIONAL': 6, 'CELULA_CICLICO': 1, 'CELULA_BENDER': 1,
+}
+CAPACIDADE_FOLGADA = dict(CAPACIDADE_APERTADA, BANCADA_PREP_ATIVA=2, CELULA_CONVENCIONAL=12, PAINEL_SAT_H2O=10)
+
+
+def _demanda(num_jobs, semente, prazo_dias=10):
+    df = gerar_demanda_simulada(num_jobs, prazo_dias, semente)
+    df['Job'] = ['J' + str(i) for i in range(len(df))]
+    df['Release Date'] = df['Início Plan Atual'] * 24 + 7
+    return df
+
+
+def _parametros(df):
+    return parametrizar_ensaios(df, df['Job'], df['Release Date'], RECURSOS_PROC)
+
+
+def _regra_original(ensaios, p, r_j, U, etapas_proc, capacidade):
+    """
+    Varredura completa de candidatas da heurística original: a cada despacho,
+    vence a menor chave (início, liberação, tempo total); empates exatos ficam
+    com o ensaio que vem antes em ``ensaios``.
+    """
+    ordem = {job: k for k, job in enumerate(ensaios)}
+    p_total = {job: sum(p.get(job, {}).get(stage, 0) for stage in p[job] if stage != 'Prep_Espera') for job in ensaios}
+    job_stages = {job: [etapa for etapa in etapas_proc if p.get(job, {}).get(etapa, 0) > 0] for job in ensaios}
+    schedule = defaultdict(dict)
+    disponivel = {res: [0] * capacidade.get(res, 1) for res in RECURSOS_PROC}
+    concluidas = {job: set() for job in ensaios}
+    pendentes = [job for job in ensaios if job_stages[job]]
+    espera = defaultdict(float)
+
+    while pendentes:
+        candidatas = []
+        for job in pendentes:
+            proxima = job_stages[job][len(concluidas[job])]
+            pronto = r_j.get(job, 0) if not concluidas[job] else schedule[job][job_stages[job][len(concluidas[job]) - 1]]['end']
+            recursos_prontos, gargalo = 0, None
+            for res in RECURSOS_PROC:
+                if U.get((job, proxima, res), 0) == 1 and min(disponivel[res]) > recursos_prontos:
+                    recursos_prontos, gargalo = min(disponivel[res]), res
+            inicio = max(pronto, recursos_prontos)
+            if inicio - pronto > 1e-5 and gargalo:
+                espera[gargalo] += inicio - pronto
+            candidatas.append((inicio, r_j.get(job, 0), p_total[job], ordem[job], job, proxima))
+
+        inicio, _, _, _, job, etapa = min(candidatas)
+        fim = inicio + p[job][etapa]
+        schedule[job][etapa] = {'start': inicio, 'end': fim}
+        concluidas[job].add(etapa)
+        for res in RECURSOS_PROC:
+            if U.get((job, etapa, res), 0) == 1:
+                instancias = disponivel[res]
+                livres = [i for i, t in enumerate(instancias) if t <= inicio + 1e-5]
+                instancias[livres[0] if livres else instancias.index(min(instancias))] = fim
+        if len(concluidas[job]) == len(job_stages[job]):
+            pendentes.remove(job)
+
+    agenda = pd.DataFrame([(j, e, s['start'], s['end']) for j, etapas in schedule.items() for e, s in etapas.items()],
+                          columns=['Job', 'Etapa', 'Início', 'Fim'])
+    return agenda, espera
+
+
+def _ordenada(agenda):
+    return agenda.sort_values(['Job', 'Etapa']).reset_index(drop=True)
+
+
+def _comparar_agendas(agenda, referencia):
+    agenda, referencia = _ordenada(agenda), _ordenada(referencia)
+    assert agenda[['Job', 'Etapa']].equals(referencia[['Job', 'Etapa']])
+    np.testing.assert_allclose(agenda[['Início', 'Fim']].to_numpy(), referencia[['Início', 'Fim']].to_numpy(), rtol=0, atol=1e-9)
+
+
+def _comparar_esperas(espera, referencia):
+    assert set(espera) == set(referencia)
+    for recurso, valor in referencia.items():
+        assert espera[recurso] == pytest.approx(valor, rel=1e-9)
+
+
+@pytest.mark.parametrize("semente", [0, 1, 2])
+@pytest.mark.parametrize("capacidade", [CAPACIDADE_APERTADA, CAPACIDADE_FOLGADA], ids=['apertada', 'folgada'])
+def test_motor_igual_a_regra_original(semente, capacidade):
+    ensaios, p, r_j, U, incidencia = _parametros(_demanda(40, semente))
+    referencia, espera_referencia = _regra_original(ensaios, p, r_j, U, incidencia.etapas_proc, capacidade)
+
+    motor = motor_heuristica.MotorDespacho(ensaios, p, r_j, incidencia, capacidade)
+    motor.despachar()
+    _comparar_agendas(motor.agenda_df(), referencia)
+    _comparar_esperas(motor.espera_por_recurso(), espera_referencia)
+    assert motor.makespan() == pytest.approx(referencia['Fim'].max())
+
+    # Sem contabilizar as esperas (candidatas agrupadas por recursos), a agenda é a mesma.
+    agrupado = motor_heuristica.MotorDespacho(ensaios, p, r_j, incidencia, capacidade, contabilizar_esperas=False)
+    agrupado.despachar()
+    _comparar_agendas(agrupado.agenda_df(), referencia)
+    assert not agrupado.espera_por_recurso()
+
+
+@pytest.mark.parametrize("contabilizar_esperas", [True, False])
+def test_copiar_e_ampliar_igual_a_simular_do_inicio(contabilizar_esperas):
+    ensaios, p, r_j, _, incidencia = _parametros(_demanda(60, 3))
+    completo = motor_heuristica.MotorDespacho(ensaios, p, r_j, incidencia, CAPACIDADE_FOLGADA, contabilizar_esperas=contabilizar_esperas)
+    completo.despachar()
+
+    motor = motor_heuristica.MotorDespacho(ensaios, p, r_j, incidencia, CAPACIDADE_APERTADA, contabilizar_esperas=contabilizar_esperas)
+    inicial = motor.copiar()
+    motor.despachar()
+    makespan_apertado = motor.makespan()
+
+    # Ampliada antes do primeiro despacho, a cópia simula a configuração folgada;
+    # o motor original não é afetado.
+    inicial.ampliar(CAPACIDADE_FOLGADA)
+    inicial.despachar()
+    _comparar_agendas(inicial.agenda_df(), completo.agenda_df())
+    _comparar_esperas(inicial.espera_por_recurso(), completo.espera_por_recurso())
+    assert motor.makespan() == makespan_apertado
+
+
+def test_motor_com_lotes_e_pontos_de_controle_igual_a_regra_original():
+    # Muitos ensaios liberados no mesmo dia: os idênticos formam lotes.
+    ensaios, p, r_j, U, incidencia = _parametros(_demanda(100, 6, prazo_dias=1))
+    referencia, espera_referencia = _regra_original(ensaios, p, r_j, U, incidencia.etapas_proc, CAPACIDADE_APERTADA)
+
+    motor = motor_heuristica.MotorDespacho(ensaios, p, r_j, incidencia, CAPACIDADE_APERTADA)
+    assert max(len(membros) for membros in motor.membros_candidata if membros) > 1
+    motor.despachar(intervalo_controle=100)
+    assert len(motor.pontos_controle) > 2
+    _comparar_agendas(motor.agenda_df(), referencia)
+    _comparar_esperas(motor.espera_por_recurso(), espera_referencia)
+
+    # Retomado de um ponto de controle no meio do despacho, o resultado é o mesmo.
+    _, ponto = motor.pontos_controle[len(motor.pontos_controle) // 2]
+    retomado = ponto.copiar()
+    retomado.despachar()
+    _comparar_agendas(retomado.agenda_df(), referencia)
+    _comparar_esperas(retomado.espera_por_recurso(), espera_referencia)
+
+
+@pytest.mark.parametrize("num_jobs, prazo_dias", [(80, 10), (250, 2)], ids=['espalhada', 'com_lotes'])
+def test_simulador_incremental_retomado_igual_a_simular_do_inicio(num_jobs, prazo_dias):
+    ensaios, p, r_j, _, incidencia = _parametros(_demanda(num_jobs, 4, prazo_dias))
+    simulador = motor_heuristica.SimuladorIncremental(ensaios, p, r_j, incidencia)
+    simulador.simular(CAPACIDADE_APERTADA)
+
+    configuracoes = [
+        dict(CAPACIDADE_APERTADA, CELULA_BENDER=2),
+        dict(CAPACIDADE_APERTADA, CELULA_BENDER=2, BANCADA_PREP_ATIVA=2),
+        CAPACIDADE_FOLGADA,
+    ]
+    for capacidade in configuracoes:
+        motor = simulador.simular(capacidade)
+        makespan, agenda, espera = motor_heuristica.executar_heuristica(ensaios, p, r_j, incidencia, capacidade)
+        _comparar_agendas(motor.agenda_df(), agenda)
+        _comparar_esperas(motor.espera_por_recurso(), espera)
+        assert motor.makespan() == makespan
+    assert simulador.retomadas > 0
+    assert simulador.operacoes_reaproveitadas > 0
+
+
+def test_cache_parametros_ida_e_volta(tmp_path):
+    df = _demanda(50, 5)
+    chaves = chaves_estaveis(df['ID Ensaio/CP'])
+    ensaios, p, r_j, _, incidencia = _parametros(df)
+    arquivo = tmp_path / "cache" / "parametros.parquet"
+
+    gravado = CacheParametros(arquivo=str(arquivo)).parametrizar(df, chaves, df['Job'], df['Release Date'], RECURSOS_PROC)
+    assert arquivo.exists()
+
+    cache = CacheParametros(arquivo=str(arquivo))
+    lido = cache.parametrizar(df, chaves, df['Job'], df['Release Date'], RECURSOS_PROC)
+    assert (cache.acertos, cache.faltas) == (len(df), 0)
+    for resultado in (gravado, lido):
+        assert resultado[0] == ensaios
+        assert resultado[1] == p
+        assert resultado[2] == r_j
+        assert resultado[4].tipo_job == incidencia.tipo_job
+
+    # Uma linha alterada é parametrizada de novo; as demais vêm do arquivo.
+    df.loc[0, 'Ensaio'] = 'BE' if df.loc[0, 'Ensaio'] != 'BE' else 'CIUsat'
+    cache = CacheParametros(arquivo=str(arquivo))
+    alterado = cache.parametrizar(df, chaves, df['Job'], df['Release Date'], RECURSOS_PROC)
+    assert (cache.acertos, cache.faltas) == (len(df) - 1, 1)
+    assert alterado[1] == _parametros(df)[1]
@@ -0,0 +1,75 @@
+"""Limite inferior analítico e estratégias de dimensionamento de ``param_capacidade``."""
+
+import pytest
+
+import motor_heuristica
+import param_capacidade
+from param_capacidade import calcular_carga_recursos, gerar_demanda_simulada, limite_inferior_makespan
+from parametros_ensaios import parametrizar_ensaios
+
+RECURSOS_PROC = ['BANCADA_PREP_ATIVA', 'BANCADA_TARUGO', 'BANCADA_MONTAGEM', 'LINHA_SAT_CO2', 'PAINEL_SAT_H2O',
+                 'PAINEL_SAT_CP', 'BANCADA_ADEN_CONVENCIONAL', 'PRENSA_ROMP_ISO', 'PRENSA_ESPECIAL_ANISO_CICLICO',
+                 'BANCADA_DESM', 'CELULA_CONVENCIONAL', 'CELULA_CICLICO', 'CELULA_BENDER']
+# A mesma configuração inicial de ``calcular_parametros_completos``.
+CAPACIDADE_INICIAL = {
+    'BANCADA_PREP_ATIVA': 1, 'BANCADA_TARUGO': 3, 'BANCADA_MONTAGEM': 3, 'LINHA_SAT_CO2': 1, 'BANCADA_DESM': 1,
+    'PRENSA_ESPECIAL_ANISO_CICLICO': 1, 'PRENSA_ROMP_ISO': 8, 'BANCADA_ADEN_CONVENCIONAL': 6, 'PAINEL_SAT_H2O': 60,
+    'PAINEL_SAT_CP': 12, 'CELULA_CONVENCIONAL': 55, 'CELULA_CICLICO': 2, 'CELULA_BENDER': 2,
+}
+CAPACIDADE_APERTADA = dict(CAPACIDADE_INICIAL, BANCADA_TARUGO=1, BANCADA_MONTAGEM=1, PRENSA_ROMP_ISO=2,
+                           BANCADA_ADEN_CONVENCIONAL=2, PAINEL_SAT_H2O=6, PAINEL_SAT_CP=3, CELULA_CONVENCIONAL=6,
+                           CELULA_CICLICO=1, CELULA_BENDER=1)
+
+
+def _parametros(num_jobs, prazo_dias, semente):
+    df = gerar_demanda_simulada(num_jobs, prazo_dias, semente)
+    df['Job'] = ['J' + str(i) for i in range(len(df))]
+    df['Release Date'] = df['Início Plan Atual'] * 24 + 7
+    return parametrizar_ensaios(df, df['Job'], df['Release Date'], RECURSOS_PROC)
+
+
+@pytest.mark.parametrize("semente", [0, 1, 2])
+@pytest.mark.parametrize("capacidade", [CAPACIDADE_INICIAL, CAPACIDADE_APERTADA], ids=['inicial', 'apertada'])
+def test_limite_inferior_nao_passa_do_makespan_simulado(semente, capacidade):
+    ensaios, p, r_j, _, incidencia = _parametros(150, 5, semente)
+    carga = calcular_carga_recursos(ensaios, p, r_j, incidencia)
+    limite, por_recurso = limite_inferior_makespan(carga, [capacidade[r] for r in incidencia.recursos_proc])
+
+    makespan, _, _ = motor_heuristica.executar_analise_gargalo(ensaios, p, r_j, incidencia, capacidade)
+    assert 0 < limite <= makespan + 1e-9
+    assert por_recurso.max() <= limite
+
+
+def test_meta_inalcancavel_para_na_configuracao_inicial():
+    # Liberações espalhadas por 10 dias com meta de 2: nem com os recursos
+    # livres ilimitados o limite inferior atende.
+    df = gerar_demanda_simulada(200, 10, 4)
+    melhor, makespan, _, makespan_inicial, _, historico = param_capacidade.calcular_parametros_completos(
+        df, 2, 0.05, 10, [], estrategia='bissecao')
+
+    assert len(historico) == 1
+    assert melhor == CAPACIDADE_INICIAL
+    assert makespan == makespan_inicial > 2 * 24 * 1.05
+
+    # A estratégia incremental só avisa e segue reduzindo o makespan.
+    _, _, _, _, _, historico = param_capacidade.calcular_parametros_completos(
+        gerar_demanda_simulada(200, 10, 4), 2, 0.05, 3, [], estrategia='incremental')
+    assert len(historico) == 3
+
+
+@pytest.mark.parametrize("estrategia", ['incremental', 'bissecao'])
+def test_estrategias_atendem_a_meta(estrategia):
+    prazo_dias, tolerancia = 10, 0.5
+    prazo_aceitavel = prazo_dias * 24 * (1 + tolerancia)
+    df = gerar_demanda_simulada(600, prazo_dias, 3)
+    melhor, makespan, _, makespan_inicial, _, historico = param_capacidade.calcular_parametros_completos(
+        df, prazo_dias, tolerancia, 15, [], estrategia=estrategia)
+
+    # A configuração inicial não atende; a devolvida atende, e a simulação
+    # dela do início dá o mesmo makespan.
+    assert makespan_inicial > prazo_aceitavel
+    assert len(historico) > 2
+    assert makespan <= prazo_aceitavel
+    ensaios, p, r_j, _, incidencia = parametrizar_ensaios(df, df['Job'], df['Release Date'], RECURSOS_PROC)
+    assert motor_heuristica.executar_analise_gargalo(ensaios, p, r_j, incidencia, melhor)[0] == pytest.approx(makespan)
+    assert all(melhor[r] >= quantidade for r, quantidade in CAPACIDADE_INICIAL.items())